@@ -4,12 +4,12 @@ from __future__ import annotations
 import os
 import json
 import time
-from typing import Iterable, List, Dict, Any, Optional
+import asyncio
+from typing import Iterable, List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from pathlib import Path
 
-import requests
 import sys
 from pathlib import Path
 # Project root = 1 cấp trên file hiện tại
@@ -18,87 +18,439 @@ sys.path.append(str(ROOT))
 import env_utils
 import pandas as pd
 import gcp_io
+import quota
+import metrics
+import youtube_client
+import refresh_scheduler
+import seen_index
 
 
 
-SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
 TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+QUOTA_STAGE = "search"          # search.list và playlistItems.list cùng là phần quota "discovery"
+UPLOADS_KEYWORD = "uploads"     # searchKeyword của các record lấy từ uploads playlist
+DISCOVERY_MODES = ("search", "uploads", "both")
 
 
 
+def _to_snippet_lite(item: Dict[str, Any], keyword: str, crawl_date: str) -> Optional[Dict[str, Any]]:
+    """Chuyển 1 item của search.list → dict “snippet-lite” (None nếu không có videoId)."""
+    id_ = item.get("id", {})
+    snippet = item.get("snippet", {})
+    vid = id_.get("videoId")
+    if not vid:
+        return None
+    return {
+        "videoId": vid,
+        "title": snippet.get("title"),
+        "description": snippet.get("description"),
+        "channelId": snippet.get("channelId"),
+        "channelTitle": snippet.get("channelTitle"),
+        "publishedAt": snippet.get("publishedAt"),
+        "searchKeyword": keyword,
+        "crawlDate": crawl_date,
+    }
+
+
+def _spend_search_page(budget: Optional[quota.QuotaBudget], keyword: str, pages_done: int, page_caps: Dict[str, int]) -> bool:
+    """Trừ quota cho 1 trang search; False nếu keyword/stage đã hết phần quota → dừng phân trang."""
+    if budget is None:
+        return True
+    if pages_done >= page_caps.get(keyword, 0) or not budget.can_afford(QUOTA_STAGE, "search.list"):
+        print(f"⚠️ Hết quota cho keyword '{keyword}' sau {pages_done} trang, dừng phân trang.")
+        return False
+    budget.charge(QUOTA_STAGE, "search.list")
+    return True
+
+
+def _page_rows(
+    items: List[Dict[str, Any]],
+    keyword: str,
+    crawl_date: str,
+    seen: Optional[seen_index.SeenIndex] = None,
+    min_new_fraction: float = 0.0,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    1 trang search.list → (các row snippet-lite chưa thấy, có nên dừng phân trang keyword không).
+    Có seen: bỏ video đã thấy (lần chạy trước / keyword khác), thêm video mới vào index;
+    tỉ lệ video mới của trang < min_new_fraction → dừng (các trang sau gần như chắc chắn cũ hơn).
+    """
+    rows = [r for r in (_to_snippet_lite(item, keyword, crawl_date) for item in items) if r is not None]
+    if seen is None or not rows:
+        return rows, False
+    new_ids = set(seen.filter_new(r["videoId"] for r in rows))
+    seen.add(new_ids)
+    fresh = []
+    for r in rows:
+        if r["videoId"] in new_ids:
+            new_ids.discard(r["videoId"])
+            fresh.append(r)
+    stop = len(fresh) / len(rows) < min_new_fraction
+    if stop:
+        print(f"⏹️ '{keyword}': {len(fresh)}/{len(rows)} video mới trên trang, dừng phân trang.")
+    return fresh, stop
+
+
 def crawl_youtube_videos(
     api_key: str,
     keywords: Iterable[str],
     max_results: int = 300,
     request_pause: float = 0.1,
+    budget: Optional[quota.QuotaBudget] = None,
+    seen: Optional[seen_index.SeenIndex] = None,
+    min_new_fraction: float = 0.0,
 ) -> List[Dict[str, Any]]:
     """
     Crawl video theo nhiều từ khóa, tối đa max_results mỗi keyword.
+    Nếu có budget: quota stage 'search' được chia đều cho các keyword (số trang tối đa mỗi keyword).
+    Nếu có seen: chỉ trả về video chưa thấy, dừng keyword khi tỉ lệ video mới < min_new_fraction.
     Trả về list dict “snippet-lite”.
     """
     results: List[Dict[str, Any]] = []
     today = datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
+    keywords = list(keywords)
+    page_caps = budget.split_pages(QUOTA_STAGE, "search.list", keywords) if budget else {}
+    client = youtube_client.YouTubeClient(api_key, pool_size=1)
 
     for keyword in keywords:
         print(f"🔍 Crawling keyword: {keyword}")
         next_page_token: Optional[str] = None
         total_collected = 0
+        pages_done = 0
 
         while total_collected < max_results:
+            if not _spend_search_page(budget, keyword, pages_done, page_caps):
+                break
+            pages_done += 1
             page_size = min(50, max_results - total_collected)
-            params = {
-                "part": "snippet",
-                "q": keyword,
-                "type": "video",
-                "order": "relevance",
-                "maxResults": page_size,
-                "key": api_key,
-            }
-            if next_page_token:
-                params["pageToken"] = next_page_token
-
-            resp = requests.get(SEARCH_URL, params=params, timeout=30)
-            if resp.status_code != 200:
-                print(f"❌ Error {resp.status_code}: {resp.text[:300]}")
+            resp = client.search(keyword, page_size, next_page_token)
+            if not resp.ok:
+                print(f"❌ Error {resp.status}: {resp.text[:300]}")
+                if budget is not None and quota.is_quota_error(resp.status, resp.text):
+                    budget.mark_exhausted()
                 break
 
-            data = resp.json()
-            items = data.get("items", [])
+            items = resp.items
             if not items:
                 break
 
-            for item in items:
-                id_ = item.get("id", {})
-                snippet = item.get("snippet", {})
-                vid = id_.get("videoId")
-                if not vid:
-                    continue
-
-                results.append(
-                    {
-                        "videoId": vid,
-                        "title": snippet.get("title"),
-                        "description": snippet.get("description"),
-                        "channelId": snippet.get("channelId"),
-                        "channelTitle": snippet.get("channelTitle"),
-                        "publishedAt": snippet.get("publishedAt"),
-                        "searchKeyword": keyword,
-                        "crawlDate": today,
-                    }
-                )
+            rows, stop = _page_rows(items, keyword, today, seen, min_new_fraction)
+            for row in rows:
+                results.append(row)
                 total_collected += 1
                 if total_collected >= max_results:
                     break
 
-            next_page_token = data.get("nextPageToken")
-            if not next_page_token:
+            next_page_token = resp.next_page_token
+            if stop or not next_page_token:
                 break
 
             time.sleep(request_pause)  # hạn chế rate limit
 
+    client.close()
+    return results
+
+
+# ----------------------------
+# ASYNC MODE
+# ----------------------------
+class AsyncRateLimiter:
+    """
+    Rate limit toàn cục (request/giây) dùng chung cho mọi coroutine,
+    thay cho time.sleep(request_pause) sau mỗi trang.
+    """
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+async def _crawl_keyword_async(
+    client: youtube_client.YouTubeClient,
+    limiter: AsyncRateLimiter,
+    semaphore: asyncio.Semaphore,
+    keyword: str,
+    max_results: int,
+    crawl_date: str,
+    budget: Optional[quota.QuotaBudget] = None,
+    page_caps: Optional[Dict[str, int]] = None,
+    seen: Optional[seen_index.SeenIndex] = None,
+    min_new_fraction: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """Crawl 1 keyword; các trang trong cùng keyword vẫn tuần tự (cần nextPageToken)."""
+    print(f"🔍 Crawling keyword: {keyword}")
+    results: List[Dict[str, Any]] = []
+    next_page_token: Optional[str] = None
+    pages_done = 0
+
+    while len(results) < max_results:
+        if not _spend_search_page(budget, keyword, pages_done, page_caps or {}):
+            break
+        pages_done += 1
+        page_size = min(50, max_results - len(results))
+
+        await limiter.acquire()
+        async with semaphore:
+            resp = await asyncio.to_thread(client.search, keyword, page_size, next_page_token)
+        if not resp.ok:
+            print(f"❌ Error {resp.status} ({keyword}): {resp.text[:300]}")
+            if budget is not None and quota.is_quota_error(resp.status, resp.text):
+                budget.mark_exhausted()
+            break
+
+        items = resp.items
+        if not items:
+            break
+
+        rows, stop = _page_rows(items, keyword, crawl_date, seen, min_new_fraction)
+        for row in rows:
+            results.append(row)
+            if len(results) >= max_results:
+                break
+
+        next_page_token = resp.next_page_token
+        if stop or not next_page_token:
+            break
+
+    return results
+
+
+async def crawl_youtube_videos_async(
+    api_key: str,
+    keywords: Iterable[str],
+    max_results: int = 300,
+    max_concurrency: int = 8,
+    requests_per_second: float = 10.0,
+    budget: Optional[quota.QuotaBudget] = None,
+    seen: Optional[seen_index.SeenIndex] = None,
+    min_new_fraction: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """
+    Bản async của crawl_youtube_videos: các keyword chạy song song trên 1 connection pool,
+    tối đa max_concurrency request đồng thời và requests_per_second request/giây (toàn cục).
+    Kết quả giống bản tuần tự (cùng thứ tự keyword); có seen thì video trùng giữa các keyword
+    chỉ thuộc về keyword nhận trang chứa nó trước.
+    """
+    today = datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
+    keywords = list(keywords)
+    page_caps = budget.split_pages(QUOTA_STAGE, "search.list", keywords) if budget else {}
+    limiter = AsyncRateLimiter(requests_per_second)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    with youtube_client.YouTubeClient(api_key, pool_size=max_concurrency) as client:
+        per_keyword = await asyncio.gather(
+            *[
+                _crawl_keyword_async(
+                    client, limiter, semaphore, kw, max_results, today, budget, page_caps, seen, min_new_fraction
+                )
+                for kw in keywords
+            ]
+        )
+
+    return [row for rows in per_keyword for row in rows]
+
+
+
+# ----------------------------
+# UPLOADS PLAYLIST MODE
+# ----------------------------
+# playlistItems.list trên uploads playlist (UU...) của channel đã theo dõi: 1 unit / trang 50 video
+# (search.list: 100 unit / trang). Playlist trả video mới nhất trước → dừng ở video đầu tiên đã biết,
+# chỉ lấy video upload mới kể từ lần chạy trước.
+def _playlist_item_to_snippet_lite(item: Dict[str, Any], crawl_date: str) -> Optional[Dict[str, Any]]:
+    """1 item của playlistItems.list → dict “snippet-lite” như _to_snippet_lite (None nếu không có videoId)."""
+    snippet = item.get("snippet", {})
+    details = item.get("contentDetails", {})
+    vid = details.get("videoId") or snippet.get("resourceId", {}).get("videoId")
+    if not vid:
+        return None
+    return {
+        "videoId": vid,
+        "title": snippet.get("title"),
+        "description": snippet.get("description"),
+        "channelId": snippet.get("videoOwnerChannelId") or snippet.get("channelId"),
+        "channelTitle": snippet.get("videoOwnerChannelTitle") or snippet.get("channelTitle"),
+        # snippet.publishedAt của playlistItem = lúc thêm vào playlist; ưu tiên ngày publish của video
+        "publishedAt": details.get("videoPublishedAt") or snippet.get("publishedAt"),
+        "searchKeyword": UPLOADS_KEYWORD,
+        "crawlDate": crawl_date,
+    }
+
+
+async def _crawl_playlist_async(
+    client: youtube_client.YouTubeClient,
+    limiter: AsyncRateLimiter,
+    semaphore: asyncio.Semaphore,
+    playlist_id: str,
+    known_ids: set | seen_index.SeenIndex,
+    max_pages: int,
+    crawl_date: str,
+    budget: Optional[quota.QuotaBudget] = None,
+) -> List[Dict[str, Any]]:
+    """Đi uploads playlist từ mới → cũ, dừng ở video đã biết / hết max_pages / hết quota."""
+    results: List[Dict[str, Any]] = []
+    next_page_token: Optional[str] = None
+
+    for _ in range(max_pages):
+        if budget is not None:
+            if not budget.can_afford(QUOTA_STAGE, "playlistItems.list"):
+                return results
+            budget.charge(QUOTA_STAGE, "playlistItems.list")
+
+        await limiter.acquire()
+        async with semaphore:
+            resp = await asyncio.to_thread(client.playlist_items, playlist_id, next_page_token)
+        if not resp.ok:
+            # 404: playlist bị xoá / private → bỏ qua channel này
+            print(f"❌ Error {resp.status} ({playlist_id}): {resp.text[:300]}")
+            if budget is not None and quota.is_quota_error(resp.status, resp.text):
+                budget.mark_exhausted()
+            break
+
+        reached_known = False
+        for item in resp.items:
+            row = _playlist_item_to_snippet_lite(item, crawl_date)
+            if row is None:
+                continue
+            if row["videoId"] in known_ids:
+                reached_known = True
+                break
+            known_ids.add(row["videoId"])
+            results.append(row)
+
+        next_page_token = resp.next_page_token
+        if reached_known or not next_page_token:
+            break
+
+    return results
+
+
+async def crawl_uploads_async(
+    api_key: str,
+    playlist_ids: Iterable[str],
+    known_ids: Iterable[str] | seen_index.SeenIndex = (),
+    max_pages: int = 1,
+    max_concurrency: int = 8,
+    requests_per_second: float = 10.0,
+    budget: Optional[quota.QuotaBudget] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Lấy video mới từ uploads playlist của các channel: mỗi playlist tối đa max_pages trang,
+    dừng ở video đầu tiên có trong known_ids (SeenIndex thì video mới được thêm thẳng vào index).
+    Các playlist chạy song song (cùng rate limit như search).
+    Trả về list snippet-lite (searchKeyword = UPLOADS_KEYWORD).
+    """
+    today = datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
+    playlist_ids = list(dict.fromkeys(p for p in playlist_ids if p))
+    known = known_ids if isinstance(known_ids, seen_index.SeenIndex) else set(known_ids)
+    limiter = AsyncRateLimiter(requests_per_second)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    print(f"📺 Uploads: {len(playlist_ids)} playlist, {len(known)} video đã biết")
+
+    with youtube_client.YouTubeClient(api_key, pool_size=max_concurrency) as client:
+        per_playlist = await asyncio.gather(
+            *[
+                _crawl_playlist_async(client, limiter, semaphore, pid, known, max_pages, today, budget)
+                for pid in playlist_ids
+            ]
+        )
+
+    return [row for rows in per_playlist for row in rows]
+
+
+def get_uploads_playlists(cfg: env_utils.EnvConfig) -> List[str]:
+    """uploadsPlaylistId của các channel trong bảng channel clean (chỉ đọc 1 cột)."""
+    if not gcp_io.table_columns(cfg.project_id, cfg.clean_dataset, cfg.channel_info_table):
+        return []
+    rows = gcp_io.execute_sql(
+        project_id=cfg.project_id,
+        query=(
+            f"SELECT DISTINCT uploadsPlaylistId "
+            f"FROM `{cfg.project_id}.{cfg.clean_dataset}.{cfg.channel_info_table}` "
+            f"WHERE uploadsPlaylistId IS NOT NULL"
+        ),
+    )
+    return [r["uploadsPlaylistId"] for r in rows]
+
+
+def run_uploads(
+    cfg: env_utils.EnvConfig,
+    budget: Optional[quota.QuotaBudget] = None,
+    seen: Optional[seen_index.SeenIndex] = None,
+) -> List[Dict[str, Any]]:
+    """Discovery qua uploads playlist; video đã biết = seen index (không có → các video trong refresh state)."""
+    playlists = get_uploads_playlists(cfg)
+    known_ids = seen if seen is not None else refresh_scheduler.load_scheduler(cfg).videos.keys()
+    return asyncio.run(
+        crawl_uploads_async(cfg.api, playlists, known_ids, max_pages=cfg.uploads_max_pages, budget=budget)
+    )
+
+
+
+KEYWORDS = [
+    "AI tool", "Artificial Intelligence", "AI agent",
+    "Generative AI", "AI Automation", "AI for", "Learn AI",
+    "AI Algorithms", "AI in Business",
+    "Prompt Engineering", "AI for Data Science", "AI for Project Management",
+    "AI in Education", "AI Career", "AI Productivity", "xAI",
+    "AI and Big Data", "AI for Developers", "ChatGPT", "Cursor AI", "Claude AI",
+    "Google Gemini", "No/low code AI", "AI tutorial", "Machine Learning AI",
+    "Deep Learning AI", "AI coding", "Chatbox AI", "How to AI",
+    "Latest AI", "AI application", "AI robot", "AI trends",
+]
+
+
+def run_search(cfg: env_utils.EnvConfig, keywords: Iterable[str] = KEYWORDS, use_async: bool = True) -> List[Dict[str, Any]]:
+    """
+    Stage search: discovery theo cfg.discovery_mode trong giới hạn quota; trả về list snippet-lite.
+    "both": uploads playlist trước (rẻ), phần quota còn lại cho search theo keywords.
+    Chỉ trả về video chưa có trong seen index (qua mọi lần chạy) → stage details chỉ nhận ID mới.
+    Index chỉ được cập nhật trong bộ nhớ (dedup giữa các keyword); stage details mới lưu ID xuống đĩa
+    sau khi đã crawl chi tiết → video lỗi / chưa kịp crawl vẫn được discovery tìm lại lần sau.
+    """
+    mode = cfg.discovery_mode
+    if mode not in DISCOVERY_MODES:
+        raise ValueError(f"❌ Unknown DISCOVERY_MODE: {mode}")
+    budget = quota.load_budget(cfg)
+    seen = seen_index.load_seen_index(cfg)
+    # video đang theo dõi trong refresh state cũng là video đã biết
+    seen.add(refresh_scheduler.load_scheduler(cfg).videos)
+    results: List[Dict[str, Any]] = []
+    if mode in ("uploads", "both"):
+        results += run_uploads(cfg, budget, seen)
+    if mode in ("search", "both"):
+        opts = dict(max_results=1, budget=budget, seen=seen, min_new_fraction=cfg.search_min_new_fraction)
+        if use_async:
+            results += asyncio.run(crawl_youtube_videos_async(cfg.api, keywords, **opts))
+        else:
+            results += crawl_youtube_videos(cfg.api, keywords, **opts)
+    budget.save()
+    print(budget.summary())
+    print(seen.summary())
+    metrics.add_rows(rows_out=len(results))
     return results
 
 
+def upload_search_results(cfg: env_utils.EnvConfig, results: Iterable[Dict[str, Any]], ts: str) -> str:
+    return gcp_io.upload_ndjson_to_gcs(
+        bucket=cfg.bucket_name,
+        project_id=cfg.project_id,
+        path=f"{cfg.search_result_raw}ai_videos_snippets{ts}{gcp_io.NDJSON_GZ_SUFFIX}",
+        records=results,
+        manifest_prefix=cfg.search_result_raw,
+    )
+
 
 def main() -> None:
     # 1) Load env & biến cấu hình
@@ -106,26 +458,12 @@ def main() -> None:
     ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
 
     # 2) Từ khóa & crawl
-    keywords = [
-        "AI tool", "Artificial Intelligence", "AI agent",
-        "Generative AI", "AI Automation", "AI for", "Learn AI",
-        "AI Algorithms", "AI in Business",
-        "Prompt Engineering", "AI for Data Science", "AI for Project Management",
-        "AI in Education", "AI Career", "AI Productivity", "xAI",
-        "AI and Big Data", "AI for Developers", "ChatGPT", "Cursor AI", "Claude AI",
-        "Google Gemini", "No/low code AI", "AI tutorial", "Machine Learning AI",
-        "Deep Learning AI", "AI coding", "Chatbox AI", "How to AI",
-        "Latest AI", "AI application", "AI robot", "AI trends",
-    ]
-
-    results = crawl_youtube_videos(cfg.api, keywords, max_results=1)
-
-    gcp_io.upload_json_to_gcs(
-        bucket=cfg.bucket_name,
-        project_id=cfg.project_id,
-        path=f"{cfg.search_result_raw}ai_videos_snippets{ts}.json",
-        data=results
-    )
+    with metrics.stage("search"):
+        results = run_search(cfg)
+
+        upload_search_results(cfg, results, ts)
+    print(metrics.summary())
+    metrics.save_report(cfg)
 
 if __name__ == "__main__":
     main()
@@ -3,12 +3,10 @@ from __future__ import annotations
 
 import os
 import json
-import time
 from pathlib import Path
-from typing import Any, List, Dict, Optional
+from typing import Any, List, Dict, Iterable, Iterator, Optional
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
-import requests
 import sys
 from pathlib import Path
 # Project root = 1 cấp trên file hiện tại
@@ -17,9 +15,16 @@ sys.path.append(str(ROOT))
 import env_utils
 import pandas as pd
 import gcp_io
-
-SEARCH_URL_VIDEOS = "https://www.googleapis.com/youtube/v3/videos"
+import quota
+import api_cache
+import refresh_scheduler
+import seen_index
+import metrics
+import youtube_client
+
+VIDEO_PART = "snippet,statistics,contentDetails"
 TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+QUOTA_STAGE = "video_details"
 
 def clean_search_df(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -34,72 +39,114 @@ def clean_search_df(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def get_video_details(
+def iter_video_details(
     df: pd.DataFrame,
     start: int,
     end: int,
     api_key: str,
     request_pause: float = 0.1,
-) -> List[Dict[str, Any]]:
+    budget: Optional[quota.QuotaBudget] = None,
+    cache: Optional[api_cache.ResponseCache] = None,
+    client: Optional[youtube_client.YouTubeClient] = None,
+) -> Iterator[Dict[str, Any]]:
     """
     Crawl chi tiết video (snippet, statistics, contentDetails) theo df['videoId'][start:end].
-    Trả về list các item JSON từ YouTube Data API.
+    Nếu có budget: dừng khi stage 'video_details' hết quota.
+    Nếu có cache: gửi If-None-Match theo etag đã lưu, batch không đổi (304) lấy từ cache.
+    Yield từng item JSON từ YouTube Data API ngay khi mỗi batch về (để ghi stream).
     """
     if "videoId" not in df.columns:
         raise ValueError("DataFrame cần có cột 'videoId'.")
-    if not api_key:
-        raise RuntimeError("Thiếu API_KEY_1.")
 
     video_ids = df["videoId"].iloc[start:end].dropna().astype(str).tolist()
     if not video_ids:
-        return []
-
-    all_results: List[Dict[str, Any]] = []
-    session = requests.Session()
-
-    for i in range(0, len(video_ids), 50):  # tối đa 50 ID mỗi request
-        batch_ids = video_ids[i : i + 50]
-        params = {
-            "part": "snippet,statistics,contentDetails",
-            "id": ",".join(batch_ids),
-            "key": api_key,
-        }
-        resp = session.get(SEARCH_URL_VIDEOS, params=params, timeout=30)
-        if resp.status_code == 200:
-            payload = resp.json()
-            all_results.extend(payload.get("items", []))
-        else:
-            print(f"❌ Lỗi batch {i}-{i+50}: {resp.status_code}")
-            print(resp.text[:500])
-        time.sleep(request_pause)
-
-    return all_results
+        return
 
-def main() -> None:
-    cfg = env_utils.load_env()
-    ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+    own_client = client is None
+    client = client or youtube_client.YouTubeClient(api_key)
+    try:
+        yield from client.list_by_ids(
+            "videos", video_ids, VIDEO_PART,
+            budget=budget, quota_stage=QUOTA_STAGE, cache=cache, request_pause=request_pause,
+        )
+    finally:
+        if own_client:
+            client.close()
 
 
-    # 1) Đọc file search-result hôm nay → df
-    df = gcp_io.read_latest_json_from_gcs(
+def get_video_details(
+    df: pd.DataFrame,
+    start: int,
+    end: int,
+    api_key: str,
+    request_pause: float = 0.1,
+    budget: Optional[quota.QuotaBudget] = None,
+    cache: Optional[api_cache.ResponseCache] = None,
+) -> List[Dict[str, Any]]:
+    """Như iter_video_details nhưng trả về list các item JSON."""
+    return list(iter_video_details(df, start, end, api_key, request_pause, budget, cache))
+
+
+def iter_due_video_details(cfg: env_utils.EnvConfig, df_search: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+    """
+    Stage details: bỏ trùng search dump, chọn video đến hạn refresh (video mới + video đang theo dõi)
+    theo ưu tiên, crawl trong giới hạn quota (có cache etag). Yield từng item; lưu state khi xong.
+    Video đã crawl được chi tiết mới được ghi vào seen index (search sẽ bỏ qua ở các lần sau).
+    """
+    # Làm sạch (bỏ trùng videoId)
+    df = clean_search_df(df_search)
+
+    scheduler = refresh_scheduler.load_scheduler(cfg)
+    seen = seen_index.load_seen_index(cfg)
+    due_ids = scheduler.due_ids(df["videoId"].dropna().astype(str), max_calls=cfg.refresh_max_calls)
+    print(f"🗓️ {len(due_ids)} video đến hạn refresh (search dump: {len(df)})")
+    df_due = pd.DataFrame({"videoId": due_ids})
+    metrics.add_rows(rows_in=len(df_due))
+
+    budget = quota.load_budget(cfg)
+    with api_cache.load_cache(cfg) as cache:
+        for item in iter_video_details(df_due, start=0, end=len(df_due), api_key=cfg.api, budget=budget, cache=cache):
+            scheduler.record([item])
+            seen.add([item.get("id")])
+            metrics.add_rows(rows_out=1)
+            yield item
+        print(f"🗃️ Cache: {cache.hits} hit (304), {cache.misses} miss")
+    budget.save()
+    print(budget.summary())
+
+    scheduler.save()
+    print(scheduler.summary())
+    print(seen.summary())
+    seen.save()
+
+
+def upload_video_details(cfg: env_utils.EnvConfig, items: Iterable[Dict[str, Any]], ts: str) -> str:
+    return gcp_io.upload_ndjson_to_gcs(
         bucket=cfg.bucket_name,
-        prefix=cfg.search_result_raw,
+        records=items,
+        path=f"{cfg.detailed_video_info}video_info_{ts}{gcp_io.NDJSON_GZ_SUFFIX}",
         project_id=cfg.project_id,
+        manifest_prefix=cfg.detailed_video_info,
     )
 
-    # 2) Làm sạch (bỏ trùng videoId)
-    df = clean_search_df(df)
 
-    # 3) Lấy chi tiết cho một khoảng (ví dụ 0..100)
-    results = get_video_details(df, start=0, end=len(df), api_key=cfg.api)
+def main() -> None:
+    cfg = env_utils.load_env()
+    ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+
+
+    with metrics.stage("details"):
+        # 1) Đọc file search-result hôm nay → df
+        df = gcp_io.read_latest_json_from_gcs(
+            bucket=cfg.bucket_name,
+            prefix=cfg.search_result_raw,
+            project_id=cfg.project_id,
+        )
 
-    # 4) Lưu chi tiết lên GCS (1 file/timestamp)
-    gcp_io.upload_json_to_gcs(
-        bucket=cfg.bucket_name,
-        data=results,
-        path=f"{cfg.detailed_video_info}video_info_{ts}.json",
-        project_id=cfg.project_id,
-    )
+        # 2) Crawl chi tiết và stream lên GCS trong lúc crawl (1 file/timestamp, NDJSON gzip)
+        upload_video_details(cfg, iter_due_video_details(cfg, df), ts)
+    print(metrics.summary())
+    metrics.save_report(cfg)
 
 
 if __name__ == "__main__":
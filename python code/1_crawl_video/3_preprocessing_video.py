@@ -1,12 +1,14 @@
 import json
 import pandas as pd
 from langdetect import detect, DetectorFactory
-from typing import Any
+from typing import Any, List, Optional, Tuple
 import isodate as i
 
 DetectorFactory.seed = 0
 
 import sys
+from datetime import datetime
+from zoneinfo import ZoneInfo
 from pathlib import Path
 # Project root = 1 cấp trên file hiện tại
 ROOT = Path(__file__).resolve().parents[1]
@@ -14,7 +16,13 @@ sys.path.append(str(ROOT))
 
 import env_utils
 import gcp_io
+import lang_detect
+import metrics
+import chunked
+import stats_history
+import flatten
 
+TZ = ZoneInfo("Asia/Ho_Chi_Minh")
 
 # ---------- PREPROCESS ----------
 def json_parse_safe(val: Any) -> Any:
@@ -43,10 +51,171 @@ def split_json_column(df: pd.DataFrame, column: str) -> pd.DataFrame:
     return pd.concat([df.drop(columns=[column]), norm], axis=1)
 
 
+DROP_COLUMNS = [
+    'etag', 'kind',
+    'thumbnails.medium.url', 'thumbnails.medium.width', 'thumbnails.medium.height',
+    'thumbnails.high.url', 'thumbnails.high.width', 'thumbnails.high.height',
+    'thumbnails.standard.url', 'thumbnails.standard.width', 'thumbnails.standard.height', 'thumbnails.maxres.url',
+    'thumbnails.maxres.width', 'thumbnails.maxres.height', 'thumbnails.default.width', 'thumbnails.default.height',
+    'localized.title', 'localized.description','thumbnails.default.url' ,
+    'projection', 'liveBroadcastContent', 'dimension', 'definition', 'projection'
+    'favoriteCount'
+]
+
+# Các field lấy từ videos.list (part=snippet,contentDetails,statistics) — chỉ parse đúng các path này.
+# Giữ đúng tập cột staging trước đây (favoriteCount vẫn còn vì DROP_COLUMNS thiếu dấu phẩy ở 'projection').
+VIDEO_FIELDS = [
+    flatten.field("id"),
+    flatten.field("snippet.publishedAt"),
+    flatten.field("snippet.channelId"),
+    flatten.field("snippet.title"),
+    flatten.field("snippet.description"),
+    flatten.field("snippet.channelTitle"),
+    flatten.field("snippet.tags"),
+    flatten.field("snippet.categoryId"),
+    flatten.field("snippet.defaultLanguage"),
+    flatten.field("snippet.defaultAudioLanguage"),
+    flatten.field("contentDetails.duration"),
+    flatten.field("contentDetails.caption"),
+    flatten.field("contentDetails.licensedContent"),
+    flatten.field("contentDetails.contentRating.ytRating"),
+    flatten.field("contentDetails.regionRestriction.allowed"),
+    flatten.field("contentDetails.regionRestriction.blocked"),
+    flatten.field("statistics.viewCount", kind="number"),
+    flatten.field("statistics.likeCount", kind="number"),
+    flatten.field("statistics.favoriteCount"),
+    flatten.field("statistics.commentCount", kind="number"),
+]
+
+CATEGORY_MAPPING = {
+    "1": "Film & Animation", "2": "Autos & Vehicles", "10": "Music",
+    "15": "Pets & Animals", "17": "Sports", "19": "Travel & Events",
+    "20": "Gaming", "22": "People & Blogs", "23": "Comedy",
+    "24": "Entertainment", "25": "News & Politics", "26": "Howto & Style",
+    "27": "Education", "28": "Science & Technology", "29": "Nonprofits & Activism",
+}
+
+# Các cột dạng list trong snippet/contentDetails/topicDetails của videos.list
+LIST_COLUMNS = [
+    "tags", "topicCategories", "relevantTopicIds",
+    "regionRestriction.allowed", "regionRestriction.blocked",
+]
+
+# ISO-8601 duration kiểu YouTube: P[nW][nD][T[nH][nM][nS]]
+ISO_DURATION_RE = (
+    r"^(?P<all>P(?:(?P<w>\d+)W)?(?:(?P<d>\d+)D)?"
+    r"(?:T(?:(?P<h>\d+)H)?(?:(?P<m>\d+)M)?(?:(?P<s>\d+(?:\.\d+)?)S)?)?)$"
+)
+
+
+def _duration_minutes_rowwise(x: Any) -> Any:
+    return round(i.parse_duration(x).total_seconds() / 60, 3) if isinstance(x, str) else None
+
+
+def duration_minutes(durations: pd.Series) -> pd.Series:
+    """
+    ISO-8601 duration → số phút (làm tròn 3 chữ số), tính theo cả cột bằng regex.
+    Chuỗi không khớp regex (hiếm) mới fallback về isodate từng dòng.
+    """
+    parts = durations.astype("object").str.extract(ISO_DURATION_RE)
+    matched = parts["all"].notna()
+    nums = parts[["w", "d", "h", "m", "s"]].astype(float).fillna(0.0)
+    seconds = nums["w"] * 604800 + nums["d"] * 86400 + nums["h"] * 3600 + nums["m"] * 60 + nums["s"]
+    minutes = (seconds / 60).round(3).where(matched)
+
+    rest = durations[~matched & durations.notna()]
+    if not rest.empty:
+        minutes.loc[rest.index] = rest.apply(_duration_minutes_rowwise)
+    return minutes
+
+
+def join_list_columns(df: pd.DataFrame, columns=LIST_COLUMNS) -> pd.DataFrame:
+    """Danh sách → chuỗi '; ' chỉ cho các cột list đã biết trước (không quét mọi cột)."""
+    for col in columns:
+        if col in df.columns and df[col].dtype == object:
+            s = df[col]
+            mask = s.notna()
+            if mask.any():
+                df.loc[mask, col] = s[mask].str.join("; ")
+    return df
+
+
 def preprocess(df: pd.DataFrame) -> pd.DataFrame:
     """
     Tiền xử lý: phẳng JSON, đổi kiểu dữ liệu, loại cột rác, chuẩn hoá danh sách, drop NA,
     ánh xạ category, thêm crawl_date (hôm nay).
+    Bản vectorized: chỉ phẳng các path trong VIDEO_FIELDS, duration/caption xử lý theo cả cột,
+    chỉ nối list ở LIST_COLUMNS. Kết quả giống preprocess_rowwise.
+    """
+    # 1-2) Phẳng đúng các cột cần giữ (không phẳng thumbnails/localized... rồi mới drop)
+    df = flatten.flatten_frame(df, VIDEO_FIELDS)
+
+    # 3) Kiểu dữ liệu
+    df["publishedAt"] = pd.to_datetime(df.get("publishedAt"), errors="coerce")
+
+    if "caption" in df.columns:
+        df["caption"] = df["caption"].astype(str).str.lower().eq("true")
+
+    for c in ["viewCount", "likeCount", "commentCount"]:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    if "duration" in df.columns:
+        df["duration_minutes"] = duration_minutes(df["duration"])
+        df.drop(columns=["duration"], inplace=True, errors="ignore")
+
+    # 4) Bỏ dòng không hợp lệ
+    if "duration_minutes" in df.columns:
+        df.dropna(subset=["duration_minutes"], inplace=True)
+        df = df[df["duration_minutes"] > 0]
+
+    # 5) Điền NA số & cast
+    for c in ["likeCount", "commentCount", "viewCount"]:
+        if c in df.columns:
+            df[c] = df[c].fillna(0).astype(int)
+
+    # 6) Ánh xạ category
+    if "categoryId" in df.columns:
+        df["categoryName"] = df["categoryId"].astype(str).map(CATEGORY_MAPPING)
+
+    # 7) Detect ngôn ngữ fallback — chỉ các dòng thiếu defaultLanguage, 1 lần gọi batch (có cache)
+    if "defaultLanguage" in df.columns:
+        missing = df["defaultLanguage"].isna()
+        if missing.any():
+            desc = df["description"] if "description" in df.columns else pd.Series([None] * len(df), index=df.index)
+            df.loc[missing, "defaultLanguage"] = lang_detect.detect_languages(desc[missing].tolist())
+
+    # 8) Danh sách → chuỗi (để nạp BQ ổn định)
+    df = join_list_columns(df)
+
+    # 9) Thêm crawl_date = hôm nay (UTC date)
+    df["crawl_date"] = pd.to_datetime(pd.Timestamp.utcnow().date())
+
+    # 10) Chuẩn khoá video id
+    #   - cột id là videoId ở schema item; giữ tên 'id' cho BQ table
+    if "id" not in df.columns and "videoId" in df.columns:
+        df.rename(columns={"videoId": "id"}, inplace=True)
+
+    # Drop trùng ID (giữ bản đầu)
+    if "id" in df.columns:
+        df.drop_duplicates(subset=["id"], keep="first", inplace=True)
+        df.reset_index(drop=True, inplace=True)
+
+    return df
+
+
+def detect_language_safe(text):
+    try:
+        return detect(str(text))
+    except Exception:
+        return "unknown"
+
+
+def preprocess_rowwise(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bản cũ (apply từng dòng), giữ lại để so sánh/benchmark với preprocess.
+    Tiền xử lý: phẳng JSON, đổi kiểu dữ liệu, loại cột rác, chuẩn hoá danh sách, drop NA,
+    ánh xạ category, thêm crawl_date (hôm nay).
     """
     # 1) Phẳng các cột lớn
     for col in ["snippet", "contentDetails", "statistics"]:
@@ -55,17 +224,7 @@ def preprocess(df: pd.DataFrame) -> pd.DataFrame:
     # print(df.columns)
 
     # 2) Loại cột không cần thiết
-    drop_columns = [
-        'etag', 'kind',
-        'thumbnails.medium.url', 'thumbnails.medium.width', 'thumbnails.medium.height',
-        'thumbnails.high.url', 'thumbnails.high.width', 'thumbnails.high.height',
-        'thumbnails.standard.url', 'thumbnails.standard.width', 'thumbnails.standard.height', 'thumbnails.maxres.url',
-        'thumbnails.maxres.width', 'thumbnails.maxres.height', 'thumbnails.default.width', 'thumbnails.default.height',
-        'localized.title', 'localized.description','thumbnails.default.url' ,
-        'projection', 'liveBroadcastContent', 'dimension', 'definition', 'projection'
-        'favoriteCount'
-    ]
-    df.drop(columns=drop_columns, inplace=True, errors="ignore")
+    df.drop(columns=DROP_COLUMNS, inplace=True, errors="ignore")
 
     # 3) Kiểu dữ liệu
     df["publishedAt"] = pd.to_datetime(df.get("publishedAt"), errors="coerce")
@@ -78,9 +237,7 @@ def preprocess(df: pd.DataFrame) -> pd.DataFrame:
             df[c] = pd.to_numeric(df[c], errors="coerce")
 
     if "duration" in df.columns:
-        df["duration_minutes"] = df["duration"].apply(
-            lambda x: round(i.parse_duration(x).total_seconds() / 60, 3) if isinstance(x, str) else None
-        )
+        df["duration_minutes"] = df["duration"].apply(_duration_minutes_rowwise)
         df.drop(columns=["duration"], inplace=True, errors="ignore")
 
     # 4) Bỏ dòng không hợp lệ
@@ -94,23 +251,10 @@ def preprocess(df: pd.DataFrame) -> pd.DataFrame:
             df[c] = df[c].fillna(0).astype(int)
 
     # 6) Ánh xạ category
-    category_mapping = {
-        "1": "Film & Animation", "2": "Autos & Vehicles", "10": "Music",
-        "15": "Pets & Animals", "17": "Sports", "19": "Travel & Events",
-        "20": "Gaming", "22": "People & Blogs", "23": "Comedy",
-        "24": "Entertainment", "25": "News & Politics", "26": "Howto & Style",
-        "27": "Education", "28": "Science & Technology", "29": "Nonprofits & Activism",
-    }
     if "categoryId" in df.columns:
-        df["categoryName"] = df["categoryId"].astype(str).map(category_mapping)
+        df["categoryName"] = df["categoryId"].astype(str).map(CATEGORY_MAPPING)
 
     # 7) Detect ngôn ngữ fallback (chỉ khi thiếu defaultLanguage)
-    def detect_language_safe(text):
-        try:
-            return detect(str(text))
-        except Exception:
-            return "unknown"
-
     if "defaultLanguage" in df.columns:
         df["defaultLanguage"] = df["defaultLanguage"].fillna(
             df.get("description", pd.Series([None] * len(df))).apply(detect_language_safe)
@@ -136,33 +280,108 @@ def preprocess(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-def main() -> None:
-    cfg = env_utils.load_env()
+def staging_target(cfg: env_utils.EnvConfig) -> gcp_io.BQTarget:
+    return gcp_io.BQTarget(
+        project_id=cfg.project_id,
+        dataset=cfg.staging_dataset,
+        table=cfg.video_staging_table
+        # location=cfg.bq_location
+    )
+
+
+def load_to_staging(
+    cfg: env_utils.EnvConfig,
+    df_clean: pd.DataFrame,
+    write_mode: str = 'overwrite',
+    part: Optional[int] = None,
+    ts: Optional[str] = None,
+    schema_update_options: Optional[List[str]] = None,
+) -> None:
+    """Nạp df đã tiền xử lý vào bảng video staging (mặc định overwrite; part = số thứ tự batch khi chạy chunked)."""
+    target = staging_target(cfg)
+    if cfg.parquet_staging:
+        # Parquet staging trên GCS → load job trực tiếp (không upload DataFrame từ client)
+        ts = ts or datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+        suffix = f"_part{part:05d}" if part is not None else ""
+        prefix = f"{cfg.parquet_staging}videos/"
+        gcp_io.write_df_via_gcs_parquet(
+            df_clean,
+            target,
+            write_mode=write_mode,
+            bucket=cfg.bucket_name,
+            path=f"{prefix}video_clean{ts}{suffix}{gcp_io.PARQUET_SUFFIX}",
+            schema_update_options=schema_update_options,
+            manifest_prefix=prefix,
+        )
+    else:
+        # load_dataframe_to_staging(df_clean, project_id, BQ_DATASET, BQ_TABLE, BQ_LOCATION)
+        gcp_io.write_df_to_bq(
+            df_clean,
+            target,
+            write_mode=write_mode,
+            autodetect=True,
+            schema_update_options=schema_update_options,
+        )
+    # lịch sử số liệu (nếu bật): append cùng lúc với nạp staging
+    stats_history.append_history(cfg, "video", df_clean)
 
-    # 1) Đọc toàn bộ file video-info TẠO HÔM NAY
-    df_raw = gcp_io.read_latest_json_from_gcs(
+
+def preprocess_chunked(cfg: env_utils.EnvConfig, batch_size: int) -> Tuple[int, int]:
+    """
+    Đọc file video-info mới nhất theo batch (≤ batch_size dòng), tiền xử lý + nạp staging từng batch.
+    Bỏ trùng id giữa các batch. Trả về (rows_in, rows_out).
+    """
+    ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+    batches = gcp_io.iter_latest_json_batches(
         bucket=cfg.bucket_name,
         prefix=cfg.detailed_video_info,
-        project_id=cfg.project_id
+        batch_size=batch_size,
+        project_id=cfg.project_id,
     )
 
-    # 2) Tiền xử lý
-    df_clean = preprocess(df_raw)
-
-    # 3) Nạp BigQuery
-    print(df_clean)
-    # load_dataframe_to_staging(df_clean, project_id, BQ_DATASET, BQ_TABLE, BQ_LOCATION)
-    gcp_io.write_df_to_bq(
-        df_clean,
-        gcp_io.BQTarget(
-            project_id=cfg.project_id,
-            dataset=cfg.staging_dataset,
-            table=cfg.video_staging_table
-            # location=cfg.bq_location
-        ),
-        write_mode='overwrite',
-        autodetect=True,
+    def load(df: pd.DataFrame, write_mode: str, part: int, options: Optional[list]) -> None:
+        load_to_staging(cfg, df, write_mode=write_mode, part=part, ts=ts, schema_update_options=options)
+
+    rows_in, rows_out, parts = chunked.run_chunked(
+        batches, preprocess, load, on_empty=lambda: gcp_io.truncate_table(staging_target(cfg))
     )
+    print(f"✅ Preprocess chunked: {rows_in} → {rows_out} dòng, {parts} batch")
+    return rows_in, rows_out
+
+
+def main() -> None:
+    cfg = env_utils.load_env()
+    lang_detect.set_detector(lang_detect.load_detector(cfg))
+
+    with metrics.stage("preprocess_video"):
+        if cfg.preprocess_batch_rows > 0:
+            # Đọc / xử lý / nạp theo batch → bộ nhớ giới hạn theo PREPROCESS_BATCH_ROWS
+            rows_in, rows_out = preprocess_chunked(cfg, cfg.preprocess_batch_rows)
+            metrics.add_rows(rows_in=rows_in, rows_out=rows_out)
+        else:
+            # 1) Đọc toàn bộ file video-info TẠO HÔM NAY
+            df_raw = gcp_io.read_latest_json_from_gcs(
+                bucket=cfg.bucket_name,
+                prefix=cfg.detailed_video_info,
+                project_id=cfg.project_id
+            )
+
+            # 2) Tiền xử lý
+            rows_in = len(df_raw)
+            df_clean = preprocess(df_raw)
+            metrics.add_rows(rows_in=rows_in, rows_out=len(df_clean))
+
+            # 3) Nạp BigQuery
+            print(df_clean)
+            if df_clean.empty:
+                # không có video mới / đến hạn → làm rỗng staging (giữ schema) thay vì ghi đè bằng frame rỗng,
+                # upsert / get_channel_list sau đó không đọc lại dữ liệu lần trước
+                print("💤 Không có video mới, staging được làm rỗng.")
+                gcp_io.truncate_table(staging_target(cfg))
+            else:
+                load_to_staging(cfg, df_clean)
+    print(metrics.summary())
+    metrics.save_report(cfg)
 
 
 if __name__ == "__main__":
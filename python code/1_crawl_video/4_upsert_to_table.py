@@ -6,6 +6,8 @@ sys.path.append(str(ROOT))
 
 import env_utils
 import gcp_io
+import metrics
+import stats_history
 
 
 #MERGE staging và video_basic info table dựa trên video id, giữ lại thông tin mới nhất
@@ -13,35 +15,46 @@ from typing import List, Iterable, Optional
 from google.cloud import bigquery
 
 
-def main() -> None:
-    cfg = env_utils.load_env()
-    query = f"""
-    SELECT column_name
-    FROM `{cfg.project_id}.{cfg.clean_dataset}.INFORMATION_SCHEMA.COLUMNS`
-    WHERE table_name = '{cfg.video_info_table}';
-    """
+# Bảng video info: partition theo ngày publishedAt (bất biến theo id → prune an toàn), cluster theo id/channelId
+PARTITION_COL = 'publishedAt'
+CLUSTER_COLS = ['id', 'channelId']
 
-    result = gcp_io.execute_sql(
-        project_id=cfg.project_id,
-        query=query
-    )
 
-    all_columns = [row['column_name'] for row in result]
+def upsert_videos(cfg: env_utils.EnvConfig) -> gcp_io.MergeStats:
+    """MERGE bảng video staging vào bảng video info (khoá id), chỉ update dòng có số liệu đổi."""
+    # cột lấy từ metadata bảng (không query INFORMATION_SCHEMA); bảng chưa có → theo staging
+    all_columns = (
+        gcp_io.table_columns(cfg.project_id, cfg.clean_dataset, cfg.video_info_table)
+        or gcp_io.table_columns(cfg.project_id, cfg.staging_dataset, cfg.video_staging_table)
+    )
 
     print(all_columns)
 
     #column need to be update:
     update_cols = ['viewCount', 'likeCount', 'commentCount', 'crawl_date']
 
-    gcp_io.merge_tables(
+    stats = gcp_io.merge_tables(
         project_id=cfg.project_id,
         src_dataset=cfg.staging_dataset,
         target_dataset=cfg.clean_dataset,
         target_table=cfg.video_info_table,
         staging_table=cfg.video_staging_table,
         updated_cols=update_cols,
-        all_cols=all_columns
+        all_cols=all_columns,
+        partition_col=PARTITION_COL,
+        cluster_cols=CLUSTER_COLS,
     )
+    # bảng latest của history (nếu bật) cập nhật từ các partition mới
+    stats_history.refresh_latest(cfg, "video")
+    return stats
+
+
+def main() -> None:
+    cfg = env_utils.load_env()
+    with metrics.stage("upsert_video"):
+        upsert_videos(cfg)
+    print(metrics.summary())
+    metrics.save_report(cfg)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
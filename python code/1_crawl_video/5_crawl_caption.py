@@ -6,24 +6,39 @@ sys.path.append(str(ROOT))
 
 import env_utils
 import gcp_io
-import pandas as pd
+import metrics
+import transcript_store
 
 from youtube_transcript_api import YouTubeTranscriptApi
+import os
+import json
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
 
+SPILL_DIR = ROOT.parent / ".cache" / "captions"
+
+# Lỗi cho thấy phía YouTube đang chặn / giới hạn tốc độ → giảm concurrency
+THROTTLE_ERRORS = {"TooManyRequests", "RequestBlocked", "IpBlocked", "YouTubeRequestFailed"}
+
 
 def get_video_list(cfg: env_utils.EnvConfig):
-    query = f"""
+    # video chưa có transcript và chưa bị đánh dấu "không có transcript" trong bảng status
+    done = "".join(
+        f"""
+    EXCEPT DISTINCT
     (
-    SELECT DISTINCT id
-    FROM `{cfg.project_id}.{cfg.clean_dataset}.{cfg.video_info_table}`
+    {q}
+    )"""
+        for q in transcript_store.done_id_queries(cfg)
     )
-    EXCEPT DISTINCT
+    query = f"""
     (
     SELECT DISTINCT id
-    FROM `{cfg.project_id}.{cfg.clean_dataset}.{cfg.video_captions_table}`
-    )
+    FROM `{cfg.project_id}.{cfg.clean_dataset}.{cfg.video_info_table}`
+    ){done}
     """
     print(query)
     results = gcp_io.execute_sql(project_id=cfg.project_id, query=query)
@@ -40,78 +55,252 @@ def get_transcript_flexible(video_id):
     try:
         transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
 
-        # Ưu tiên phụ đề tiếng Anh
+        # Ưu tiên phụ đề tiếng Anh (bị throttle khi fetch → raise để AIMD giảm tốc, không coi là "không có")
         try:
             return transcript_list.find_transcript(['en']).fetch(), 'en'
-        except:
-            pass
+        except Exception as e:
+            if _is_throttle_error(e):
+                raise
 
         # Nếu không có tiếng Anh, lấy bất kỳ cái nào fetch được
         for transcript in transcript_list:
             try:
                 return transcript.fetch(), transcript.language_code
-            except:
+            except Exception as e:
+                if _is_throttle_error(e):
+                    raise
                 continue
 
     except Exception as e:
+        if _is_throttle_error(e):
+            raise
         print(f"Không lấy được transcript cho video {video_id}: {e}")
         return None,None
+    return None, None
+
+
+def _is_throttle_error(e: Exception) -> bool:
+    return type(e).__name__ in THROTTLE_ERRORS or "429" in str(e)
+
+
+class AIMDController:
+    """
+    Điều chỉnh số request song song kiểu AIMD:
+    thành công đủ 1 "vòng" (limit request) → +increase; bị throttle → nhân decrease và nghỉ backoff.
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 increase: float = 1.0, decrease: float = 0.5,
+                 base_backoff: float = 5.0, max_backoff: float = 300.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._successes = 0
+        self._throttles_in_row = 0
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._throttles_in_row = 0
+            self._successes += 1
+            if self._successes >= self.concurrency:
+                self._successes = 0
+                self.limit = min(self.max_limit, self.limit + self.increase)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self._successes = 0
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** self._throttles_in_row)
+            self._throttles_in_row += 1
+            self._resume_at = max(self._resume_at, time.monotonic() + backoff)
+
+    def wait_if_backing_off(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _fetch_one(video_id):
+    """Trả về (status, transcript, lang) với status ∈ {'ok', 'none', 'throttled'}."""
+    try:
+        with metrics.http_timer("transcript"):
+            transcript, lang = get_transcript_flexible(video_id)
+    except Exception as e:
+        print(f"⏳ Throttled ở video {video_id}: {type(e).__name__}")
+        return "throttled", None, None
+    if transcript is None:
+        return "none", None, None
+    return "ok", transcript, lang
 
 
-def crawl_transcripts(video_list):
-    data = []
+def iter_transcripts(video_list, max_workers: int = 16, initial_concurrency: int = 4, max_retries: int = 3):
+    """
+    Crawl transcript bằng worker pool; số request song song tăng/giảm theo AIMD
+    (thay cho sleep cố định 3s/video và 60s mỗi 100 video).
+    Video bị throttle được đưa lại hàng đợi (tối đa max_retries lần).
+    Yield từng dòng ngay khi có: {'id', 'lang', 'text', 'start', 'duration'} (segments theo cột)
+    hoặc {'id', 'status'} khi không lấy được transcript.
+    """
     count = 0
-    for v in video_list:
-        only_text = ''
-        transcript,lang = get_transcript_flexible(v)
+    total = len(video_list)
+    ctrl = AIMDController(initial=initial_concurrency, max_limit=max_workers)
+    queue = deque((v, 0) for v in video_list)
+    in_flight = {}
 
-        if transcript is None:
-            print(f"No transcript found for video {v}")
-            data.append({'id': v, 'transcript': 'No Transcript', 'lang': 'N/A'})
-            count += 1
-            continue
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while queue or in_flight:
+            ctrl.wait_if_backing_off()
+            while queue and len(in_flight) < ctrl.concurrency:
+                v, attempt = queue.popleft()
+                # bind mỗi task 1 lần: worker ghi metrics vào stage hiện tại
+                in_flight[pool.submit(metrics.bind(_fetch_one), v)] = (v, attempt)
 
-        for item in transcript:
-            # only_text += item['text'] + ' '
-            only_text += item.text + ' '
-        
-        data.append({'id': v, 'transcript': only_text, 'lang': lang})
-        print(f"Video {count}/{len(video_list)}: {v}")
-        count += 1
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                v, attempt = in_flight.pop(fut)
+                status, transcript, lang = fut.result()
 
-        time.sleep(3)        
-        if count % 100 == 0:
-            time.sleep(60)  # sleep for 1 minute every 100 videos to avoid hitting API limits
+                if status == "throttled":
+                    ctrl.on_throttle()
+                    if attempt + 1 < max_retries:
+                        queue.append((v, attempt + 1))
+                        continue
+                    print(f"No transcript found for video {v} (throttled {max_retries} lần)")
+                    count += 1
+                    yield transcript_store.failed_row(v, transcript_store.STATUS_THROTTLED)
+                    continue
 
-    return data
+                ctrl.on_success()
+                if status == "none":
+                    print(f"No transcript found for video {v}")
+                    count += 1
+                    yield transcript_store.failed_row(v, transcript_store.STATUS_NONE)
+                    continue
 
+                count += 1
+                print(f"Video {count}/{total}: {v} (concurrency={ctrl.concurrency})")
+                yield transcript_store.ok_row(v, lang, transcript_store.to_segments(transcript))
 
-def main() -> None:
-    cfg = env_utils.load_env()
+
+def crawl_transcripts(video_list, max_workers: int = 16, initial_concurrency: int = 4, max_retries: int = 3):
+    """Như iter_transcripts nhưng trả về list (giữ toàn bộ trong bộ nhớ)."""
+    return list(iter_transcripts(video_list, max_workers, initial_concurrency, max_retries))
+
+
+class CaptionCheckpoint:
+    """
+    Ghi transcript theo micro-batch: mỗi dòng được ghi ngay vào spill file cục bộ (pending.ndjson),
+    cứ đủ flush_rows dòng hoặc flush_mb MB thì ghi qua TranscriptStore (captions / segments / status) rồi xoá pending.
+    Mỗi dòng chỉ flush xuống OS (đủ cho process crash); fsync mỗi fsync_rows dòng để giới hạn số dòng
+    mất khi mất điện mà không tốn 1 lần fsync / video.
+    Crash giữa chừng → lần chạy sau recover() đẩy nốt pending lên BQ; video đã có trong bảng
+    captions bị get_video_list loại ra nên không crawl lại.
+    """
+
+    def __init__(self, store: transcript_store.TranscriptStore, spill_dir: Path = SPILL_DIR,
+                 flush_rows: int = 200, flush_mb: float = 32.0, fsync_rows: int = 50):
+        self.store = store
+        self.flush_rows = flush_rows
+        self.fsync_rows = max(fsync_rows, 1)
+        self.flush_bytes = int(flush_mb * 1024 * 1024)
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        self.pending_path = spill_dir / f"pending_{store.captions.table}.ndjson"
+        self._buffer = []
+        self._bytes = 0
+        self._file = None
+        self._unsynced = 0
+        self.committed = 0
+
+    def recover(self, keep_ids=None) -> set:
+        """
+        Đẩy các dòng pending của lần chạy trước; keep_ids = các id vẫn còn thiếu trên BQ.
+        Trả về tập id đã recover.
+        """
+        if not self.pending_path.exists():
+            return set()
+        with open(self.pending_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        if keep_ids is not None:
+            rows = [r for r in rows if r['id'] in keep_ids]
+        self._buffer, self._bytes = rows, 0
+        self.commit()
+        if rows:
+            print(f"♻️ Recovered {len(rows)} transcript(s) từ {self.pending_path.name}")
+        return {r['id'] for r in rows}
+
+    def add(self, row) -> None:
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        if self._file is None:
+            self._file = open(self.pending_path, "a", encoding="utf-8")
+        self._file.write(line)
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_rows:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._buffer.append(row)
+        self._bytes += len(line.encode("utf-8"))
+        if len(self._buffer) >= self.flush_rows or self._bytes >= self.flush_bytes:
+            self.commit()
+
+    def _close_pending(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file, self._unsynced = None, 0
+
+    def commit(self) -> None:
+        self._close_pending()
+        if self._buffer:
+            self.store.write(self._buffer)
+            self.committed += len(self._buffer)
+            print(f"💾 Checkpoint: {self.committed} transcript(s) đã ghi BigQuery")
+        self._buffer, self._bytes = [], 0
+        self.pending_path.unlink(missing_ok=True)
+
+
+def run_captions(cfg: env_utils.EnvConfig) -> int:
+    """Stage captions: crawl transcript các video chưa có trong bảng captions; trả về số dòng đã ghi."""
     video_list = get_video_list(cfg)
+
+    ckpt = CaptionCheckpoint(
+        transcript_store.load_store(cfg),
+        flush_rows=cfg.caption_flush_rows,
+        flush_mb=cfg.caption_flush_mb,
+    )
+
+    # Đẩy nốt phần chưa commit của lần chạy trước, rồi bỏ các id đó khỏi danh sách
+    recovered = ckpt.recover(keep_ids=set(video_list))
+    video_list = [v for v in video_list if v not in recovered]
     print(f"Total videos to process: {len(video_list)}")
-    print(video_list)
 
-    data = crawl_transcripts(video_list)
-    print(f"Total transcripts crawled: {len(data)}")
+    for row in iter_transcripts(video_list):
+        ckpt.add(row)
+    ckpt.commit()
 
-    df = pd.DataFrame(data)
-    if df.empty:
+    print(f"Total transcripts crawled: {ckpt.committed}")
+    print(ckpt.store.summary())
+    if ckpt.committed == 0:
         print("⚠️ Không có dữ liệu để ghi.")
-        return
-    
-    print(df)
-
-    gcp_io.write_df_to_bq(
-        df,
-        gcp_io.BQTarget(
-            project_id=cfg.project_id,
-            dataset=cfg.clean_dataset,
-            table=cfg.video_captions_table
-        ),
-        write_mode='append',
-        autodetect=True,
-    )
+    metrics.add_rows(rows_in=len(video_list), rows_out=ckpt.committed)
+    return ckpt.committed
+
+
+def main() -> None:
+    cfg = env_utils.load_env()
+    with metrics.stage("captions"):
+        run_captions(cfg)
+    print(metrics.summary())
+    metrics.save_report(cfg)
 
 
 if __name__ == "__main__":
@@ -7,87 +7,113 @@ ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT))
 import env_utils
 import gcp_io
+import quota
+import api_cache
+import metrics
+import refresh_scheduler
+import youtube_client
 from datetime import datetime
-from googleapiclient.discovery import build
 
 
 TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+QUOTA_STAGE = "channels"
+CHANNEL_PART = "snippet,statistics,contentDetails,topicDetails"
 
-import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 
 def crawl_channel_info(
-    youtube,
+    youtube: youtube_client.YouTubeClient,
     channel_list: List[str],
-    batch_size: int = 50, #cố định, mỗi request tối đa 50 channel
-    sleep_time: float = 0.1
+    sleep_time: float = 0.1,
+    budget: Optional[quota.QuotaBudget] = None,
+    cache: Optional[api_cache.ResponseCache] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Crawl snippet, statistics, contentDetails, topicDetails của các channel trong channel_list.
-    Lưu dữ liệu raw vào file json.
+    Crawl snippet, statistics, contentDetails, topicDetails của các channel trong channel_list
+    (batch 50 channel / request).
 
     Args:
-        youtube: YouTube API service object (tạo bằng googleapiclient.discovery.build).
+        youtube: YouTubeClient (youtube_client.load_client).
         channel_list (List[str]): Danh sách channel IDs.
-        output_dir (str): Thư mục lưu file json.
-        output_filename (str): Tên file json đầu ra (vd: "channel_raw_info20250902.json").
-        batch_size (int): Số channel tối đa cho mỗi request (mặc định 50).
         sleep_time (float): Thời gian nghỉ giữa các request để tránh quota exceeded.
+        budget (QuotaBudget): Ngân sách quota; dừng khi stage 'channels' hết quota.
+        cache (ResponseCache): Cache etag; batch không đổi (304) lấy lại từ cache.
 
     Returns:
         List[Dict[str, Any]]: Danh sách dữ liệu raw đã crawl được.
     """
-    raw_data = []
+    return list(youtube.list_by_ids(
+        "channels", channel_list, CHANNEL_PART,
+        budget=budget, quota_stage=QUOTA_STAGE, cache=cache, request_pause=sleep_time,
+    ))
 
-    for i in range(0, len(channel_list), batch_size):
-        batch = channel_list[i:i + batch_size]
-        id_string = ",".join(batch)
 
-        try:
-            response = youtube.channels().list(
-                part="snippet,statistics,contentDetails,topicDetails",
-                id=id_string
-            ).execute()
+NO_CHANNEL_DUE = "💤 Không có channel đến hạn, bỏ qua upload / preprocess / upsert."
 
-            raw_data.extend(response.get("items", []))
-            print(f"✅ Crawled {i} → {i + len(batch) - 1}")
 
-            time.sleep(sleep_time)  # hạn chế quota exceeded
-
-        except Exception as e:
-            print(f"❌ Error with batch {i}-{i + len(batch) - 1}: {e}")
-            continue
-
-    return raw_data
-
-
-def main() -> None:
-    cfg = env_utils.load_env()
-    ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
-
-
-    # 1) lấy channel id từ bảng tạm
+def get_channel_list(cfg: env_utils.EnvConfig) -> List[str]:
+    """Lấy channel id từ bảng video staging."""
     query = f"""
     SELECT distinct channelId
     FROM `{cfg.project_id}.{cfg.staging_dataset}.{cfg.video_staging_table}`
     """
 
     results = gcp_io.execute_sql(project_id=cfg.project_id, query=query)
-    channel_list = [row.channelId for row in results]
-
-    youtube = build("youtube", "v3", developerKey=cfg.api)
+    return [row.channelId for row in results]
 
-    channel_results = crawl_channel_info(youtube, channel_list)
 
-    gcp_io.upload_json_to_gcs(
+def run_channel_crawl(cfg: env_utils.EnvConfig, channel_list: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Stage channel crawl; channel_list=None → lấy từ bảng video staging.
+    Chỉ crawl channel mới hoặc đã quá TTL (ChannelIndex) → số request tỉ lệ với churn, không với catalog.
+    """
+    if channel_list is None:
+        channel_list = get_channel_list(cfg)
+
+    index = refresh_scheduler.load_channel_index(cfg)
+    print(index.summary())
+    due = index.due_ids(channel_list)
+    print(f"📋 {len(due)}/{len(set(channel_list))} channel cần crawl (mới hoặc quá TTL)")
+
+    budget = quota.load_budget(cfg)
+    with youtube_client.load_client(cfg) as youtube, api_cache.load_cache(cfg) as cache:
+        channel_results = crawl_channel_info(youtube, due, budget=budget, cache=cache)
+        print(f"🗃️ Cache: {cache.hits} hit (304), {cache.misses} miss")
+    budget.save()
+    print(budget.summary())
+    index.record(channel_results)
+    index.save()
+    metrics.add_rows(rows_in=len(due), rows_out=len(channel_results))
+    return channel_results
+
+
+def upload_channel_results(cfg: env_utils.EnvConfig, channel_results: List[Dict[str, Any]], ts: str) -> str:
+    return gcp_io.upload_ndjson_to_gcs(
         project_id=cfg.project_id,
-        data=channel_results,
+        records=channel_results,
         bucket=cfg.bucket_name,
-        path=f"{cfg.channel_raw_info}channel_raw_info{ts}.json",
+        path=f"{cfg.channel_raw_info}channel_raw_info{ts}{gcp_io.NDJSON_GZ_SUFFIX}",
+        manifest_prefix=cfg.channel_raw_info,
     )
 
+
+def main() -> None:
+    cfg = env_utils.load_env()
+    ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+
+    with metrics.stage("channel_crawl"):
+        # 1) lấy channel id từ bảng tạm, 2) crawl
+        channel_results = run_channel_crawl(cfg)
+
+        if channel_results:
+            upload_channel_results(cfg, channel_results, ts)
+        else:
+            print(NO_CHANNEL_DUE)
+    print(metrics.summary())
+    metrics.save_report(cfg)
+
 if __name__ == "__main__":
     main()
 
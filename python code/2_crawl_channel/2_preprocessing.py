@@ -1,23 +1,50 @@
 import sys
+from datetime import datetime
 from zoneinfo import ZoneInfo
 from pathlib import Path
 
-from charset_normalizer import detect
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT))
 import env_utils
 import gcp_io
+import lang_detect
+import metrics
+import chunked
+import stats_history
+import flatten
 
 
 TZ = ZoneInfo("Asia/Ho_Chi_Minh")
 from pathlib import Path
+from collections import Counter
 import pandas as pd
 
+# Cột điền NA bằng mode (mode tính trên toàn bộ dữ liệu, kể cả khi chạy theo batch)
+MODE_FILL_COLUMNS = ['country', 'topicCategories']
+
+# Các field lấy từ channels.list — chỉ parse đúng các path này (bỏ qua thumbnails, localized, ...)
+CHANNEL_FIELDS = [
+    flatten.field('id'),
+    flatten.field('snippet.title'),
+    flatten.field('snippet.description'),
+    flatten.field('snippet.publishedAt'),
+    flatten.field('snippet.defaultLanguage'),
+    flatten.field('snippet.country'),
+    flatten.field('statistics.viewCount', kind='number'),
+    flatten.field('statistics.subscriberCount', kind='number'),
+    flatten.field('statistics.videoCount', kind='number'),
+    flatten.field('contentDetails.relatedPlaylists.uploads', column='uploadsPlaylistId'),
+    flatten.field('topicDetails.topicCategories'),
+]
+
+# Lượt tính mode chỉ cần 3 field
+MODE_FIELDS = [flatten.field('id'), flatten.field('snippet.country'), flatten.field('topicDetails.topicCategories')]
+
 
 #  Cell 7
 def split_json_column(df, column):
-    # Convert the JSON string to a dictionary
-    df[column] = df[column].apply(lambda x: eval(x) if isinstance(x, str) else x)
+    # Convert the JSON string to a dictionary (không eval)
+    df[column] = df[column].apply(flatten.parse_json_cell)
     
     # Normalize the JSON column into separate columns
     json_df = pd.json_normalize(df[column])
@@ -28,12 +55,10 @@ def split_json_column(df, column):
     return df
 
 def detect_language(text):
-    try:
-        return detect(text)
-    except:
-        return 'unknown'
+    return lang_detect.detect_languages([text])[0]
     
-def preprocess(df):
+def preprocess(df, fill_values=None):
+    """fill_values: giá trị điền NA cho MODE_FILL_COLUMNS (None → mode của chính df)."""
     #remove duplicate base on id 
     df.drop_duplicates(subset=['id'], inplace=True)
 
@@ -54,20 +79,29 @@ def preprocess(df):
 
 
     #turn topicCategories into a string
+    for column in MODE_FILL_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
     df['topicCategories'] = df['topicCategories'].apply(lambda x: '; '.join(x) if isinstance(x, list) else x)
 
     #  Cell 22
     #fill country, topicCategories with mode
-    for column in ['country', 'topicCategories']:
-        mode_value = df[column].mode()[0]
-        df.fillna({column: mode_value}, inplace=True)
+    for column in MODE_FILL_COLUMNS:
+        if fill_values is not None:
+            mode_value = fill_values.get(column)
+        else:
+            modes = df[column].mode()
+            mode_value = modes[0] if len(modes) else None
+        if mode_value is not None:
+            df.fillna({column: mode_value}, inplace=True)
 
     #  Cell 23
-    #fill null of default Language with Detect Language of description
+    #fill null of default Language with Detect Language of description (1 lần gọi batch, có cache)
     if 'defaultLanguage' not in df.columns:
-        df['defaultLanguage'] = df['description'].apply(detect_language)
-    else:
-        df['defaultLanguage'] = df['defaultLanguage'].fillna(df['description'].apply(detect_language))
+        df['defaultLanguage'] = None
+    missing = df['defaultLanguage'].isna()
+    if missing.any():
+        df.loc[missing, 'defaultLanguage'] = lang_detect.detect_languages(df.loc[missing, 'description'].tolist())
 
     #  Cell 24
     df['topicCategories'] = df['topicCategories'].str.replace('https://en.wikipedia.org/wiki/', '', regex=True)
@@ -78,39 +112,134 @@ def preprocess(df):
 
     return df
 
-def main():
-    cfg = env_utils.load_env()
-
-    df = gcp_io.read_latest_json_from_gcs(
-        bucket = cfg.bucket_name,
-        prefix = cfg.channel_raw_info,
-        project_id=cfg.project_id
-    )
+def clean_channels(df, fill_values=None):
+    """Phẳng các path trong CHANNEL_FIELDS của channels.list rồi tiền xử lý."""
+    df = flatten.flatten_frame(df, CHANNEL_FIELDS)
 
     # print(df.columns)
 
-    df = split_json_column(df, 'snippet')
-    df = split_json_column(df, 'statistics')
-    df = split_json_column(df, 'contentDetails')
-    df = split_json_column(df, 'topicDetails')
+    return preprocess(df, fill_values)
+
+def mode_fill_values(batches):
+    """
+    Lượt đọc thứ nhất khi chạy theo batch: đếm country / topicCategories (sau khi bỏ trùng id)
+    để lấy mode toàn cục, giống df[column].mode()[0] trên cả file.
+    """
+    counts = {column: Counter() for column in MODE_FILL_COLUMNS}
+    dedup = chunked.IdDeduper('id')
+    for df in batches:
+        df = dedup.filter(df).reset_index(drop=True)
+        if df.empty:
+            continue
+        df = flatten.flatten_frame(df, MODE_FIELDS)
+        if 'country' in df.columns:
+            counts['country'].update(df['country'].dropna())
+        if 'topicCategories' in df.columns:
+            joined = df['topicCategories'].apply(lambda x: '; '.join(x) if isinstance(x, list) else x)
+            counts['topicCategories'].update(joined.dropna())
+    # mode()[0] của pandas: tần suất cao nhất, hoà thì lấy giá trị nhỏ nhất
+    return {
+        column: (min(v for v, n in c.items() if n == max(c.values())) if c else None)
+        for column, c in counts.items()
+    }
+
+def staging_target(cfg):
+    return gcp_io.BQTarget(
+        project_id=cfg.project_id,
+        dataset=cfg.staging_dataset,
+        table=cfg.channel_staging_table
+        # location=cfg.bq_location
+    )
 
-    # print(df.columns)
+def load_to_staging(cfg, df, write_mode='overwrite', part=None, ts=None, schema_update_options=None):
+    """Nạp df channel đã tiền xử lý vào bảng channel staging (mặc định overwrite; part = batch khi chạy chunked)."""
+    target = staging_target(cfg)
+    if cfg.parquet_staging:
+        # Parquet staging trên GCS → load job trực tiếp
+        ts = ts or datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+        suffix = f"_part{part:05d}" if part is not None else ""
+        prefix = f"{cfg.parquet_staging}channels/"
+        gcp_io.write_df_via_gcs_parquet(
+            df,
+            target,
+            write_mode=write_mode,
+            bucket=cfg.bucket_name,
+            path=f"{prefix}channel_clean{ts}{suffix}{gcp_io.PARQUET_SUFFIX}",
+            schema_update_options=schema_update_options,
+            manifest_prefix=prefix,
+        )
+    else:
+        gcp_io.write_df_to_bq(
+            df=df,
+            target=target,
+            write_mode=write_mode,
+            autodetect=True,
+            schema_update_options=schema_update_options,
+        )
+    # lịch sử số liệu (nếu bật): append cùng lúc với nạp staging
+    stats_history.append_history(cfg, 'channel', df)
+
+def preprocess_chunked(cfg, batch_size):
+    """
+    Chạy theo batch ≤ batch_size dòng: lượt 1 tính mode toàn cục (mode_fill_values),
+    lượt 2 phẳng + tiền xử lý + nạp staging từng batch, bỏ trùng id giữa các batch.
+    Trả về (rows_in, rows_out).
+    """
+    ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+
+    def batches():
+        return gcp_io.iter_latest_json_batches(
+            bucket=cfg.bucket_name,
+            prefix=cfg.channel_raw_info,
+            batch_size=batch_size,
+            project_id=cfg.project_id,
+        )
 
-    df = preprocess(df)
+    fill_values = mode_fill_values(batches())
+    print(f"📐 Mode toàn cục: {fill_values}")
 
-    # print(df.columns)
+    def load(df, write_mode, part, options):
+        load_to_staging(cfg, df, write_mode=write_mode, part=part, ts=ts, schema_update_options=options)
 
-    gcp_io.write_df_to_bq(
-        df=df,
-        target=gcp_io.BQTarget(
-            project_id=cfg.project_id,
-            dataset=cfg.staging_dataset,
-            table=cfg.channel_staging_table
-            # location=cfg.bq_location
-        ),
-        write_mode='overwrite',
-        autodetect=True
+    rows_in, rows_out, parts = chunked.run_chunked(
+        batches(), lambda df: clean_channels(df, fill_values), load,
+        on_empty=lambda: gcp_io.truncate_table(staging_target(cfg)),
     )
+    print(f"✅ Preprocess chunked: {rows_in} → {rows_out} dòng, {parts} batch")
+    return rows_in, rows_out
+
+def main():
+    cfg = env_utils.load_env()
+    lang_detect.set_detector(lang_detect.load_detector(cfg))
+
+    with metrics.stage("channel_preprocess"):
+        if cfg.preprocess_batch_rows > 0:
+            # Đọc / xử lý / nạp theo batch → bộ nhớ giới hạn theo PREPROCESS_BATCH_ROWS
+            rows_in, rows_out = preprocess_chunked(cfg, cfg.preprocess_batch_rows)
+            metrics.add_rows(rows_in=rows_in, rows_out=rows_out)
+        else:
+            df = gcp_io.read_latest_json_from_gcs(
+                bucket = cfg.bucket_name,
+                prefix = cfg.channel_raw_info,
+                project_id=cfg.project_id
+            )
+
+            # print(df.columns)
+
+            rows_in = len(df)
+            df = clean_channels(df)
+            metrics.add_rows(rows_in=rows_in, rows_out=len(df))
+
+            # print(df.columns)
+
+            if df.empty:
+                # không có channel đến hạn → làm rỗng staging để upsert không gộp lại dữ liệu lần trước
+                print("💤 Không có channel đến hạn, staging được làm rỗng.")
+                gcp_io.truncate_table(staging_target(cfg))
+            else:
+                load_to_staging(cfg, df)
+    print(metrics.summary())
+    metrics.save_report(cfg)
 
 
 
@@ -6,6 +6,8 @@ sys.path.append(str(ROOT))
 
 import env_utils
 import gcp_io
+import metrics
+import stats_history
 
 
 #MERGE staging và video_basic info table dựa trên video id, giữ lại thông tin mới nhất
@@ -13,8 +15,12 @@ from typing import List, Iterable, Optional
 from google.cloud import bigquery
 
 
-def main() -> None:
-    cfg = env_utils.load_env()
+# Bảng channel nhỏ → không partition, chỉ cluster theo id
+CLUSTER_COLS = ['id']
+
+
+def upsert_channels(cfg: env_utils.EnvConfig) -> gcp_io.MergeStats:
+    """MERGE bảng channel staging vào bảng channel info (khoá id), chỉ update dòng có số liệu đổi."""
 
     # query = f"""
     # SELECT column_name
@@ -35,15 +41,26 @@ def main() -> None:
            'videoCount', 'uploadsPlaylistId', 'crawl_date']
     
 
-    gcp_io.merge_tables(
+    stats = gcp_io.merge_tables(
         project_id=cfg.project_id,
         src_dataset=cfg.staging_dataset,
         target_dataset=cfg.clean_dataset,
         target_table=cfg.channel_info_table,
         staging_table=cfg.channel_staging_table,
         updated_cols=update_cols,
-        all_cols=all_cols
+        all_cols=all_cols,
+        cluster_cols=CLUSTER_COLS,
     )
+    # bảng latest của history (nếu bật) cập nhật từ các partition mới
+    stats_history.refresh_latest(cfg, 'channel')
+    return stats
+
+def main() -> None:
+    cfg = env_utils.load_env()
+    with metrics.stage("upsert_channel"):
+        upsert_channels(cfg)
+    print(metrics.summary())
+    metrics.save_report(cfg)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
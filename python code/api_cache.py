@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[1] / ".cache" / "api_responses"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# send(headers) -> (status_code, payload JSON hoặc None, error text)
+Sender = Callable[[Dict[str, str]], Tuple[int, Optional[Dict[str, Any]], str]]
+
+
+@dataclass
+class CachedResponse:
+    etag: str
+    items: List[Dict[str, Any]]
+
+
+class ResponseCache:
+    """
+    Cache response của videos.list / channels.list trên đĩa, key = endpoint + part + tập ID.
+    Lưu etag để gửi If-None-Match; khi API trả 304 thì dùng lại items đã lưu.
+    Tổng dung lượng giới hạn bởi max_bytes, loại bỏ theo LRU.
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.cache_dir / "index.json"
+        # key -> {"etag": str, "size": int, "atime": float}; thứ tự = LRU (cũ nhất trước)
+        self._index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    # ---------- index ----------
+    def _load_index(self) -> None:
+        if not self._index_path.exists():
+            return
+        try:
+            raw = json.loads(self._index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        for key, meta in sorted(raw.items(), key=lambda kv: kv[1].get("atime", 0)):
+            if (self.cache_dir / f"{key}.json").exists():
+                self._index[key] = meta
+
+    def save(self) -> None:
+        tmp = self._index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._index), encoding="utf-8")
+        tmp.replace(self._index_path)
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.save()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(m["size"] for m in self._index.values())
+
+    # ---------- get / put ----------
+    @staticmethod
+    def make_key(endpoint: str, part: str, ids: Iterable[str]) -> str:
+        parts = ",".join(sorted(p.strip() for p in part.split(",")))
+        raw = f"{endpoint}|{parts}|{','.join(sorted(ids))}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        meta = self._index.get(key)
+        if meta is None:
+            return None
+        try:
+            items = json.loads((self.cache_dir / f"{key}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._index.pop(key, None)
+            return None
+        meta["atime"] = time.time()
+        self._index.move_to_end(key)
+        return CachedResponse(etag=meta["etag"], items=items)
+
+    def put(self, key: str, etag: Optional[str], items: List[Dict[str, Any]]) -> None:
+        if not etag:
+            return
+        payload = json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return
+        (self.cache_dir / f"{key}.json").write_bytes(payload)
+        self._index[key] = {"etag": etag, "size": len(payload), "atime": time.time()}
+        self._index.move_to_end(key)
+        self._evict()
+
+    def _evict(self) -> None:
+        total = self.total_bytes
+        while total > self.max_bytes and self._index:
+            key, meta = self._index.popitem(last=False)
+            total -= meta["size"]
+            try:
+                os.remove(self.cache_dir / f"{key}.json")
+            except OSError:
+                pass
+
+
+def cached_fetch(
+    cache: Optional[ResponseCache],
+    endpoint: str,
+    part: str,
+    ids: List[str],
+    send: Sender,
+) -> Tuple[int, Optional[List[Dict[str, Any]]], str]:
+    """
+    Gọi API có điều kiện (If-None-Match) cho 1 batch ID.
+    Trả về (status, items, error_text); 304 → items lấy từ cache, lỗi → items=None.
+    """
+    if cache is None:
+        status, payload, err = send({})
+        return status, (payload or {}).get("items", []) if status == 200 else None, err
+
+    key = cache.make_key(endpoint, part, ids)
+    entry = cache.get(key)
+    headers = {"If-None-Match": entry.etag} if entry else {}
+
+    status, payload, err = send(headers)
+    if status == 304 and entry is not None:
+        cache.hits += 1
+        return status, entry.items, ""
+    if status == 200:
+        cache.misses += 1
+        items = (payload or {}).get("items", [])
+        cache.put(key, (payload or {}).get("etag"), items)
+        return status, items, ""
+    return status, None, err
+
+
+def load_cache(cfg) -> ResponseCache:
+    """Tạo ResponseCache từ EnvConfig (api_cache_dir, api_cache_max_mb)."""
+    cache_dir = Path(cfg.api_cache_dir) if cfg.api_cache_dir else DEFAULT_CACHE_DIR
+    return ResponseCache(cache_dir=cache_dir, max_bytes=cfg.api_cache_max_mb * 1024 * 1024)
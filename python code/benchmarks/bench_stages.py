@@ -0,0 +1,177 @@
+"""
+Benchmark từng stage trên payload giả lập (benchmarks/synthetic.py), ghi kết quả JSON để so sánh giữa các commit.
+
+    python "python code/benchmarks/bench_stages.py" --rows 10000 100000
+    python "python code/benchmarks/bench_stages.py" --rows 100000 --stages video_preprocess --compare base.json
+
+Mỗi stage: wall time (best of --repeat), rows/s, peak memory (tracemalloc, 1 lần chạy riêng).
+Upload NDJSON chạy qua backend local (local_backend.py) trong thư mục tạm → đo serialize + gzip + ghi file.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+import synthetic
+from synthetic import ROOT, load_stage
+
+import flatten
+import gcp_io
+import lang_detect
+import transcript_store
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+@dataclass
+class StageResult:
+    stage: str
+    rows: int
+    wall_s: float
+    rows_per_s: float
+    peak_mb: float
+    repeat: int
+
+
+@dataclass
+class BenchCase:
+    name: str
+    # make(rows, seed) → input; run(input) → output (input được copy trước mỗi lần chạy nếu là DataFrame)
+    make: Callable[[int, int], Any]
+    run: Callable[[Any], Any]
+    rows: Callable[[Any], int] = len
+
+
+def _copy(data: Any) -> Any:
+    return data.copy() if isinstance(data, pd.DataFrame) else data
+
+
+def measure(case: BenchCase, rows: int, repeat: int, seed: int = 0) -> StageResult:
+    data = case.make(rows, seed)
+    n = case.rows(data)
+
+    best = float("inf")
+    for _ in range(repeat):
+        arg = _copy(data)
+        t0 = time.perf_counter()
+        case.run(arg)
+        best = min(best, time.perf_counter() - t0)
+
+    # peak memory: chạy thêm 1 lần dưới tracemalloc (không tính vào thời gian)
+    arg = _copy(data)
+    tracemalloc.start()
+    case.run(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return StageResult(
+        stage=case.name,
+        rows=n,
+        wall_s=round(best, 6),
+        rows_per_s=round(n / best, 1) if best > 0 else float("inf"),
+        peak_mb=round(peak / 1024 / 1024, 2),
+        repeat=repeat,
+    )
+
+
+def build_cases(tmpdir: Path, transcript_ratio: float, segments: int) -> List[BenchCase]:
+    details = load_stage("1_crawl_video/2_crawl_video_details.py", "crawl_video_details")
+    video = load_stage("1_crawl_video/3_preprocessing_video.py", "preprocessing_video")
+    channel = load_stage("2_crawl_channel/2_preprocessing.py", "preprocessing_channel")
+
+    gcp_io.configure_backend("local", str(tmpdir))
+
+    def upload(records: List[Dict[str, Any]]) -> str:
+        return gcp_io.upload_ndjson_to_gcs("bench", "raw/video_info.ndjson.gz", records)
+
+    return [
+        BenchCase("clean_search_df", synthetic.make_search_df, details.clean_search_df),
+        BenchCase("video_flatten", synthetic.make_video_items, lambda df: flatten.flatten_frame(df, video.VIDEO_FIELDS)),
+        BenchCase("video_preprocess", synthetic.make_video_items, video.preprocess),
+        BenchCase("channel_preprocess", synthetic.make_channel_items, channel.clean_channels),
+        BenchCase(
+            "transcript_segments",
+            lambda n, seed: synthetic.make_transcripts(max(1, int(n * transcript_ratio)), segments, seed),
+            lambda ts: [transcript_store.to_segments(t).content_hash for t in ts],
+        ),
+        BenchCase("ndjson_upload", synthetic.make_video_records, upload),
+    ]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: List[StageResult], baseline_path: Path) -> None:
+    base = json.loads(baseline_path.read_text(encoding="utf-8"))
+    base_by_key = {(r["stage"], r["rows"]): r for r in base["results"]}
+    print(f"\n📊 So với {baseline_path.name} (commit {base.get('commit')}):")
+    for r in current:
+        b = base_by_key.get((r.stage, r.rows))
+        if not b:
+            continue
+        speedup = r.rows_per_s / b["rows_per_s"] if b["rows_per_s"] else float("nan")
+        print(f"   {r.stage:<20} rows={r.rows:<9} x{speedup:5.2f} rows/s   peak {b['peak_mb']:.1f} → {r.peak_mb:.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000], help="số dòng mỗi scale (vd 10000 1000000 10000000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", help="chỉ chạy các stage này")
+    parser.add_argument("--transcript-ratio", type=float, default=0.01, help="số transcript = rows * ratio")
+    parser.add_argument("--segments", type=int, default=200, help="số đoạn trung bình mỗi transcript")
+    parser.add_argument("--out", type=Path, help="file JSON kết quả (mặc định benchmarks/results/bench_<commit>_<ts>.json)")
+    parser.add_argument("--compare", type=Path, help="file JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    # không dùng cache SQLite để lần chạy sau không nhanh hơn giả tạo
+    lang_detect.set_detector(lang_detect.LanguageDetector(cache_path=None))
+
+    results: List[StageResult] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = build_cases(Path(tmp), args.transcript_ratio, args.segments)
+        if args.stages:
+            cases = [c for c in cases if c.name in args.stages]
+        for rows in args.rows:
+            for case in cases:
+                r = measure(case, rows, args.repeat)
+                results.append(r)
+                print(f"⏱️ {r.stage:<20} rows={r.rows:<9} {r.wall_s:8.3f}s  {r.rows_per_s:>12,.0f} rows/s  peak {r.peak_mb:8.1f} MB")
+        gcp_io.reset_clients()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "results": [asdict(r) for r in results],
+    }
+    out = args.out or RESULTS_DIR / f"bench_{commit or 'nogit'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"✅ Saved {out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Sinh payload giả lập giống response YouTube Data API (search.list, videos.list, channels.list)
+và transcript, dùng cho benchmark các stage. Cùng seed → cùng dữ liệu.
+"""
+from __future__ import annotations
+
+import importlib.util
+import random
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+WORDS = (
+    "AI tool agent learn generative automation prompt engineering data science chatgpt gemini claude "
+    "tutorial coding robot trend business productivity model deep machine learning python video how to"
+).split()
+KEYWORDS = ["AI tool", "Artificial Intelligence", "AI agent", "Generative AI", "ChatGPT", "AI tutorial"]
+LANGS = ["en", "en", "en", "vi", "es", "hi", "pt", None]
+TOPICS = [
+    "https://en.wikipedia.org/wiki/Technology",
+    "https://en.wikipedia.org/wiki/Knowledge",
+    "https://en.wikipedia.org/wiki/Lifestyle_(sociology)",
+    "https://en.wikipedia.org/wiki/Video_game_culture",
+]
+COUNTRIES = ["US", "VN", "IN", "GB", None]
+
+
+def load_stage(relpath: str, name: str):
+    """Import script stage có tên bắt đầu bằng số (không import trực tiếp được)."""
+    spec = importlib.util.spec_from_file_location(name, ROOT / relpath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _text(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=n_words))
+
+
+def _thumbnails() -> Dict[str, Any]:
+    return {
+        size: {"url": f"https://i.ytimg.com/{size}.jpg", "width": w, "height": h}
+        for size, w, h in (("default", 120, 90), ("medium", 320, 180), ("high", 480, 360))
+    }
+
+
+def _published(rng: random.Random) -> str:
+    return f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z"
+
+
+# ----------------------------
+# search.list
+# ----------------------------
+def make_search_items(n: int, seed: int = 0, dup_rate: float = 0.2) -> List[Dict[str, Any]]:
+    """n item search.list (id.videoId + snippet); dup_rate: tỷ lệ videoId lặp (cùng video ở nhiều keyword)."""
+    rng = random.Random(seed)
+    unique = max(int(n * (1 - dup_rate)), 1)
+    items = []
+    for k in range(n):
+        vid = k if k < unique else rng.randrange(unique)
+        items.append({
+            "kind": "youtube#searchResult",
+            "etag": f"etag{k}",
+            "id": {"kind": "youtube#video", "videoId": f"vid{vid:08d}"},
+            "snippet": {
+                "publishedAt": _published(rng),
+                "channelId": f"UC{rng.randrange(n // 10 + 1):06d}",
+                "title": _text(rng, 8),
+                "description": _text(rng, 20),
+                "thumbnails": _thumbnails(),
+                "channelTitle": _text(rng, 2),
+                "liveBroadcastContent": "none",
+                "publishTime": _published(rng),
+            },
+        })
+    return items
+
+
+def make_search_df(n: int, seed: int = 0, dup_rate: float = 0.2) -> pd.DataFrame:
+    """search dump snippet-lite (đầu vào của clean_search_df)."""
+    rng = random.Random(seed + 1)
+    rows = []
+    for item in make_search_items(n, seed, dup_rate):
+        s = item["snippet"]
+        rows.append({
+            "videoId": item["id"]["videoId"],
+            "title": s["title"],
+            "description": s["description"],
+            "channelId": s["channelId"],
+            "channelTitle": s["channelTitle"],
+            "publishedAt": s["publishedAt"],
+            "searchKeyword": rng.choice(KEYWORDS),
+            "crawlDate": "2025-10-01",
+        })
+    return pd.DataFrame(rows)
+
+
+# ----------------------------
+# videos.list
+# ----------------------------
+def make_video_records(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """n item giống response videos.list (snippet, contentDetails, statistics)."""
+    rng = random.Random(seed)
+    rows = []
+    for k in range(n):
+        h, m, s = rng.randint(0, 2), rng.randint(0, 59), rng.randint(0, 59)
+        duration = "PT" + (f"{h}H" if h else "") + (f"{m}M" if m else "") + f"{s}S"
+        lang = rng.choice(LANGS)
+        snippet = {
+            "publishedAt": _published(rng),
+            "channelId": f"UC{rng.randint(0, n // 10 + 1):06d}",
+            "title": f"AI video {k} " + _text(rng, 6),
+            "description": _text(rng, 40),
+            "thumbnails": _thumbnails(),
+            "channelTitle": _text(rng, 2),
+            "tags": [f"tag{j}" for j in range(rng.randint(0, 6))] or None,
+            "categoryId": rng.choice(["22", "27", "28"]),
+            "liveBroadcastContent": "none",
+            "localized": {"title": f"AI video {k}", "description": "..."},
+        }
+        if lang:
+            snippet["defaultLanguage"] = lang
+        rows.append({
+            "kind": "youtube#video",
+            "etag": f"etag{k}",
+            "id": f"vid{k:08d}",
+            "snippet": snippet,
+            "contentDetails": {
+                "duration": duration,
+                "dimension": "2d",
+                "definition": "hd",
+                "caption": rng.choice(["true", "false"]),
+                "licensedContent": True,
+                "projection": "rectangular",
+            },
+            "statistics": {
+                "viewCount": str(rng.randint(0, 10**6)),
+                "likeCount": str(rng.randint(0, 10**4)),
+                "favoriteCount": "0",
+                "commentCount": str(rng.randint(0, 10**3)),
+            },
+        })
+    return rows
+
+
+def make_video_items(n: int, seed: int = 0) -> pd.DataFrame:
+    """videos.list dạng DataFrame (như read_latest_json_from_gcs trả về)."""
+    return pd.DataFrame(make_video_records(n, seed))
+
+
+# ----------------------------
+# channels.list
+# ----------------------------
+def make_channel_records(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """n item giống response channels.list (snippet, statistics, contentDetails, topicDetails)."""
+    rng = random.Random(seed)
+    rows = []
+    for k in range(n):
+        lang = rng.choice(LANGS)
+        country = rng.choice(COUNTRIES)
+        snippet = {
+            "title": _text(rng, 3),
+            "description": _text(rng, 30),
+            "customUrl": f"@channel{k}",
+            "publishedAt": _published(rng),
+            "thumbnails": _thumbnails(),
+            "localized": {"title": "x", "description": "y"},
+        }
+        if lang:
+            snippet["defaultLanguage"] = lang
+        if country:
+            snippet["country"] = country
+        rows.append({
+            "kind": "youtube#channel",
+            "etag": f"etag{k}",
+            "id": f"UC{k:06d}",
+            "snippet": snippet,
+            "contentDetails": {"relatedPlaylists": {"likes": "", "uploads": f"UU{k:06d}"}},
+            "statistics": {
+                "viewCount": str(rng.randint(0, 10**8)),
+                "subscriberCount": str(rng.randint(0, 10**6)),
+                "hiddenSubscriberCount": False,
+                "videoCount": str(rng.randint(0, 5000)),
+            },
+            "topicDetails": {
+                "topicIds": ["/m/07c1v"],
+                "topicCategories": rng.sample(TOPICS, rng.randint(1, 3)),
+            },
+        })
+    return rows
+
+
+def make_channel_items(n: int, seed: int = 0) -> pd.DataFrame:
+    return pd.DataFrame(make_channel_records(n, seed))
+
+
+# ----------------------------
+# transcripts
+# ----------------------------
+def make_transcripts(n: int, segments: int = 200, seed: int = 0) -> List[List[Dict[str, Any]]]:
+    """n transcript, mỗi cái ~segments đoạn {text, start, duration} (như youtube_transcript_api)."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        t = 0.0
+        segs = []
+        for _ in range(max(1, int(rng.gauss(segments, segments / 4)))):
+            d = round(rng.uniform(1.0, 6.0), 2)
+            segs.append({"text": _text(rng, rng.randint(4, 12)), "start": round(t, 2), "duration": d})
+            t += d
+        out.append(segs)
+    return out
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable, Optional, Set, Tuple
+
+import pandas as pd
+from google.cloud import bigquery
+
+
+# Preprocess theo batch: raw dump đọc thành từng DataFrame ≤ batch_size dòng (gcp_io.iter_latest_json_batches),
+# mỗi batch phẳng + làm sạch rồi nạp staging ngay → bộ nhớ ~ O(batch_size), không phụ thuộc kích thước file.
+# Chỉ giữ lại tập id đã ghi để bỏ trùng giữa các batch.
+
+# batch đầu overwrite, các batch sau append (cho phép thêm cột mới xuất hiện ở batch sau)
+APPEND_OPTIONS = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+
+# load(df, write_mode, part, schema_update_options)
+Loader = Callable[[pd.DataFrame, str, int, Optional[list]], Any]
+
+
+class IdDeduper:
+    """Giữ bản đầu tiên của mỗi id trên toàn bộ các batch (giống drop_duplicates(keep='first') cả file)."""
+
+    def __init__(self, key: str = "id"):
+        self.key = key
+        self.seen: Set[Any] = set()
+        self.dropped = 0
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.key not in df.columns or df.empty:
+            return df
+        keep = ~df[self.key].isin(self.seen) & ~df[self.key].duplicated(keep="first")
+        self.dropped += int((~keep).sum())
+        df = df[keep]
+        self.seen.update(df[self.key].tolist())
+        return df
+
+
+def drop_all_null_columns(df: pd.DataFrame, keep: Iterable[str] = ("id",)) -> pd.DataFrame:
+    """
+    Bỏ cột toàn NULL trong batch: pandas đoán kiểu (float/object) khác nhau giữa các batch
+    → lỗi schema khi append. Cột đó sẽ được thêm ở batch đầu tiên có giá trị.
+    """
+    keep = set(keep)
+    empty = [c for c in df.columns if c not in keep and df[c].isna().all()]
+    return df.drop(columns=empty) if empty else df
+
+
+def run_chunked(
+    batches: Iterable[pd.DataFrame],
+    preprocess: Callable[[pd.DataFrame], pd.DataFrame],
+    load: Loader,
+    key: str = "id",
+    on_empty: Optional[Callable[[], Any]] = None,
+) -> Tuple[int, int, int]:
+    """
+    preprocess từng batch → bỏ id đã ghi ở batch trước → load (batch đầu overwrite, sau đó append).
+    Không batch nào có dòng → không có lần overwrite nào: gọi on_empty (vd làm rỗng staging)
+    để MERGE sau đó không gộp lại dữ liệu của lần chạy trước.
+    Trả về (rows_in, rows_out, số batch đã ghi).
+    """
+    dedup = IdDeduper(key)
+    rows_in = rows_out = parts = 0
+    for raw in batches:
+        rows_in += len(raw)
+        df = dedup.filter(preprocess(raw))
+        del raw
+        if df.empty:
+            continue
+        df = drop_all_null_columns(df, keep=(key,))
+        if parts == 0:
+            load(df, "overwrite", parts, None)
+        else:
+            load(df, "append", parts, APPEND_OPTIONS)
+        parts += 1
+        rows_out += len(df)
+        print(f"🧩 Batch {parts}: {rows_out} dòng đã ghi / {rows_in} dòng đọc (bỏ trùng {dedup.dropped})")
+    if parts == 0 and on_empty is not None:
+        print(f"💤 Không có dòng nào sau tiền xử lý ({rows_in} dòng đọc).")
+        on_empty()
+    return rows_in, rows_out, parts
@@ -39,6 +39,53 @@ class EnvConfig:
     #Credentials
     credentials: str   # Path to service account JSON
 
+    #Parquet staging
+    parquet_staging: str = ""  # GCS path to Parquet staging files ("" = load DataFrame trực tiếp)
+
+    #Quota
+    daily_quota_units: int = 10000   # YouTube Data API units/ngày
+    quota_state_file: str = ""       # File lưu units đã dùng trong ngày (mặc định .cache/quota_state.json)
+
+    #API response cache
+    api_cache_dir: str = ""          # Thư mục cache etag (mặc định .cache/api_responses)
+    api_cache_max_mb: int = 512      # Dung lượng tối đa, vượt quá thì loại LRU
+
+    #Discovery ("search" | "uploads": playlist uploads của channel đang theo dõi | "both")
+    discovery_mode: str = "search"
+    uploads_max_pages: int = 1       # Số trang (50 video) tối đa mỗi uploads playlist mỗi lần chạy
+    seen_index_file: str = ""        # Index videoId đã thấy qua các lần chạy (mặc định .cache/seen_videos.npy)
+    search_min_new_fraction: float = 0.2  # Dừng phân trang keyword khi tỉ lệ video mới / trang thấp hơn
+
+    #Stats refresh scheduler
+    refresh_state_file: str = ""     # Trạng thái refresh từng video (mặc định .cache/refresh_state.json)
+    refresh_max_calls: int = 200     # Số request videos.list tối đa mỗi lần chạy (50 video/request)
+
+    #Channel crawl TTL
+    channel_state_file: str = ""     # Index last-crawled từng channel (mặc định .cache/channel_state.json)
+    channel_ttl_hours: float = 168.0 # TTL kênh nhỏ; kênh nhiều subscriber TTL ngắn hơn
+
+    #Language detection
+    lang_cache_file: str = ""        # Cache kết quả detect (mặc định .cache/lang_cache.sqlite)
+    lang_max_chars: int = 1000       # Chỉ detect trên prefix dài tối đa n ký tự
+
+    #Backend ("gcp" | "local": filesystem + SQLite thay GCS/BigQuery, để chạy/benchmark offline)
+    storage_backend: str = "gcp"
+    local_backend_dir: str = ""      # Thư mục dữ liệu backend local (mặc định .cache/local_backend)
+
+    #Preprocess theo batch (giới hạn bộ nhớ theo số dòng/batch thay vì kích thước file)
+    preprocess_batch_rows: int = 0   # 0 = xử lý cả file một lần
+
+    #Metrics (run report JSON + Prometheus textfile)
+    metrics_dir: str = ""            # mặc định .cache/metrics
+
+    #Stats history (append-only, partition theo crawl_date; "" = tắt)
+    video_stats_history_table: str = ""     # bảng history video trong DATASET (+ <tên>_latest)
+    channel_stats_history_table: str = ""   # bảng history channel trong DATASET (+ <tên>_latest)
+
+    #Caption checkpoint
+    caption_flush_rows: int = 200    # Ghi BigQuery sau mỗi n transcript
+    caption_flush_mb: float = 32.0   # ... hoặc khi buffer vượt n MB
+
 
 def load_env(env_file: Optional[Path] = path) -> EnvConfig:
     """
@@ -54,14 +101,20 @@ def load_env(env_file: Optional[Path] = path) -> EnvConfig:
     api = os.getenv("API_KEY_YTB")
     project_id = os.getenv("PROJECT_ID")
     credentials = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    storage_backend = os.getenv("STORAGE_BACKEND", "gcp")
 
     if not api:
         raise EnvironmentError("Missing API_KEY_YTB in .env (YouTube API key)")
-    if not project_id or not credentials:
+    if storage_backend == "local":
+        # backend offline: không cần credentials GCP
+        project_id = project_id or "local"
+        credentials = credentials or ""
+    elif not project_id or not credentials:
         raise EnvironmentError("Missing PROJECT_ID or GOOGLE_APPLICATION_CREDENTIALS in .env")
 
     # export để google.cloud nhận
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials
+    if credentials:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials
 
     return EnvConfig(
         api=api,
@@ -71,6 +124,7 @@ def load_env(env_file: Optional[Path] = path) -> EnvConfig:
         detailed_video_info=os.getenv("DETAILED_VIDEO_INFO", ""),
         channel_raw_info=os.getenv("CHANNEL_RAW_INFO", ""),
         video_captions=os.getenv("VIDEO_CAPTIONS", ""),
+        parquet_staging=os.getenv("PARQUET_STAGING", ""),
 
         clean_dataset=os.getenv("DATASET", ""),
         video_info_table=os.getenv("VIDEO_INFO_TABLE", ""),
@@ -84,4 +138,37 @@ def load_env(env_file: Optional[Path] = path) -> EnvConfig:
 
 
         credentials=credentials,
+
+        daily_quota_units=int(os.getenv("DAILY_QUOTA_UNITS", "10000")),
+        quota_state_file=os.getenv("QUOTA_STATE_FILE", ""),
+
+        api_cache_dir=os.getenv("API_CACHE_DIR", ""),
+        api_cache_max_mb=int(os.getenv("API_CACHE_MAX_MB", "512")),
+
+        discovery_mode=os.getenv("DISCOVERY_MODE", "search"),
+        uploads_max_pages=int(os.getenv("UPLOADS_MAX_PAGES", "1")),
+        seen_index_file=os.getenv("SEEN_INDEX_FILE", ""),
+        search_min_new_fraction=float(os.getenv("SEARCH_MIN_NEW_FRACTION", "0.2")),
+
+        refresh_state_file=os.getenv("REFRESH_STATE_FILE", ""),
+        refresh_max_calls=int(os.getenv("REFRESH_MAX_CALLS", "200")),
+
+        channel_state_file=os.getenv("CHANNEL_STATE_FILE", ""),
+        channel_ttl_hours=float(os.getenv("CHANNEL_TTL_HOURS", "168")),
+
+        lang_cache_file=os.getenv("LANG_CACHE_FILE", ""),
+        lang_max_chars=int(os.getenv("LANG_MAX_CHARS", "1000")),
+
+        storage_backend=storage_backend,
+        local_backend_dir=os.getenv("LOCAL_BACKEND_DIR", ""),
+
+        preprocess_batch_rows=int(os.getenv("PREPROCESS_BATCH_ROWS", "0")),
+
+        metrics_dir=os.getenv("METRICS_DIR", ""),
+
+        video_stats_history_table=os.getenv("VIDEO_STATS_HISTORY_TABLE", ""),
+        channel_stats_history_table=os.getenv("CHANNEL_STATS_HISTORY_TABLE", ""),
+
+        caption_flush_rows=int(os.getenv("CAPTION_FLUSH_ROWS", "200")),
+        caption_flush_mb=float(os.getenv("CAPTION_FLUSH_MB", "32")),
     )
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import ast
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:   # orjson không bắt buộc; thiếu thì dùng json chuẩn (chậm hơn ~3-5 lần)
+    orjson = None
+
+
+# Phẳng response YouTube theo spec khai báo trước: chỉ lấy đúng các path cần (snippet.title,
+# statistics.viewCount, ...) vào mảng theo cột trong 1 lượt; không json_normalize mọi field
+# (thumbnails, localized, ...) rồi drop. Thời gian / bộ nhớ tỉ lệ với số cột giữ lại.
+
+_MISSING = object()
+_NA = float("nan")    # giá trị cho path không có trong record (json_normalize cũng điền NaN)
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON (str | bytes) bằng orjson nếu có."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_json_cell(val: Any) -> Any:
+    """
+    Ô dạng chuỗi JSON → dict/list; đã là dict/list thì giữ nguyên; NA / không parse được → None.
+    Chuỗi kiểu repr Python (str(dict) từ CSV cũ) đọc bằng ast.literal_eval, không dùng eval.
+    """
+    if isinstance(val, (dict, list)):
+        return val
+    if isinstance(val, (str, bytes)):
+        try:
+            return loads(val)
+        except ValueError:
+            try:
+                return ast.literal_eval(val if isinstance(val, str) else val.decode("utf-8"))
+            except (ValueError, SyntaxError, UnicodeDecodeError):
+                return None
+    return None
+
+
+@dataclass(frozen=True)
+class Field:
+    column: str
+    path: Tuple[str, ...]
+    kind: Optional[str] = None    # None: giữ nguyên giá trị | "number": pd.to_numeric(errors='coerce')
+
+
+KINDS = (None, "number")
+
+
+def field(path: str, column: Optional[str] = None, kind: Optional[str] = None) -> Field:
+    """
+    field("statistics.viewCount", kind="number") → cột 'viewCount'.
+    Tên cột mặc định = path bỏ cấp đầu (giống json_normalize trên từng cột lớn),
+    vd contentDetails.regionRestriction.blocked → 'regionRestriction.blocked'.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"❌ Unknown field kind: {kind}")
+    parts = tuple(path.split("."))
+    return Field(column or ".".join(parts[1:] or parts), parts, kind)
+
+
+def _walk(obj: Any, path: Sequence[str]) -> Any:
+    for key in path:
+        if isinstance(obj, (str, bytes)):
+            obj = parse_json_cell(obj)
+        if not isinstance(obj, dict):
+            return _MISSING
+        obj = obj.get(key, _MISSING)
+        if obj is _MISSING:
+            return _MISSING
+    return obj
+
+
+def _group_by_top(fields: Sequence[Field]) -> Dict[str, List[Field]]:
+    groups: Dict[str, List[Field]] = {}
+    for f in fields:
+        groups.setdefault(f.path[0], []).append(f)
+    return groups
+
+
+def _build_frame(
+    columns: Dict[str, List[Any]],
+    present: set,
+    fields: Sequence[Field],
+    index: Optional[pd.Index] = None,
+) -> pd.DataFrame:
+    """
+    Chỉ giữ cột có path xuất hiện ở ít nhất 1 record (như json_normalize: key không có ở đâu → không có cột).
+    Không có record nào → frame rỗng đủ mọi cột trong fields (bước sau không lỗi thiếu cột).
+    """
+    n = len(index) if index is not None else max((len(v) for v in columns.values()), default=0)
+    data = {}
+    for f in fields:
+        if f.column in present:
+            values = columns[f.column]
+        elif n == 0:
+            data[f.column] = pd.Series([], index=index, dtype="float64" if f.kind == "number" else object)
+            continue
+        else:
+            continue
+        if f.kind == "number":
+            values = pd.to_numeric(pd.Series(values, index=index, dtype=object), errors="coerce")
+        data[f.column] = values
+    return pd.DataFrame(data, index=index)
+
+
+def flatten_frame(df: pd.DataFrame, fields: Sequence[Field]) -> pd.DataFrame:
+    """
+    DataFrame có các cột lớn dạng dict / chuỗi JSON (snippet, statistics, ...) → DataFrame phẳng
+    chỉ gồm các cột trong fields. Mỗi ô chỉ parse 1 lần; cột top-level (vd id) lấy nguyên.
+    """
+    n = len(df)
+    columns: Dict[str, List[Any]] = {}
+    present = set()
+    for top, group in _group_by_top(fields).items():
+        if top not in df.columns:
+            continue
+        if any(len(f.path) == 1 for f in group):
+            for f in group:
+                if len(f.path) == 1:
+                    columns[f.column] = df[top].tolist()
+                    present.add(f.column)
+        nested = [(f.column, f.path[1:]) for f in group if len(f.path) > 1]
+        if not nested:
+            continue
+        for col, _ in nested:
+            columns[col] = [_NA] * n
+        for i, cell in enumerate(df[top].tolist()):
+            obj = parse_json_cell(cell)
+            if obj is None:
+                continue
+            for col, rest in nested:
+                v = _walk(obj, rest)
+                if v is not _MISSING:
+                    columns[col][i] = v
+                    present.add(col)
+    return _build_frame(columns, present, fields, index=df.index)
+
+
+def flatten_records(records: Iterable[Any], fields: Sequence[Field]) -> pd.DataFrame:
+    """Như flatten_frame nhưng đọc thẳng từ records (dict hoặc dòng JSON str/bytes), không dựng DataFrame trung gian."""
+    columns: Dict[str, List[Any]] = {f.column: [] for f in fields}
+    present = set()
+    for rec in records:
+        obj = parse_json_cell(rec)
+        for f in fields:
+            v = _walk(obj, f.path)
+            if v is _MISSING:
+                v = _NA
+            else:
+                present.add(f.column)
+            columns[f.column].append(v)
+    return _build_frame(columns, present, fields)
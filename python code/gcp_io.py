@@ -1,23 +1,142 @@
 from __future__ import annotations
 
+import io
 import os
 import json
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+import gzip
+import threading
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
 
 import pandas as pd
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage, bigquery
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from requests.adapters import HTTPAdapter
+
+import flatten
+import local_backend
+import metrics
 
 
 
 # ----------------------------
 # ENV / CLIENTS
 # ----------------------------
+# Registry client dùng chung trong process: key = (loại, project, location).
+# Client tạo lazy 1 lần, tái sử dụng credentials + HTTP connection pool.
+CLOUD_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+_clients: Dict[Tuple[str, Optional[str], Optional[str]], Any] = {}
+_sessions: List[AuthorizedSession] = []
+_clients_lock = threading.Lock()
+_pool_size: Optional[int] = None   # None → GCP_HTTP_POOL_SIZE trong .env (mặc định 32)
+_client_stats = {"storage_created": 0, "bq_created": 0, "registry_hits": 0}
+
+# Backend: "gcp" (mặc định) hoặc "local" (filesystem + SQLite, xem local_backend.py)
+BACKENDS = ("gcp", "local")
+_backend: Optional[str] = None      # None → STORAGE_BACKEND trong .env
+_local_root: Optional[str] = None   # None → LOCAL_BACKEND_DIR trong .env (mặc định .cache/local_backend)
+
+
+def configure_backend(backend: str, local_root: Optional[str] = None) -> None:
+    """Chọn backend cho mọi helper (ưu tiên hơn STORAGE_BACKEND); reset registry client."""
+    global _backend, _local_root
+    if backend not in BACKENDS:
+        raise ValueError(f"❌ Invalid backend: {backend}. Must be one of {BACKENDS}.")
+    _backend, _local_root = backend, local_root or None
+    reset_clients()
+
+
+def backend_name() -> str:
+    return _backend or os.getenv("STORAGE_BACKEND", "gcp")
+
+
+def is_local() -> bool:
+    return backend_name() == "local"
+
+
+def configure_clients(pool_size: int) -> None:
+    """Đặt kích thước HTTP connection pool cho các client tạo sau đó (ưu tiên hơn GCP_HTTP_POOL_SIZE)."""
+    global _pool_size
+    _pool_size = pool_size
+
+
+def _pooled_session() -> Tuple[Any, AuthorizedSession]:
+    credentials, _ = google.auth.default(scopes=CLOUD_SCOPES)
+    session = AuthorizedSession(credentials)
+    pool_size = _pool_size or int(os.getenv("GCP_HTTP_POOL_SIZE", "32"))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    metrics.instrument_session(session, "gcp")
+    _sessions.append(session)
+    return credentials, session
+
+
+def _get_client(kind: str, project_id: Optional[str], location: Optional[str]) -> Any:
+    key = (kind, project_id, location)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _client_stats["registry_hits"] += 1
+            return client
+
+        if is_local():
+            root = _local_root or os.getenv("LOCAL_BACKEND_DIR") or local_backend.DEFAULT_ROOT
+            if kind == "storage":
+                client = local_backend.LocalStorageClient(root, project_id)
+            else:
+                client = local_backend.LocalBigQueryClient(root, project_id, location)
+            _client_stats[f"{kind}_created"] += 1
+            _clients[key] = client
+            return client
+
+        credentials, session = _pooled_session()
+        if kind == "storage":
+            kwargs = {"project": project_id} if project_id else {}
+            client = storage.Client(credentials=credentials, _http=session, **kwargs)
+        else:
+            client = bigquery.Client(project=project_id, location=location, credentials=credentials, _http=session)
+        _client_stats[f"{kind}_created"] += 1
+        _clients[key] = client
+        return client
+
+
 def get_storage_client(project_id: Optional[str] = None) -> storage.Client:
-    return storage.Client(project=project_id) if project_id else storage.Client()
+    return _get_client("storage", project_id, None)
 
 def get_bq_client(project_id: Optional[str] = None, location: Optional[str] = None) -> bigquery.Client:
-    return bigquery.Client(project=project_id, location=location) if (project_id or location) else bigquery.Client()
+    return _get_client("bq", project_id, location)
+
+def client_stats() -> Dict[str, int]:
+    """
+    Số client đã tạo / lần lấy lại từ registry, và số request HTTP so với số kết nối TCP
+    mở mới (connections_reused = requests - connections).
+    """
+    requests_, connections = 0, 0
+    for session in _sessions:
+        for adapter in session.adapters.values():
+            for pool in list(adapter.poolmanager.pools._container.values()):
+                requests_ += pool.num_requests
+                connections += pool.num_connections
+    return {
+        **_client_stats,
+        "http_requests": requests_,
+        "http_connections": connections,
+        "connections_reused": requests_ - connections,
+    }
+
+def reset_clients() -> None:
+    """Đóng và xoá mọi client trong registry (vd sau fork hoặc khi đổi credentials)."""
+    with _clients_lock:
+        for session in _sessions:
+            session.close()
+        local_backend.close_connections()
+        _clients.clear()
+        _sessions.clear()
 
 def ensure_dataset(client: bigquery.Client, dataset_id: str, location: Optional[str] = None) -> None:
     ds_ref = f"{client.project}.{dataset_id}"
@@ -33,34 +152,244 @@ def ensure_dataset(client: bigquery.Client, dataset_id: str, location: Optional[
 def list_gcs_uris(bucket: str, prefix: str, project_id: Optional[str] = None) -> List[str]:
     cli = get_storage_client(project_id)
     bkt = cli.bucket(bucket)
-    return [f"gs://{bucket}/{b.name}" for b in bkt.list_blobs(prefix=prefix)]
+    return [f"gs://{bucket}/{b.name}" for b in bkt.list_blobs(prefix=prefix) if not b.name.endswith(MANIFEST_NAME)]
 
 def read_latest_json_from_gcs(bucket: str, prefix: str, project_id: Optional[str] = None, today_only: bool = False) -> pd.DataFrame:
+    """Đọc file mới nhất dưới prefix (tra qua manifest, không list toàn bộ lịch sử)."""
+    entry = latest_manifest_entry(bucket, prefix, project_id, today_only=today_only)
+    return read_raw_file_from_gcs(bucket, entry["path"], project_id)
+
+def iter_latest_json_batches(bucket: str, prefix: str, batch_size: int, project_id: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Như read_latest_json_from_gcs nhưng yield từng DataFrame tối đa batch_size dòng
+    (file .ndjson.gz đọc stream; file .json cũ phải đọc cả mảng rồi mới chia).
+    """
+    path = latest_manifest_entry(bucket, prefix, project_id)["path"]
+    if path.endswith(NDJSON_GZ_SUFFIX):
+        records = iter_ndjson_from_gcs(bucket, path, project_id)
+    else:
+        records = iter(read_raw_file_from_gcs(bucket, path, project_id).to_dict("records"))
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield pd.DataFrame.from_records(batch)
+
+def read_raw_file_from_gcs(bucket: str, path: str, project_id: Optional[str] = None) -> pd.DataFrame:
+    if path.endswith(NDJSON_GZ_SUFFIX):
+        return pd.DataFrame.from_records(iter_ndjson_from_gcs(bucket, path, project_id))
+    # file .json cũ (1 mảng JSON)
     cli = get_storage_client(project_id)
-    bkt = cli.bucket(bucket)
-    
-    blobs = list(bkt.list_blobs(prefix=prefix))
-    if not blobs:
-        raise FileNotFoundError(f"No blobs under gs://{bucket}/{prefix}")
-    if today_only:
-        from datetime import date
-        blobs = [b for b in blobs if b.time_created.date() == date.today()]
-        if not blobs:
-            raise FileNotFoundError("No blobs created today.")
-    blob = max(blobs, key=lambda b: b.time_created)
-    txt = blob.download_as_text(encoding="utf-8")
-    data = json.loads(txt)
+    raw = cli.bucket(bucket).blob(path).download_as_bytes()
+    metrics.add_gcs_bytes(read=len(raw))
+    data = flatten.loads(raw)
     return pd.DataFrame(data)
 
-def upload_json_to_gcs(bucket: str, path: str, data: Any, project_id: Optional[str] = None, content_type: str = "application/json; charset=utf-8") -> str:
+
+# ----------------------------
+# NDJSON (gzip, streaming)
+# ----------------------------
+NDJSON_GZ_SUFFIX = ".ndjson.gz"
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024   # bội số của 256 KB (yêu cầu của resumable upload)
+
+
+class _CountingWriter:
+    """Bọc file-object ghi, đếm số byte (đã nén) thực sự gửi lên."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.nbytes = 0
+
+    def write(self, b) -> int:
+        self.nbytes += len(b)
+        return self.raw.write(b)
+
+    def flush(self) -> None:
+        pass
+
+
+def upload_ndjson_to_gcs(
+    bucket: str,
+    path: str,
+    records: Iterable[Any],
+    project_id: Optional[str] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    manifest_prefix: Optional[str] = None,
+) -> str:
+    """
+    Ghi records dạng newline-delimited JSON, nén gzip, stream lên GCS bằng resumable upload.
+    records có thể là generator → bộ nhớ chỉ giữ 1 chunk, không phụ thuộc kích thước crawl.
+    manifest_prefix: nếu có, ghi file vào manifest của prefix đó (rows, bytes).
+    """
     cli = get_storage_client(project_id)
     bkt = cli.bucket(bucket)
     blob = bkt.blob(path)
-    payload = json.dumps(data, ensure_ascii=False, indent=2, default=str).encode("utf-8")
-    blob.upload_from_string(payload, content_type=content_type)
+    rows = 0
+    with blob.open("wb", chunk_size=chunk_size, ignore_flush=True, content_type="application/gzip") as raw:
+        counter = _CountingWriter(raw)
+        with gzip.GzipFile(fileobj=counter, mode="wb") as gz:
+            for rec in records:
+                gz.write(json.dumps(rec, ensure_ascii=False, default=str).encode("utf-8"))
+                gz.write(b"\n")
+                rows += 1
+    metrics.add_gcs_bytes(written=counter.nbytes)
+    print(f"✅ Uploaded {rows} rows → gs://{bucket}/{path}")
+    if manifest_prefix is not None:
+        register_in_manifest(bucket, manifest_prefix, path, rows=rows, nbytes=counter.nbytes, project_id=project_id)
     return f"gs://{bucket}/{path}"
 
 
+def iter_ndjson_from_gcs(bucket: str, path: str, project_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Đọc stream 1 file .ndjson.gz trên GCS, yield từng record (parse bytes bằng orjson nếu có)."""
+    cli = get_storage_client(project_id)
+    blob = cli.bucket(bucket).blob(path)
+    with blob.open("rb") as raw, gzip.open(raw, "rb") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield flatten.loads(line)
+        finally:
+            metrics.add_gcs_bytes(read=raw.tell())
+
+
+# ----------------------------
+# PARQUET (staging layer)
+# ----------------------------
+PARQUET_SUFFIX = ".parquet"
+
+
+def upload_parquet_to_gcs(
+    df: pd.DataFrame,
+    bucket: str,
+    path: str,
+    project_id: Optional[str] = None,
+    compression: str = "snappy",
+    manifest_prefix: Optional[str] = None,
+) -> str:
+    """Ghi DataFrame dạng Parquet (columnar) lên GCS; dùng làm staging cho load_gcs_to_bq."""
+    buf = io.BytesIO()
+    df.to_parquet(buf, engine="pyarrow", compression=compression, index=False)
+    nbytes = buf.tell()
+    buf.seek(0)
+
+    cli = get_storage_client(project_id)
+    blob = cli.bucket(bucket).blob(path)
+    blob.upload_from_file(buf, size=nbytes, content_type="application/vnd.apache.parquet")
+    metrics.add_gcs_bytes(written=nbytes)
+    print(f"✅ Uploaded Parquet {len(df)} rows ({nbytes} bytes) → gs://{bucket}/{path}")
+    if manifest_prefix is not None:
+        register_in_manifest(bucket, manifest_prefix, path, rows=len(df), nbytes=nbytes, project_id=project_id)
+    return f"gs://{bucket}/{path}"
+
+
+# ----------------------------
+# MANIFEST (index các file raw theo prefix)
+# ----------------------------
+MANIFEST_NAME = "_manifest.json"
+
+
+def manifest_path(prefix: str) -> str:
+    return f"{prefix}{MANIFEST_NAME}"
+
+
+def _manifest_from_listing(bkt: storage.Bucket, prefix: str) -> Dict[str, Any]:
+    files = [
+        {"path": b.name, "created": b.time_created.isoformat(), "rows": None, "bytes": b.size}
+        for b in bkt.list_blobs(prefix=prefix)
+        if not b.name.endswith(MANIFEST_NAME)
+    ]
+    files.sort(key=lambda f: f["created"])
+    return {"prefix": prefix, "files": files}
+
+
+def rebuild_manifest(bucket: str, prefix: str, project_id: Optional[str] = None) -> Dict[str, Any]:
+    """Fallback: dựng lại manifest từ list_blobs (rows = None với các file cũ)."""
+    cli = get_storage_client(project_id)
+    bkt = cli.bucket(bucket)
+    manifest = _manifest_from_listing(bkt, prefix)
+    bkt.blob(manifest_path(prefix)).upload_from_string(
+        json.dumps(manifest, ensure_ascii=False), content_type="application/json; charset=utf-8"
+    )
+    print(f"🔁 Rebuilt manifest gs://{bucket}/{manifest_path(prefix)} ({len(manifest['files'])} files)")
+    return manifest
+
+
+def load_manifest(bucket: str, prefix: str, project_id: Optional[str] = None) -> Dict[str, Any]:
+    """Đọc manifest của prefix (1 request); chưa có hoặc rỗng thì rebuild từ listing."""
+    cli = get_storage_client(project_id)
+    blob = cli.bucket(bucket).blob(manifest_path(prefix))
+    try:
+        manifest = json.loads(blob.download_as_text(encoding="utf-8"))
+    except NotFound:
+        return rebuild_manifest(bucket, prefix, project_id)
+    if not manifest.get("files"):
+        return rebuild_manifest(bucket, prefix, project_id)
+    return manifest
+
+
+def register_in_manifest(
+    bucket: str,
+    prefix: str,
+    path: str,
+    rows: Optional[int],
+    nbytes: Optional[int],
+    project_id: Optional[str] = None,
+    max_retries: int = 5,
+) -> None:
+    """
+    Thêm 1 file vào manifest của prefix. Ghi có điều kiện theo generation
+    để 2 stage upload cùng lúc không ghi đè mất entry của nhau.
+    """
+    cli = get_storage_client(project_id)
+    bkt = cli.bucket(bucket)
+    entry = {"path": path, "created": datetime.now(timezone.utc).isoformat(), "rows": rows, "bytes": nbytes}
+
+    for _ in range(max_retries):
+        blob = bkt.get_blob(manifest_path(prefix))
+        if blob is None:
+            generation = 0   # chỉ tạo mới nếu chưa tồn tại
+            manifest = _manifest_from_listing(bkt, prefix)
+        else:
+            generation = blob.generation
+            manifest = json.loads(blob.download_as_text(encoding="utf-8", if_generation_match=generation))
+
+        manifest["files"] = [f for f in manifest.get("files", []) if f["path"] != path] + [entry]
+        try:
+            bkt.blob(manifest_path(prefix)).upload_from_string(
+                json.dumps(manifest, ensure_ascii=False),
+                content_type="application/json; charset=utf-8",
+                if_generation_match=generation,
+            )
+            return
+        except PreconditionFailed:
+            continue
+    raise RuntimeError(f"❌ Không cập nhật được manifest gs://{bucket}/{manifest_path(prefix)} sau {max_retries} lần thử.")
+
+
+def latest_manifest_entry(bucket: str, prefix: str, project_id: Optional[str] = None, today_only: bool = False) -> Dict[str, Any]:
+    """Entry mới nhất trong manifest (thay cho list_blobs + max(time_created))."""
+    files = load_manifest(bucket, prefix, project_id)["files"]
+    if not files:
+        raise FileNotFoundError(f"No blobs under gs://{bucket}/{prefix}")
+    if today_only:
+        files = [f for f in files if datetime.fromisoformat(f["created"]).date() == date.today()]
+        if not files:
+            raise FileNotFoundError("No blobs created today.")
+    return max(files, key=lambda f: f["created"])
+
+
+def manifest_entries_between(
+    bucket: str,
+    prefix: str,
+    start: date,
+    end: date,
+    project_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Các file tạo trong khoảng ngày [start, end] (theo manifest)."""
+    files = load_manifest(bucket, prefix, project_id)["files"]
+    return [f for f in files if start <= datetime.fromisoformat(f["created"]).date() <= end]
+
+
 # ----------------------------
 # BIGQUERY HELPERS
 # ----------------------------
@@ -75,45 +404,110 @@ class BQTarget:
     def fqtn(self) -> str:
         return f"{self.project_id}.{self.dataset}.{self.table}"
 
+def _write_disposition(write_mode: str) -> str:
+    # Map write_mode string -> BigQuery WriteDisposition
+    if write_mode == "append":
+        return bigquery.WriteDisposition.WRITE_APPEND
+    elif write_mode == "overwrite":
+        return bigquery.WriteDisposition.WRITE_TRUNCATE
+    elif write_mode == "empty":
+        return bigquery.WriteDisposition.WRITE_EMPTY
+    raise ValueError(f"❌ Invalid write_mode: {write_mode}. Must be 'append', 'overwrite', or 'empty'.")
+
 def write_df_to_bq(
     df: pd.DataFrame,
     target: BQTarget,
     write_mode: str,
     autodetect: bool = True,
     schema: Optional[List[bigquery.SchemaField]] = None,
+    schema_update_options: Optional[List[str]] = None,
+    partition_field: Optional[str] = None,
+    clustering_fields: Optional[List[str]] = None,
 ) -> None:
     """
     Ghi một DataFrame vào BigQuery table (theo target).
     Mặc định: append, autodetect schema.
+    schema_update_options: vd [ALLOW_FIELD_ADDITION] khi append batch có thêm cột.
+    partition_field / clustering_fields: partition theo ngày / cluster khi load tạo bảng mới.
     """
-    client = bigquery.Client(project=target.project_id, location=target.location)
+    client = get_bq_client(target.project_id, target.location)
     ensure_dataset(client, target.dataset, target.location)
 
-    # Map write_mode string -> BigQuery WriteDisposition
-    if write_mode == "append":
-        write_disposition = bigquery.WriteDisposition.WRITE_APPEND
-    elif write_mode == "overwrite":
-        write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
-    elif write_mode == "empty":
-        write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
-    else:
-        raise ValueError(f"❌ Invalid write_mode: {write_mode}. Must be 'append', 'overwrite', or 'empty'.")
-
-
+    write_disposition = _write_disposition(write_mode)
 
     job_cfg = bigquery.LoadJobConfig(
         write_disposition=write_disposition,
         autodetect=autodetect,
     )
+    if schema_update_options:
+        job_cfg.schema_update_options = schema_update_options
     if schema:
         job_cfg.schema = schema
         job_cfg.autodetect = False
+    if partition_field:
+        job_cfg.time_partitioning = bigquery.TimePartitioning(field=partition_field)
+    if clustering_fields:
+        job_cfg.clustering_fields = clustering_fields
 
     job = client.load_table_from_dataframe(df, target.fqtn, job_config=job_cfg)
     job.result()
+    metrics.record_bq_job(job)
     print(f"✅ Data uploaded to BigQuery: {target.fqtn}")
 
 
+def load_gcs_to_bq(
+    uris: List[str],
+    target: BQTarget,
+    write_mode: str,
+    source_format: str = "PARQUET",
+    schema: Optional[List[bigquery.SchemaField]] = None,
+    schema_update_options: Optional[List[str]] = None,
+) -> None:
+    """
+    Load file trên GCS (Parquet mặc định) thẳng vào BigQuery bằng load job,
+    không tải DataFrame lên từ client. uris có thể lấy từ list_gcs_uris.
+    """
+    if not uris:
+        raise ValueError("❌ uris không được rỗng.")
+    client = get_bq_client(target.project_id, target.location)
+    ensure_dataset(client, target.dataset, target.location)
+
+    job_cfg = bigquery.LoadJobConfig(
+        write_disposition=_write_disposition(write_mode),
+        source_format=source_format,
+    )
+    if schema_update_options:
+        job_cfg.schema_update_options = schema_update_options
+    if schema:
+        job_cfg.schema = schema
+    elif source_format != bigquery.SourceFormat.PARQUET:
+        job_cfg.autodetect = True
+
+    job = client.load_table_from_uri(uris, target.fqtn, job_config=job_cfg)
+    job.result()
+    metrics.record_bq_job(job)
+    print(f"✅ Loaded {len(uris)} file(s) from GCS → BigQuery: {target.fqtn} ({job.output_rows} rows)")
+
+
+def write_df_via_gcs_parquet(
+    df: pd.DataFrame,
+    target: BQTarget,
+    write_mode: str,
+    bucket: str,
+    path: str,
+    schema_update_options: Optional[List[str]] = None,
+    manifest_prefix: Optional[str] = None,
+) -> str:
+    """
+    Ghi df ra Parquet staging trên GCS rồi load thẳng vào BigQuery. Trả về URI file staging.
+    manifest_prefix: nếu có, ghi file staging vào manifest của prefix đó (như file raw).
+    """
+    uri = upload_parquet_to_gcs(df, bucket=bucket, path=path, project_id=target.project_id,
+                                manifest_prefix=manifest_prefix)
+    load_gcs_to_bq([uri], target, write_mode=write_mode, schema_update_options=schema_update_options)
+    return uri
+
+
 # def merge_tables(project_id: str, src_dataset: str, target_dataset: str ,target_table: str, staging_table: str, cols: list):
 
 #     """Merge table based on column id"""
@@ -140,6 +534,119 @@ def write_df_to_bq(
 
 from google.cloud import bigquery
 
+# Khoảng ngày liên tiếp tối đa trong predicate prune; nhiều hơn → 1 khoảng [min, max]
+MAX_PRUNE_RANGES = 100
+# Kiểu cột partition → biểu thức PARTITION BY (ngày)
+PARTITION_EXPR = {
+    "DATE": "{col}",
+    "TIMESTAMP": "DATE({col})",
+    "DATETIME": "DATETIME_TRUNC({col}, DAY)",
+}
+
+
+@dataclass
+class MergeStats:
+    staging_rows: int
+    inserted: int
+    updated: int
+    bytes_processed: Optional[int]
+
+    @property
+    def unchanged(self) -> int:
+        """Dòng staging khớp target nhưng hash cột update không đổi → bỏ qua."""
+        return max(self.staging_rows - self.inserted - self.updated, 0)
+
+
+def table_columns(project_id: str, dataset: str, table: str) -> List[str]:
+    """Danh sách cột từ metadata bảng (không chạy query INFORMATION_SCHEMA). Bảng chưa có → []."""
+    client = get_bq_client(project_id)
+    fq = f"{project_id}.{dataset}.{table}"
+    if isinstance(client, local_backend.LocalBigQueryClient):
+        return client.columns(fq)
+    try:
+        return [f.name for f in client.get_table(fq).schema]
+    except NotFound:
+        return []
+
+
+def _row_hash(alias: str, cols: List[str]) -> str:
+    fields = ", ".join(f"{alias}.{c} AS {c}" for c in cols)
+    return f"FARM_FINGERPRINT(TO_JSON_STRING(STRUCT({fields})))"
+
+
+def _date_ranges(days: List[date]) -> List[Tuple[date, date]]:
+    """Gộp các ngày (đã sort) thành khoảng liên tiếp [start, end]."""
+    ranges: List[Tuple[date, date]] = []
+    for d in days:
+        if ranges and (d - ranges[-1][1]).days <= 1:
+            ranges[-1] = (ranges[-1][0], d)
+        else:
+            ranges.append((d, d))
+    return ranges
+
+
+def partition_prune_predicate(client: bigquery.Client, staging_fq: str, partition_col: str, alias: str = "T") -> Optional[str]:
+    """
+    Predicate hằng trên cột partition của target, lấy từ các ngày có trong staging
+    → BigQuery chỉ quét các partition đó. None nếu staging rỗng.
+    """
+    field_type = next((f.field_type for f in client.get_table(staging_fq).schema if f.name == partition_col), None)
+    if field_type not in PARTITION_EXPR:
+        raise ValueError(f"❌ Cột partition {partition_col} phải là DATE/TIMESTAMP/DATETIME (đang là {field_type}).")
+    job = client.query(f"SELECT DISTINCT CAST({partition_col} AS DATE) AS d FROM `{staging_fq}`")
+    values = [r["d"] for r in job.result()]
+    metrics.record_bq_job(job)
+    days = sorted(d for d in values if d is not None)
+    has_null = len(days) < len(values)
+    if not days and not has_null:
+        return None
+
+    ranges = _date_ranges(days)
+    if len(ranges) > MAX_PRUNE_RANGES:
+        ranges = [(days[0], days[-1])]
+    col = f"{alias}.{partition_col}"
+    lit = "DATE" if field_type == "DATE" else field_type
+    conds = [
+        f"({col} >= {lit} '{start.isoformat()}' AND {col} < {lit} '{(end + timedelta(days=1)).isoformat()}')"
+        for start, end in ranges
+    ]
+    if has_null:
+        conds.append(f"{col} IS NULL")
+    return "(" + " OR ".join(conds) + ")"
+
+
+def ensure_merge_target(
+    client: bigquery.Client,
+    target_fq: str,
+    staging_fq: str,
+    all_cols: list,
+    partition_col: Optional[str] = None,
+    cluster_cols: Optional[list] = None,
+) -> None:
+    """Tạo bảng target (partition theo ngày của partition_col, cluster theo cluster_cols) nếu chưa có."""
+    try:
+        table = client.get_table(target_fq)
+        if partition_col and table.time_partitioning is None:
+            print(f"⚠️ {target_fq} chưa partition → predicate chỉ lọc, không prune được partition.")
+        return
+    except NotFound:
+        pass
+
+    ddl = [f"CREATE TABLE IF NOT EXISTS `{target_fq}`"]
+    if partition_col:
+        field_type = next((f.field_type for f in client.get_table(staging_fq).schema if f.name == partition_col), None)
+        if field_type not in PARTITION_EXPR:
+            raise ValueError(f"❌ Cột partition {partition_col} phải là DATE/TIMESTAMP/DATETIME (đang là {field_type}).")
+        ddl.append("PARTITION BY " + PARTITION_EXPR[field_type].format(col=partition_col))
+    if cluster_cols:
+        ddl.append("CLUSTER BY " + ", ".join(cluster_cols[:4]))   # BigQuery cho tối đa 4 cột cluster
+    ddl.append(f"AS SELECT {', '.join(all_cols)} FROM `{staging_fq}` WHERE FALSE")
+    job = client.query("\n".join(ddl))
+    job.result()
+    metrics.record_bq_job(job)
+    print(f"🆕 Tạo bảng {target_fq} (partition={partition_col}, cluster={cluster_cols})")
+
+
 def merge_tables(
     project_id: str,
     src_dataset: str,
@@ -147,17 +654,31 @@ def merge_tables(
     target_table: str,
     staging_table: str,
     updated_cols: list,   # chỉ update khi MATCHED
-    all_cols: list        # toàn bộ cột để INSERT khi NOT MATCHED
-) -> None:
+    all_cols: list,       # toàn bộ cột để INSERT khi NOT MATCHED
+    partition_col: Optional[str] = None,
+    cluster_cols: Optional[list] = None,
+    skip_unchanged: bool = True,
+    hash_exclude: Tuple[str, ...] = ("crawl_date",),
+) -> MergeStats:
     """MERGE từ staging vào target dựa trên khóa id.
     - updated_cols: các cột sẽ được set trong WHEN MATCHED THEN UPDATE
     - all_cols:     toàn bộ cột dùng cho INSERT khi NOT MATCHED
+    - partition_col: cột partition của target (DATE/TIMESTAMP/DATETIME), phải BẤT BIẾN theo id
+                     (vd publishedAt): ON thêm predicate hằng theo các ngày có trong staging
+                     → chỉ quét các partition đó. Không dùng cột thay đổi mỗi lần crawl (crawl_date),
+                     nếu không dòng cũ ở partition khác sẽ bị coi là NOT MATCHED và insert trùng.
+    - cluster_cols:  cột cluster khi phải tạo target mới.
+    - skip_unchanged: chỉ UPDATE khi hash các cột updated_cols (trừ hash_exclude) khác target.
+    Trả về MergeStats (số dòng insert / update thực sự, bytes đã quét).
     """
 
-    client = bigquery.Client(project=project_id)
+    client = get_bq_client(project_id)
+    target_fq = f"{project_id}.{target_dataset}.{target_table}"
+    staging_fq = f"{project_id}.{src_dataset}.{staging_table}"
 
     # Bảo vệ: loại bỏ 'id' khỏi danh sách update (nếu có)
     cleaned_update_cols = [c for c in updated_cols if c.lower() != "id"]
+    compare_cols = [c for c in cleaned_update_cols if c not in hash_exclude] if skip_unchanged else []
 
     # Kiểm tra tối thiểu
     if not all_cols:
@@ -165,40 +686,98 @@ def merge_tables(
     if "id" not in [c.lower() for c in all_cols]:
         raise ValueError("all_cols phải chứa khóa 'id'.")
 
-    # Phần SET cho WHEN MATCHED (chỉ khi có cột để update)
-    update_set_sql = ",\n  ".join([f"T.{c} = S.{c}" for c in cleaned_update_cols]) if cleaned_update_cols else ""
+    if isinstance(client, local_backend.LocalBigQueryClient):
+        # SQLite không có MERGE / partition → UPDATE ... FROM (chỉ dòng đổi) + INSERT tương đương
+        job = client.merge(target_fq, staging_fq, cleaned_update_cols, all_cols, compare_cols=compare_cols)
+        staging_rows = client.num_rows(staging_fq)
+    else:
+        ensure_merge_target(client, target_fq, staging_fq, all_cols, partition_col, cluster_cols)
+        staging_rows = client.get_table(staging_fq).num_rows or 0
+
+        # Phần SET cho WHEN MATCHED (chỉ khi có cột để update)
+        update_set_sql = ",\n  ".join([f"T.{c} = S.{c}" for c in cleaned_update_cols]) if cleaned_update_cols else ""
+
+        # Phần INSERT cho WHEN NOT MATCHED
+        insert_cols_sql = ",".join(all_cols)
+        insert_vals_sql = ",".join([f"S.{c}" for c in all_cols])
 
-    # Phần INSERT cho WHEN NOT MATCHED
-    insert_cols_sql = ",".join(all_cols)
-    insert_vals_sql = ",".join([f"S.{c}" for c in all_cols])
+        # Chỉ update dòng có giá trị đổi (so hash các cột cần so)
+        changed_sql = f" AND {_row_hash('T', compare_cols)} != {_row_hash('S', compare_cols)}" if compare_cols else ""
 
-    # Ghép câu lệnh MERGE (bỏ hẳn WHEN MATCHED nếu không có cột để update)
-    matched_clause = (
-        f"""
-    WHEN MATCHED THEN
+        # Ghép câu lệnh MERGE (bỏ hẳn WHEN MATCHED nếu không có cột để update)
+        matched_clause = (
+            f"""
+    WHEN MATCHED{changed_sql} THEN
       UPDATE SET
         {update_set_sql}
         """ if update_set_sql else ""
-    )
+        )
 
-    query = f"""
-    MERGE `{project_id}.{target_dataset}.{target_table}` T
-    USING `{project_id}.{src_dataset}.{staging_table}` S
-    ON T.id = S.id
+        prune = partition_prune_predicate(client, staging_fq, partition_col) if partition_col else None
+        on_sql = "T.id = S.id" + (f"\n      AND {prune}" if prune else "")
+
+        query = f"""
+    MERGE `{target_fq}` T
+    USING `{staging_fq}` S
+    ON {on_sql}
     {matched_clause}
     WHEN NOT MATCHED THEN
       INSERT ({insert_cols_sql})
       VALUES ({insert_vals_sql})
     """
 
-    print(query.strip())
-    job = client.query(query)
-    job.result()
-    print(f"✅ Merge thành công vào bảng {target_table}")
+        print(query.strip())
+        job = client.query(query)
+        job.result()
+    metrics.record_bq_job(job)
+
+    dml = getattr(job, "dml_stats", None)
+    if dml is not None:
+        inserted, updated = dml.inserted_row_count or 0, dml.updated_row_count or 0
+    else:
+        # client cũ không có dml_stats: chỉ biết tổng số dòng bị ảnh hưởng
+        inserted, updated = 0, getattr(job, "num_dml_affected_rows", None) or getattr(job, "output_rows", None) or 0
+    stats = MergeStats(
+        staging_rows=staging_rows,
+        inserted=inserted,
+        updated=updated,
+        bytes_processed=getattr(job, "total_bytes_processed", None),
+    )
+    metrics.add_rows(rows_in=staging_rows, rows_out=stats.inserted + stats.updated)
+    print(
+        f"✅ Merge thành công vào bảng {target_table}: +{stats.inserted} mới, {stats.updated} cập nhật, "
+        f"{stats.unchanged} không đổi (bỏ qua), quét {stats.bytes_processed or 0:,} bytes"
+    )
+    return stats
+
+
+def query_to_table(query: str, target: BQTarget, write_mode: str = "overwrite") -> int:
+    """Chạy query, ghi kết quả thẳng vào bảng target (không kéo dữ liệu về client). Trả về số dòng."""
+    client = get_bq_client(target.project_id, target.location)
+    ensure_dataset(client, target.dataset, target.location)
+    job_cfg = bigquery.QueryJobConfig(destination=target.fqtn, write_disposition=_write_disposition(write_mode))
+    job = client.query(query, job_config=job_cfg)
+    rows = job.result()
+    metrics.record_bq_job(job)
+    n = getattr(rows, "total_rows", None)
+    return n if n is not None else len(rows)
+
+
+def truncate_table(target: BQTarget) -> bool:
+    """
+    Xoá mọi dòng nhưng giữ schema (vd bảng staging khi lần chạy không có dữ liệu mới → MERGE sau đó
+    không gộp lại dữ liệu cũ). Bảng chưa có → False.
+    """
+    if not table_columns(target.project_id, target.dataset, target.table):
+        return False
+    execute_sql(project_id=target.project_id, query=f"TRUNCATE TABLE `{target.fqtn}`")
+    return True
 
 
 def execute_sql(project_id: str, query: str) -> None:
-    client = bigquery.Client(project=project_id)
+    client = get_bq_client(project_id)
     job = client.query(query)
+    rows = job.result()
+    metrics.record_bq_job(job)
     print(f"✅ Query executed successfully: {query}")
-    return job.result()
\ No newline at end of file
+    return rows
\ No newline at end of file
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+from langdetect import detect, DetectorFactory
+
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[1] / ".cache" / "lang_cache.sqlite"
+DEFAULT_MAX_CHARS = 1000        # chỉ detect trên prefix; langdetect hội tụ sau vài trăm ký tự
+MIN_BATCH_FOR_POOL = 200        # ít hơn thì detect ngay trong process (tránh chi phí khởi tạo pool)
+UNKNOWN = "unknown"
+# spawn thay cho fork: detect chạy trong thread stage của run_pipeline, fork 1 process nhiều thread
+# (đang giữ lock của metrics / SQLite / client GCS) có thể deadlock ở process con
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _init_worker() -> None:
+    DetectorFactory.seed = 0
+
+
+def _detect_one(text: str) -> str:
+    try:
+        return detect(text)
+    except Exception:
+        return UNKNOWN
+
+
+class LanguageDetector:
+    """
+    Detect ngôn ngữ theo batch: cache lâu dài (SQLite, key = hash của text đã cắt),
+    text trùng chỉ detect 1 lần, cache miss chạy song song bằng process pool.
+    """
+
+    def __init__(
+        self,
+        cache_path: Optional[Path] = DEFAULT_CACHE_PATH,
+        max_chars: int = DEFAULT_MAX_CHARS,
+        workers: Optional[int] = None,
+        min_batch_for_pool: int = MIN_BATCH_FOR_POOL,
+    ):
+        self.max_chars = max_chars
+        self.workers = workers
+        self.min_batch_for_pool = min_batch_for_pool
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if cache_path:
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            # detector có thể được tạo ở thread stage này và đóng ở thread stage khác (set_detector)
+            self._conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS lang (h TEXT PRIMARY KEY, lang TEXT NOT NULL)")
+        DetectorFactory.seed = 0
+
+    # ---------- cache ----------
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, str]:
+        if self._conn is None or not keys:
+            return {}
+        found: Dict[str, str] = {}
+        for i in range(0, len(keys), 900):   # giới hạn số tham số của SQLite
+            chunk = keys[i : i + 900]
+            rows = self._conn.execute(
+                f"SELECT h, lang FROM lang WHERE h IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def _store(self, results: Dict[str, str]) -> None:
+        if self._conn is None or not results:
+            return
+        self._conn.executemany("INSERT OR REPLACE INTO lang (h, lang) VALUES (?, ?)", results.items())
+        self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- detect ----------
+    def _normalize(self, text: Any) -> Optional[str]:
+        if text is None or (not isinstance(text, str) and pd.isna(text)):
+            return None
+        text = str(text).strip()
+        return text[: self.max_chars] if text else None
+
+    def detect_many(self, texts: Iterable[Any]) -> List[str]:
+        """Trả về mã ngôn ngữ cho từng text (cùng thứ tự); text rỗng/None → 'unknown'."""
+        normalized = [self._normalize(t) for t in texts]
+        keys_per_text = [self._key(t) if t is not None else None for t in normalized]
+        unique = {k: t for k, t in zip(keys_per_text, normalized) if k is not None}
+
+        cached = self._lookup(list(unique))
+        self.hits += len(cached)
+        todo = {k: t for k, t in unique.items() if k not in cached}
+        self.misses += len(todo)
+
+        fresh: Dict[str, str] = {}
+        if todo:
+            keys, values = list(todo), list(todo.values())
+            if len(values) >= self.min_batch_for_pool and self.workers != 1:
+                with ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=MP_CONTEXT, initializer=_init_worker
+                ) as pool:
+                    langs = list(pool.map(_detect_one, values, chunksize=64))
+            else:
+                langs = [_detect_one(v) for v in values]
+            fresh = dict(zip(keys, langs))
+            self._store(fresh)
+
+        result = {**cached, **fresh}
+        return [result[k] if k is not None else UNKNOWN for k in keys_per_text]
+
+
+_default: Optional[LanguageDetector] = None
+
+
+def get_detector() -> LanguageDetector:
+    global _default
+    if _default is None:
+        _default = LanguageDetector()
+    return _default
+
+
+def set_detector(detector: LanguageDetector) -> None:
+    """Thay detector mặc định; detector cũ được đóng (connection SQLite)."""
+    global _default
+    if _default is not None and _default is not detector:
+        _default.close()
+    _default = detector
+
+
+def detect_languages(texts: Iterable[Any]) -> List[str]:
+    """Detect theo batch bằng detector mặc định (xem set_detector / load_detector)."""
+    return get_detector().detect_many(texts)
+
+
+def load_detector(cfg) -> LanguageDetector:
+    """Tạo LanguageDetector từ EnvConfig (lang_cache_file, lang_max_chars)."""
+    cache_path = Path(cfg.lang_cache_file) if cfg.lang_cache_file else DEFAULT_CACHE_PATH
+    return LanguageDetector(cache_path=cache_path, max_chars=cfg.lang_max_chars)
@@ -0,0 +1,411 @@
+from __future__ import annotations
+
+import io
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import pandas as pd
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+# Backend offline cho gcp_io (STORAGE_BACKEND=local): thay storage.Client / bigquery.Client bằng
+# object store trên filesystem + SQLite, cùng interface con mà gcp_io dùng.
+# Dùng để chạy / benchmark cả pipeline trên 1 máy, không cần project GCP.
+DEFAULT_ROOT = Path(__file__).resolve().parents[1] / ".cache" / "local_backend"
+DB_NAME = "bigquery.sqlite"
+
+
+def split_gcs_uri(uri: str) -> tuple:
+    """'gs://bucket/a/b' → ('bucket', 'a/b')."""
+    if not uri.startswith("gs://"):
+        raise ValueError(f"❌ Not a gs:// URI: {uri}")
+    bucket, _, path = uri[len("gs://"):].partition("/")
+    return bucket, path
+
+
+# ----------------------------
+# OBJECT STORE (thay google.cloud.storage)
+# ----------------------------
+# generation = mtime_ns của file; khoá dùng chung để if_generation_match là check-and-set trong process
+_store_lock = threading.RLock()
+
+
+class _AtomicWriter(io.RawIOBase):
+    """File ghi vào .tmp, rename khi close → reader không bao giờ thấy file dở dang."""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        self._f = open(self._tmp, "wb")
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        return self._f.write(b)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._f.close()
+            os.replace(self._tmp, self._path)
+        super().close()
+
+
+class LocalBlob:
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def _path(self) -> Path:
+        return self.bucket.root / self.name
+
+    # ---------- metadata ----------
+    def exists(self) -> bool:
+        return self._path.is_file()
+
+    @property
+    def generation(self) -> Optional[int]:
+        return self._path.stat().st_mtime_ns if self.exists() else None
+
+    @property
+    def size(self) -> Optional[int]:
+        return self._path.stat().st_size if self.exists() else None
+
+    @property
+    def time_created(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self._path.stat().st_mtime, timezone.utc) if self.exists() else None
+
+    def _check_generation(self, if_generation_match: Optional[int]) -> None:
+        if if_generation_match is None:
+            return
+        current = self.generation or 0
+        if current != if_generation_match:
+            raise PreconditionFailed(f"gs://{self.bucket.name}/{self.name}: generation {current} != {if_generation_match}")
+
+    # ---------- read ----------
+    def download_as_bytes(self, if_generation_match: Optional[int] = None, **_: Any) -> bytes:
+        with _store_lock:
+            if not self.exists():
+                raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+            self._check_generation(if_generation_match)
+            return self._path.read_bytes()
+
+    def download_as_text(self, encoding: str = "utf-8", if_generation_match: Optional[int] = None, **_: Any) -> str:
+        return self.download_as_bytes(if_generation_match=if_generation_match).decode(encoding)
+
+    # ---------- write ----------
+    def upload_from_string(self, data: Any, content_type: Optional[str] = None, if_generation_match: Optional[int] = None, **_: Any) -> None:
+        payload = data.encode("utf-8") if isinstance(data, str) else data
+        with _store_lock:
+            self._check_generation(if_generation_match)
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with _AtomicWriter(self._path) as f:
+                f.write(payload)
+
+    def upload_from_file(self, file_obj, size: Optional[int] = None, content_type: Optional[str] = None, **_: Any) -> None:
+        self.upload_from_string(file_obj.read() if size is None else file_obj.read(size))
+
+    def open(self, mode: str = "r", encoding: Optional[str] = None, **_: Any):
+        """Hỗ trợ 'rb'/'r'/'wb'/'w' (bỏ qua chunk_size, ignore_flush, content_type của GCS)."""
+        if "w" in mode:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            raw = _AtomicWriter(self._path)
+            return raw if "b" in mode else io.TextIOWrapper(raw, encoding=encoding or "utf-8")
+        if not self.exists():
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        return open(self._path, "rb") if "b" in mode else open(self._path, "r", encoding=encoding or "utf-8")
+
+    def delete(self) -> None:
+        try:
+            self._path.unlink()
+        except FileNotFoundError:
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+
+
+class LocalBucket:
+    def __init__(self, client: "LocalStorageClient", name: str):
+        self.client = client
+        self.name = name
+        self.root = client.root / name
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self, name)
+
+    def get_blob(self, name: str) -> Optional[LocalBlob]:
+        blob = self.blob(name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix: str = "") -> Iterator[LocalBlob]:
+        if not self.root.exists():
+            return iter(())
+        names = sorted(
+            p.relative_to(self.root).as_posix()
+            for p in self.root.rglob("*")
+            if p.is_file() and not p.name.endswith(".tmp")
+        )
+        return (self.blob(n) for n in names if n.startswith(prefix))
+
+
+class LocalStorageClient:
+    """Bucket = thư mục con của root/gcs, object = file."""
+
+    def __init__(self, root: Path = DEFAULT_ROOT, project: Optional[str] = None):
+        self.root = Path(root) / "gcs"
+        self.project = project
+
+    def bucket(self, name: str) -> LocalBucket:
+        return LocalBucket(self, name)
+
+    def read_bytes(self, uri: str) -> bytes:
+        bucket, path = split_gcs_uri(uri)
+        return self.bucket(bucket).blob(path).download_as_bytes()
+
+
+# ----------------------------
+# SQL ENGINE (thay google.cloud.bigquery, SQLite)
+# ----------------------------
+# `project.dataset.table` → "dataset.table" (1 file SQLite cho mọi dataset)
+_FQTN_RE = re.compile(r"`([^`]+)`")
+
+
+def table_name(fqtn: str) -> str:
+    parts = fqtn.strip("`").split(".")
+    return ".".join(parts[-2:])
+
+
+_INFO_COLUMNS_RE = re.compile(r"`([^`.]+)\.([^`.]+)\.INFORMATION_SCHEMA\.COLUMNS`", re.IGNORECASE)
+
+
+def _info_columns_sql(m: "re.Match") -> str:
+    """`proj.dataset.INFORMATION_SCHEMA.COLUMNS` → subquery trên sqlite_master + pragma_table_info."""
+    project, dataset = m.group(1), m.group(2)
+    return (
+        f"(SELECT '{project}' AS table_catalog, '{dataset}' AS table_schema, "
+        f"substr(t.name, {len(dataset) + 2}) AS table_name, c.name AS column_name, "
+        f"c.cid + 1 AS ordinal_position, c.type AS data_type "
+        f"FROM sqlite_master t, pragma_table_info(t.name) c "
+        f"WHERE t.type = 'table' AND substr(t.name, 1, {len(dataset) + 1}) = '{dataset}.')"
+    )
+
+
+def translate_sql(query: str) -> str:
+    """Chuyển các cú pháp BigQuery mà pipeline dùng sang SQLite."""
+    query = _INFO_COLUMNS_RE.sub(_info_columns_sql, query)
+    query = _FQTN_RE.sub(lambda m: f'"{table_name(m.group(1))}"', query)
+    query = re.sub(r"^\s*TRUNCATE\s+TABLE\b", "DELETE FROM", query, flags=re.IGNORECASE)
+    query = re.sub(r"\bEXCEPT\s+DISTINCT\b", "EXCEPT", query, flags=re.IGNORECASE)
+    query = re.sub(r"\bINTERSECT\s+DISTINCT\b", "INTERSECT", query, flags=re.IGNORECASE)
+    query = re.sub(r"\bUNION\s+DISTINCT\b", "UNION", query, flags=re.IGNORECASE)
+    return _strip_compound_parens(query)
+
+
+_COMPOUND_RE = re.compile(r"\b(EXCEPT|INTERSECT|UNION(\s+ALL)?)\s*$", re.IGNORECASE)
+_COMPOUND_AFTER_RE = re.compile(r"^\s*(EXCEPT|INTERSECT|UNION)\b", re.IGNORECASE)
+
+
+def _strip_compound_parens(query: str) -> str:
+    """SQLite không cho ngoặc quanh từng vế compound select: (SELECT ...) EXCEPT (SELECT ...) → bỏ ngoặc."""
+    out, stack = list(query), []
+    for i, ch in enumerate(query):
+        if ch == "(":
+            stack.append(i)
+        elif ch == ")" and stack:
+            start = stack.pop()
+            if stack or not query[start + 1 : i].strip()[:6].upper() == "SELECT":
+                continue
+            before, after = query[:start].strip(), query[i + 1 :]
+            if (not before or _COMPOUND_RE.search(before)) and (not after.strip() or _COMPOUND_AFTER_RE.match(after)):
+                out[start] = out[i] = " "
+    return "".join(out)
+
+
+class Row(dict):
+    """Giống bigquery.Row: truy cập row.col hoặc row['col']."""
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class DmlStats(NamedTuple):
+    """Giống QueryJob.dml_stats của BigQuery."""
+    inserted_row_count: int = 0
+    updated_row_count: int = 0
+    deleted_row_count: int = 0
+
+
+class LocalJob:
+    def __init__(
+        self,
+        rows: Optional[List[Row]] = None,
+        output_rows: int = 0,
+        job_id: str = "",
+        job_type: str = "query",
+        dml_stats: Optional[DmlStats] = None,
+    ):
+        self._rows = rows or []
+        self.output_rows = output_rows
+        self.job_id = job_id
+        self.job_type = job_type
+        self.dml_stats = dml_stats
+        self.num_dml_affected_rows = sum(dml_stats) if dml_stats else None
+        self.total_bytes_processed = 0
+
+    def result(self) -> List[Row]:
+        return self._rows
+
+
+def _to_sql_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """list/dict → JSON text (SQLite không có kiểu lặp / struct)."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and df[col].map(lambda v: isinstance(v, (list, dict))).any():
+            df[col] = df[col].map(lambda v: json.dumps(v, ensure_ascii=False) if isinstance(v, (list, dict)) else v)
+    return df
+
+
+# 1 connection + lock cho mỗi file SQLite, dùng chung giữa các client (khác location) trong process
+_connections: Dict[str, tuple] = {}
+_connections_lock = threading.Lock()
+
+
+def _shared_connection(db_path: Path) -> tuple:
+    key = str(Path(db_path).resolve())
+    with _connections_lock:
+        if key not in _connections:
+            _connections[key] = (sqlite3.connect(key, check_same_thread=False), threading.RLock())
+        return _connections[key]
+
+
+def close_connections() -> None:
+    with _connections_lock:
+        for conn, _ in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+class LocalBigQueryClient:
+    """SQLite 1 file (root/bigquery.sqlite); các hàm con mà gcp_io dùng."""
+
+    def __init__(self, root: Path = DEFAULT_ROOT, project: Optional[str] = None, location: Optional[str] = None):
+        self.root = Path(root)
+        self.project = project
+        self.location = location
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._conn, self._lock = _shared_connection(self.root / DB_NAME)
+        self._jobs = 0
+
+    def _next_job_id(self) -> str:
+        self._jobs += 1
+        return f"local_{self._jobs}"
+
+    # ---------- schema ----------
+    def create_dataset(self, dataset: Any, exists_ok: bool = True) -> None:
+        pass   # dataset chỉ là prefix của tên bảng
+
+    def table_exists(self, fqtn: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name(fqtn),)
+        ).fetchone()
+        return row is not None
+
+    def columns(self, fqtn: str) -> List[str]:
+        return [r[1] for r in self._conn.execute(f'PRAGMA table_info("{table_name(fqtn)}")')]
+
+    # ---------- load ----------
+    def load_table_from_dataframe(self, df: pd.DataFrame, destination: str, job_config: Any = None) -> LocalJob:
+        disposition = getattr(job_config, "write_disposition", None) or "WRITE_APPEND"
+        name = table_name(destination)
+        frame = _to_sql_frame(df)
+        with self._lock:
+            exists = self.table_exists(destination)
+            if disposition == "WRITE_EMPTY" and exists and self._conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]:
+                raise PreconditionFailed(f"Table {destination} is not empty (WRITE_EMPTY).")
+            if disposition == "WRITE_TRUNCATE" or not exists:
+                frame.to_sql(name, self._conn, if_exists="replace", index=False)
+            else:
+                # cột mới (schema mở rộng) → ALTER TABLE trước khi append
+                for col in frame.columns:
+                    if col not in self.columns(destination):
+                        self._conn.execute(f'ALTER TABLE "{name}" ADD COLUMN "{col}"')
+                frame.to_sql(name, self._conn, if_exists="append", index=False)
+            self._conn.commit()
+        return LocalJob(output_rows=len(df), job_id=self._next_job_id(), job_type="load")
+
+    def load_table_from_uri(self, uris: Sequence[str], destination: str, job_config: Any = None) -> LocalJob:
+        """gs:// URI → file trong object store local (Parquet hoặc NDJSON)."""
+        store = LocalStorageClient(self.root, self.project)
+        source_format = getattr(job_config, "source_format", None) or "PARQUET"
+        frames = []
+        for uri in ([uris] if isinstance(uris, str) else uris):
+            data = store.read_bytes(uri)
+            if source_format == "PARQUET":
+                frames.append(pd.read_parquet(io.BytesIO(data)))
+            else:
+                frames.append(pd.read_json(io.BytesIO(data), lines=True, compression="infer"))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return self.load_table_from_dataframe(df, destination, job_config)
+
+    # ---------- query ----------
+    def query(self, query: str, job_config: Any = None) -> LocalJob:
+        """job_config.destination (QueryJobConfig) → ghi kết quả vào bảng đó theo write_disposition."""
+        sql = translate_sql(query)
+        with self._lock:
+            cur = self._conn.execute(sql)
+            cols = [d[0] for d in cur.description] if cur.description else []
+            rows = [Row(zip(cols, r)) for r in cur.fetchall()]
+            self._conn.commit()
+            destination = getattr(job_config, "destination", None)
+            if destination is not None:
+                self.load_table_from_dataframe(pd.DataFrame(rows, columns=cols), str(destination), job_config)
+        return LocalJob(rows=rows, output_rows=len(rows), job_id=self._next_job_id())
+
+    def merge(
+        self,
+        target: str,
+        staging: str,
+        updated_cols: Iterable[str],
+        all_cols: Sequence[str],
+        key: str = "id",
+        compare_cols: Optional[Sequence[str]] = None,
+    ) -> LocalJob:
+        """
+        Tương đương MERGE của merge_tables: UPDATE ... FROM staging khi khớp key,
+        INSERT các key chưa có. Bảng target chưa tồn tại → tạo từ all_cols.
+        compare_cols: chỉ UPDATE dòng có ít nhất 1 cột trong đó khác target (so sánh NULL-safe bằng IS NOT).
+        """
+        t, s = table_name(target), table_name(staging)
+        updated_cols = [c for c in updated_cols if c.lower() != key]
+        cols_sql = ", ".join(f'"{c}"' for c in all_cols)
+        with self._lock:
+            if not self.table_exists(target):
+                self._conn.execute(f'CREATE TABLE "{t}" AS SELECT {cols_sql} FROM "{s}" WHERE 0')
+            updated = 0
+            if updated_cols:
+                set_sql = ", ".join(f'"{c}" = S."{c}"' for c in updated_cols)
+                where = f'"{t}"."{key}" = S."{key}"'
+                if compare_cols:
+                    where += " AND (" + " OR ".join(f'"{t}"."{c}" IS NOT S."{c}"' for c in compare_cols) + ")"
+                updated = self._conn.execute(f'UPDATE "{t}" SET {set_sql} FROM "{s}" AS S WHERE {where}').rowcount
+            inserted = self._conn.execute(
+                f'INSERT INTO "{t}" ({cols_sql}) SELECT {", ".join(f"S.{chr(34)}{c}{chr(34)}" for c in all_cols)} '
+                f'FROM "{s}" AS S WHERE S."{key}" NOT IN (SELECT "{key}" FROM "{t}" WHERE "{key}" IS NOT NULL)'
+            ).rowcount
+            self._conn.commit()
+        stats = DmlStats(inserted_row_count=inserted, updated_row_count=updated)
+        return LocalJob(output_rows=inserted + updated, job_id=self._next_job_id(), dml_stats=stats)
+
+    def num_rows(self, fqtn: str) -> int:
+        return self._conn.execute(f'SELECT COUNT(*) FROM "{table_name(fqtn)}"').fetchone()[0]
+
+    def read_table(self, fqtn: str) -> pd.DataFrame:
+        return pd.read_sql_query(f'SELECT * FROM "{table_name(fqtn)}"', self._conn)
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+# Số liệu theo stage trong 1 process: thời gian, HTTP, quota, bytes GCS, job BigQuery, rows.
+# Crawler / gcp_io / quota gọi record_* → cộng vào stage hiện tại (contextvar, đặt bởi stage()).
+# Cuối run: save_report() ghi JSON + Prometheus textfile (node_exporter textfile collector).
+DEFAULT_METRICS_DIR = Path(__file__).resolve().parents[1] / ".cache" / "metrics"
+PROM_FILE = "youtube_pipeline.prom"
+PROM_PREFIX = "ytb_pipeline"
+
+# Ngưỡng histogram latency HTTP (giây), kiểu Prometheus (cumulative, +Inf ngầm định)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+UNSCOPED = "unscoped"   # ghi nhận ngoài mọi stage()
+
+
+@dataclass
+class LatencyHistogram:
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    count: int = 0
+    sum_s: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if seconds <= le:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.count += 1
+        self.sum_s += seconds
+
+    def cumulative(self) -> List[int]:
+        out, total = [], 0
+        for b in self.buckets:
+            total += b
+            out.append(total)
+        return out
+
+
+@dataclass
+class BQJobStats:
+    job_id: Optional[str]
+    job_type: Optional[str]
+    bytes_processed: Optional[int]
+    bytes_billed: Optional[int]
+    slot_ms: Optional[int]
+    output_rows: Optional[int]
+
+
+@dataclass
+class StageMetrics:
+    stage: str
+    started: Optional[str] = None
+    wall_s: float = 0.0
+    cpu_s: float = 0.0            # CPU của cả process trong lúc stage chạy
+    status: str = "ok"
+    http: Dict[str, LatencyHistogram] = field(default_factory=dict)   # service → histogram
+    http_errors: int = 0
+    quota_units: int = 0
+    gcs_bytes_read: int = 0
+    gcs_bytes_written: int = 0
+    bq_jobs: List[BQJobStats] = field(default_factory=list)
+    rows_in: int = 0
+    rows_out: int = 0
+
+    @property
+    def http_requests(self) -> int:
+        return sum(h.count for h in self.http.values())
+
+
+_stages: Dict[str, StageMetrics] = {}
+_lock = threading.Lock()
+_current: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("metrics_stage", default=None)
+
+
+def _get(name: str) -> StageMetrics:
+    m = _stages.get(name)
+    if m is None:
+        m = _stages[name] = StageMetrics(stage=name)
+    return m
+
+
+def current_stage() -> str:
+    return _current.get() or UNSCOPED
+
+
+@contextmanager
+def stage(name: str) -> Iterator[StageMetrics]:
+    """Đo wall/CPU time của stage; mọi record_* trong khối (cùng context) cộng vào stage này."""
+    token = _current.set(name)
+    with _lock:
+        m = _get(name)
+        m.started = m.started or datetime.now(timezone.utc).isoformat()
+    t0, c0 = time.perf_counter(), time.process_time()
+    try:
+        yield m
+    except BaseException:
+        m.status = "failed"
+        raise
+    finally:
+        with _lock:
+            m.wall_s += time.perf_counter() - t0
+            m.cpu_s += time.process_time() - c0
+        _current.reset(token)
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Gắn stage hiện tại vào fn để chạy ở thread khác (ThreadPoolExecutor không tự copy context).
+    Mỗi lần gọi chạy trong 1 bản copy riêng của context → wrapper gọi song song từ nhiều thread được.
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+# ----------------------------
+# RECORDERS
+# ----------------------------
+def record_http(service: str, seconds: float, ok: bool = True) -> None:
+    with _lock:
+        m = _get(current_stage())
+        m.http.setdefault(service, LatencyHistogram()).observe(seconds)
+        if not ok:
+            m.http_errors += 1
+
+
+@contextmanager
+def http_timer(service: str) -> Iterator[None]:
+    """Đo 1 request HTTP (lỗi → tính http_errors rồi raise tiếp)."""
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record_http(service, time.perf_counter() - t0, ok)
+
+
+def instrument_session(session: Any, service: str) -> Any:
+    """Thêm response hook cho requests.Session: mỗi response → record_http (latency = resp.elapsed)."""
+    def _hook(resp, *args, **kwargs):
+        record_http(service, resp.elapsed.total_seconds(), ok=resp.status_code < 400 or resp.status_code == 304)
+        return resp
+
+    session.hooks.setdefault("response", []).append(_hook)
+    return session
+
+
+def add_quota(units: int) -> None:
+    with _lock:
+        _get(current_stage()).quota_units += units
+
+
+def add_gcs_bytes(read: int = 0, written: int = 0) -> None:
+    with _lock:
+        m = _get(current_stage())
+        m.gcs_bytes_read += read or 0
+        m.gcs_bytes_written += written or 0
+
+
+def add_rows(rows_in: int = 0, rows_out: int = 0) -> None:
+    with _lock:
+        m = _get(current_stage())
+        m.rows_in += rows_in or 0
+        m.rows_out += rows_out or 0
+
+
+def record_bq_job(job: Any) -> None:
+    """Job BigQuery đã xong (QueryJob / LoadJob, hoặc LocalJob của backend local)."""
+    stats = BQJobStats(
+        job_id=getattr(job, "job_id", None),
+        job_type=getattr(job, "job_type", None),
+        bytes_processed=getattr(job, "total_bytes_processed", None) or getattr(job, "input_file_bytes", None),
+        bytes_billed=getattr(job, "total_bytes_billed", None),
+        slot_ms=getattr(job, "slot_millis", None),
+        output_rows=getattr(job, "output_rows", None),
+    )
+    with _lock:
+        _get(current_stage()).bq_jobs.append(stats)
+
+
+# ----------------------------
+# REPORT
+# ----------------------------
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        stages = []
+        for m in _stages.values():
+            d = asdict(m)
+            d["http_requests"] = m.http_requests
+            d["http"] = {
+                svc: {"count": h.count, "sum_s": round(h.sum_s, 6), "buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], h.cumulative()))}
+                for svc, h in m.http.items()
+            }
+            stages.append(d)
+    return {"created": datetime.now(timezone.utc).isoformat(), "stages": stages}
+
+
+def _prom_labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def to_prometheus() -> str:
+    snap = snapshot()
+    lines: List[str] = []
+
+    def metric(name: str, mtype: str, help_: str, samples: List[tuple]) -> None:
+        lines.append(f"# HELP {PROM_PREFIX}_{name} {help_}")
+        lines.append(f"# TYPE {PROM_PREFIX}_{name} {mtype}")
+        for suffix, labels, value in samples:
+            lines.append(f"{PROM_PREFIX}_{name}{suffix}{_prom_labels(**labels)} {value}")
+
+    gauges = [
+        ("stage_wall_seconds", "wall_s", "Wall time of the stage."),
+        ("stage_cpu_seconds", "cpu_s", "Process CPU time while the stage ran."),
+        ("quota_units", "quota_units", "YouTube Data API quota units spent."),
+        ("gcs_read_bytes", "gcs_bytes_read", "Bytes read from GCS."),
+        ("gcs_written_bytes", "gcs_bytes_written", "Bytes written to GCS."),
+        ("rows_in", "rows_in", "Rows consumed by the stage."),
+        ("rows_out", "rows_out", "Rows produced by the stage."),
+        ("http_errors", "http_errors", "HTTP requests that failed."),
+    ]
+    for name, key, help_ in gauges:
+        metric(name, "gauge", help_, [("", {"stage": s["stage"]}, s[key]) for s in snap["stages"]])
+
+    metric("stage_success", "gauge", "1 if the stage finished without error.",
+           [("", {"stage": s["stage"]}, int(s["status"] == "ok")) for s in snap["stages"]])
+
+    for name, key, help_ in [
+        ("bq_jobs", None, "BigQuery jobs run by the stage."),
+        ("bq_bytes_processed", "bytes_processed", "BigQuery bytes processed."),
+        ("bq_slot_ms", "slot_ms", "BigQuery slot milliseconds."),
+    ]:
+        metric(name, "gauge", help_, [
+            ("", {"stage": s["stage"]}, len(s["bq_jobs"]) if key is None else sum(j[key] or 0 for j in s["bq_jobs"]))
+            for s in snap["stages"]
+        ])
+
+    hist = []
+    for s in snap["stages"]:
+        for svc, h in s["http"].items():
+            labels = {"stage": s["stage"], "service": svc}
+            for le, count in h["buckets"].items():
+                hist.append(("_bucket", {**labels, "le": le}, count))
+            hist.append(("_sum", labels, h["sum_s"]))
+            hist.append(("_count", labels, h["count"]))
+    metric("http_request_duration_seconds", "histogram", "HTTP request latency.", hist)
+
+    lines.append(f"# TYPE {PROM_PREFIX}_last_run_timestamp_seconds gauge")
+    lines.append(f"{PROM_PREFIX}_last_run_timestamp_seconds {time.time():.0f}")
+    return "\n".join(lines) + "\n"
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def save_report(cfg=None, metrics_dir: Optional[Path] = None) -> Path:
+    """Ghi run_<ts>.json + youtube_pipeline.prom vào metrics_dir (EnvConfig.metrics_dir, mặc định .cache/metrics)."""
+    if metrics_dir is None:
+        metrics_dir = Path(cfg.metrics_dir) if cfg is not None and cfg.metrics_dir else DEFAULT_METRICS_DIR
+    metrics_dir = Path(metrics_dir)
+    report_path = metrics_dir / f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    _atomic_write(report_path, json.dumps(snapshot(), indent=2, default=str))
+    _atomic_write(metrics_dir / PROM_FILE, to_prometheus())
+    print(f"📈 Metrics → {report_path}")
+    return report_path
+
+
+def summary() -> str:
+    snap = snapshot()
+    lines = ["📈 Stage metrics:"]
+    for s in snap["stages"]:
+        lines.append(
+            f"   {s['stage']:<20} {s['wall_s']:7.1f}s wall {s['cpu_s']:7.1f}s cpu  "
+            f"http={s['http_requests']:<5} quota={s['quota_units']:<5} "
+            f"gcs r/w={s['gcs_bytes_read']}/{s['gcs_bytes_written']}B bq_jobs={len(s['bq_jobs'])} "
+            f"rows {s['rows_in']}→{s['rows_out']}"
+        )
+    return "\n".join(lines)
+
+
+def reset() -> None:
+    with _lock:
+        _stages.clear()
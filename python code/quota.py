@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+import metrics
+
+try:
+    import fcntl     # POSIX; Windows không có → save() chỉ an toàn khi 1 process ghi state
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+# ----------------------------
+# COSTS
+# ----------------------------
+# Chi phí quota (units) mỗi request của YouTube Data API v3
+ENDPOINT_COSTS: Dict[str, int] = {
+    "search.list": 100,
+    "videos.list": 1,
+    "channels.list": 1,
+    "playlistItems.list": 1,
+}
+
+DEFAULT_DAILY_UNITS = 10_000
+
+# Tỷ trọng quota mỗi stage được phép dùng trong ngày
+DEFAULT_STAGE_SHARES: Dict[str, float] = {
+    "search": 0.80,
+    "video_details": 0.10,
+    "channels": 0.10,
+}
+
+# Quota YouTube reset lúc 0h giờ Pacific
+QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+
+DEFAULT_STATE_PATH = Path(__file__).resolve().parents[1] / ".cache" / "quota_state.json"
+
+
+def endpoint_cost(endpoint: str) -> int:
+    if endpoint not in ENDPOINT_COSTS:
+        raise ValueError(f"❌ Unknown endpoint: {endpoint}. Known: {sorted(ENDPOINT_COSTS)}")
+    return ENDPOINT_COSTS[endpoint]
+
+
+def split_units(total_units: int, keys: Iterable[str], weights: Optional[Dict[str, float]] = None, step: int = 1) -> Dict[str, int]:
+    """
+    Chia total_units cho các key theo weights (mặc định chia đều), mỗi phần là bội số của step
+    (vd step=100 cho search.list → số trang). Phần dư chia theo largest remainder.
+    """
+    keys = list(keys)
+    if not keys or total_units <= 0:
+        return {k: 0 for k in keys}
+    weights = weights or {}
+    w = [max(float(weights.get(k, 1.0)), 0.0) for k in keys]
+    w_sum = sum(w) or float(len(keys))
+    if not any(w):
+        w = [1.0] * len(keys)
+
+    slots = total_units // step
+    exact = [slots * wi / w_sum for wi in w]
+    alloc = [int(x) for x in exact]
+    leftover = slots - sum(alloc)
+    order = sorted(range(len(keys)), key=lambda i: exact[i] - alloc[i], reverse=True)
+    for i in order[:leftover]:
+        alloc[i] += 1
+    return {k: a * step for k, a in zip(keys, alloc)}
+
+
+# ----------------------------
+# BUDGET
+# ----------------------------
+class QuotaBudget:
+    """
+    Ngân sách quota dùng chung giữa các stage (search / video_details / channels).
+    Lượng đã dùng trong ngày được lưu ra state_path để các script chạy riêng lẻ vẫn thấy nhau;
+    nhiều process cùng chạy thì save() cộng phần mỗi process dùng thêm (dưới file lock), không ghi đè nhau.
+    """
+
+    def __init__(
+        self,
+        daily_units: int = DEFAULT_DAILY_UNITS,
+        stage_shares: Optional[Dict[str, float]] = None,
+        state_path: Optional[Path] = DEFAULT_STATE_PATH,
+    ):
+        self.daily_units = daily_units
+        self.stage_shares = dict(stage_shares or DEFAULT_STAGE_SHARES)
+        self.state_path = Path(state_path) if state_path else None
+        self.spent: Dict[str, int] = {}
+        self._saved: Dict[str, int] = {}     # spent đã có trong file ở lần load / save gần nhất
+        self._day = self._today()
+        self._lock = threading.RLock()
+        self._load()
+
+    # ---------- state ----------
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(QUOTA_TZ).strftime("%Y-%m-%d")
+
+    def _read_spent(self) -> Dict[str, int]:
+        if not self.state_path or not self.state_path.exists():
+            return {}
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if state.get("day") != self._day:
+            return {}
+        return {k: int(v) for k, v in state.get("spent", {}).items()}
+
+    def _load(self) -> None:
+        self.spent = self._read_spent()
+        self._saved = dict(self.spent)
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock độc quyền trên <state>.lock trong lúc đọc - gộp - ghi state."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.state_path.with_suffix(".lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def save(self) -> None:
+        """Đọc lại file, cộng phần process này dùng thêm từ lần load / save trước, rồi ghi đè atomically."""
+        if not self.state_path:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, self._file_lock():
+            merged = self._read_spent()
+            for stage, units in self.spent.items():
+                delta = units - self._saved.get(stage, 0)
+                if delta > 0:
+                    merged[stage] = merged.get(stage, 0) + delta
+            state = {"day": self._day, "daily_units": self.daily_units, "spent": merged}
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+            tmp.replace(self.state_path)
+            self.spent = dict(merged)
+            self._saved = dict(merged)
+
+    # ---------- accounting ----------
+    @property
+    def total_spent(self) -> int:
+        return sum(self.spent.values())
+
+    def stage_allowance(self, stage: str) -> int:
+        """Số units tối đa stage được dùng trong ngày (theo tỷ trọng)."""
+        share = self.stage_shares.get(stage, 0.0)
+        total_share = sum(self.stage_shares.values()) or 1.0
+        return int(self.daily_units * share / total_share)
+
+    def remaining(self, stage: Optional[str] = None) -> int:
+        """Units còn lại của stage (hoặc của cả ngày nếu stage=None)."""
+        with self._lock:
+            global_left = self.daily_units - self.total_spent
+            if stage is None:
+                return max(global_left, 0)
+            stage_left = self.stage_allowance(stage) - self.spent.get(stage, 0)
+            return max(min(global_left, stage_left), 0)
+
+    def can_afford(self, stage: str, endpoint: str, calls: int = 1) -> bool:
+        return self.remaining(stage) >= endpoint_cost(endpoint) * calls
+
+    def charge(self, stage: str, endpoint: str, calls: int = 1) -> int:
+        """Ghi nhận units đã dùng; trả về số units vừa trừ."""
+        units = endpoint_cost(endpoint) * calls
+        with self._lock:
+            self.spent[stage] = self.spent.get(stage, 0) + units
+        metrics.add_quota(units)
+        return units
+
+    def mark_exhausted(self) -> None:
+        """API đã trả 403 quotaExceeded → coi như hết quota cả ngày."""
+        with self._lock:
+            left = self.daily_units - self.total_spent
+            if left > 0:
+                self.spent["_external"] = self.spent.get("_external", 0) + left
+
+    def split_pages(self, stage: str, endpoint: str, keys: List[str], weights: Optional[Dict[str, float]] = None) -> Dict[str, int]:
+        """Chia phần quota còn lại của stage thành số request tối đa cho từng key (vd keyword)."""
+        cost = endpoint_cost(endpoint)
+        units = split_units(self.remaining(stage), keys, weights, step=cost)
+        return {k: u // cost for k, u in units.items()}
+
+    def summary(self) -> str:
+        parts = [f"{s}={self.spent.get(s, 0)}/{self.stage_allowance(s)}" for s in self.stage_shares]
+        return f"📊 Quota {self._day}: {self.total_spent}/{self.daily_units} units ({', '.join(parts)})"
+
+
+def is_quota_error(status_code: int, body: str) -> bool:
+    return status_code == 403 and ("quotaExceeded" in body or "dailyLimitExceeded" in body)
+
+
+def load_budget(cfg) -> QuotaBudget:
+    """Tạo QuotaBudget từ EnvConfig (daily_quota_units, quota_state_file)."""
+    state_path = Path(cfg.quota_state_file) if cfg.quota_state_file else DEFAULT_STATE_PATH
+    return QuotaBudget(daily_units=cfg.daily_quota_units, state_path=state_path)
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import json
+import math
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+
+DEFAULT_STATE_PATH = Path(__file__).resolve().parents[1] / ".cache" / "refresh_state.json"
+DEFAULT_CHANNEL_STATE_PATH = Path(__file__).resolve().parents[1] / ".cache" / "channel_state.json"
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+# (tuổi video tối đa, khoảng refresh cơ bản) — video càng cũ càng ít phải refresh
+AGE_INTERVALS = [
+    (1 * DAY, 1 * HOUR),
+    (7 * DAY, 6 * HOUR),
+    (30 * DAY, 1 * DAY),
+    (365 * DAY, 7 * DAY),
+]
+OLD_VIDEO_INTERVAL = 30 * DAY
+MIN_INTERVAL = 1 * HOUR
+
+# Trọng số EWMA cho view velocity (views/giờ)
+VELOCITY_ALPHA = 0.5
+
+# TTL channel: base cho kênh nhỏ, rút ngắn theo số subscriber (10k → /1.3, 100k → /2, 1M → /3, ...)
+DEFAULT_CHANNEL_TTL = 7 * DAY
+MIN_CHANNEL_TTL = 12 * HOUR
+CHANNEL_TTL_SUBSCRIBER_SCALE = 10_000
+
+
+@dataclass
+class VideoRefreshState:
+    published_at: float          # epoch giây
+    last_refresh: float          # epoch giây
+    last_views: int
+    velocity: float = 0.0        # views/giờ (EWMA)
+
+
+def _to_epoch(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    ts = pd.to_datetime(value, errors="coerce", utc=True)
+    if pd.isna(ts):
+        return None
+    return ts.timestamp()
+
+
+class RefreshScheduler:
+    """
+    Lịch refresh statistics theo tuổi video và view velocity.
+    Mỗi lần chạy chỉ trả về các video đã đến hạn, theo thứ tự ưu tiên, tối đa max_calls request videos.list.
+    """
+
+    def __init__(self, state_path: Optional[Path] = DEFAULT_STATE_PATH):
+        self.state_path = Path(state_path) if state_path else None
+        self.videos: Dict[str, VideoRefreshState] = {}
+        self._load()
+
+    # ---------- state ----------
+    def _load(self) -> None:
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            raw = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self.videos = {vid: VideoRefreshState(**s) for vid, s in raw.items()}
+
+    def save(self) -> None:
+        if not self.state_path:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({vid: asdict(s) for vid, s in self.videos.items()}), encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    # ---------- scheduling ----------
+    @staticmethod
+    def refresh_interval(state: VideoRefreshState, now: float) -> float:
+        """Khoảng refresh (giây): theo tuổi video, rút ngắn khi velocity cao."""
+        age = max(now - state.published_at, 0.0)
+        base = OLD_VIDEO_INTERVAL
+        for max_age, interval in AGE_INTERVALS:
+            if age < max_age:
+                base = interval
+                break
+        # velocity 1k views/giờ → chia đôi khoảng refresh, 10k → chia ba, ...
+        speedup = 1.0 + math.log10(1.0 + state.velocity / 100.0)
+        return max(base / speedup, MIN_INTERVAL)
+
+    def priority(self, video_id: str, now: float) -> Optional[float]:
+        """Điểm ưu tiên (cao hơn = refresh trước); None nếu chưa đến hạn. Video mới → inf."""
+        state = self.videos.get(video_id)
+        if state is None:
+            return math.inf
+        overdue = (now - state.last_refresh) / self.refresh_interval(state, now)
+        if overdue < 1.0:
+            return None
+        return overdue * (1.0 + math.log1p(state.velocity))
+
+    def due_ids(
+        self,
+        candidate_ids: Iterable[str] = (),
+        max_calls: Optional[int] = None,
+        batch_size: int = 50,
+        now: Optional[float] = None,
+    ) -> List[str]:
+        """
+        Danh sách ID cần refresh (video mới trong candidate_ids + video đang theo dõi đã đến hạn),
+        sắp theo ưu tiên giảm dần, tối đa max_calls * batch_size ID.
+        """
+        now = time.time() if now is None else now
+        ids = dict.fromkeys(str(v) for v in candidate_ids)
+        ids.update(dict.fromkeys(self.videos))
+
+        scored = []
+        for vid in ids:
+            score = self.priority(vid, now)
+            if score is not None:
+                scored.append((score, vid))
+        scored.sort(key=lambda x: x[0], reverse=True)
+
+        limit = None if max_calls is None else max_calls * batch_size
+        return [vid for _, vid in scored[:limit]]
+
+    def record(self, items: Iterable[Dict[str, Any]], now: Optional[float] = None) -> int:
+        """Cập nhật last_refresh / velocity từ các item videos.list vừa crawl. Trả về số video cập nhật."""
+        now = time.time() if now is None else now
+        updated = 0
+        for item in items:
+            vid = item.get("id")
+            stats = item.get("statistics") or {}
+            published = _to_epoch((item.get("snippet") or {}).get("publishedAt"))
+            if not vid:
+                continue
+            views = int(stats.get("viewCount", 0) or 0)
+
+            prev = self.videos.get(vid)
+            if prev is None:
+                # lần đầu: ước lượng velocity = views trung bình/giờ từ lúc đăng
+                age_h = max((now - (published or now)) / HOUR, 1.0)
+                velocity = views / age_h
+                self.videos[vid] = VideoRefreshState(
+                    published_at=published or now, last_refresh=now, last_views=views, velocity=velocity
+                )
+            else:
+                dt_h = max((now - prev.last_refresh) / HOUR, 1e-3)
+                recent = max(views - prev.last_views, 0) / dt_h
+                prev.velocity = VELOCITY_ALPHA * recent + (1 - VELOCITY_ALPHA) * prev.velocity
+                prev.last_views = views
+                prev.last_refresh = now
+                if published:
+                    prev.published_at = published
+            updated += 1
+        return updated
+
+    def summary(self, now: Optional[float] = None) -> str:
+        now = time.time() if now is None else now
+        due = sum(1 for vid in self.videos if self.priority(vid, now) is not None)
+        stamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M")
+        return f"🗓️ Refresh {stamp}: {len(self.videos)} video đang theo dõi, {due} đến hạn"
+
+
+def load_scheduler(cfg) -> RefreshScheduler:
+    """Tạo RefreshScheduler từ EnvConfig (refresh_state_file)."""
+    state_path = Path(cfg.refresh_state_file) if cfg.refresh_state_file else DEFAULT_STATE_PATH
+    return RefreshScheduler(state_path=state_path)
+
+
+# ----------------------------
+# CHANNEL TTL
+# ----------------------------
+@dataclass
+class ChannelCrawlState:
+    last_crawled: float          # epoch giây
+    subscribers: int = 0
+
+
+class ChannelIndex:
+    """
+    Index last-crawled theo channel: chỉ crawl lại channel mới hoặc đã quá TTL.
+    TTL ngắn hơn với kênh lớn (số liệu đổi nhanh, được truy vấn nhiều).
+    """
+
+    def __init__(self, state_path: Optional[Path] = DEFAULT_CHANNEL_STATE_PATH, base_ttl: float = DEFAULT_CHANNEL_TTL):
+        self.state_path = Path(state_path) if state_path else None
+        self.base_ttl = base_ttl
+        self.channels: Dict[str, ChannelCrawlState] = {}
+        self._load()
+
+    # ---------- state ----------
+    def _load(self) -> None:
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            raw = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self.channels = {cid: ChannelCrawlState(**s) for cid, s in raw.items()}
+
+    def save(self) -> None:
+        if not self.state_path:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({cid: asdict(s) for cid, s in self.channels.items()}), encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    # ---------- scheduling ----------
+    def ttl(self, state: ChannelCrawlState) -> float:
+        speedup = 1.0 + math.log10(1.0 + state.subscribers / CHANNEL_TTL_SUBSCRIBER_SCALE)
+        return max(self.base_ttl / speedup, MIN_CHANNEL_TTL)
+
+    def due_ids(self, candidate_ids: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """Channel trong candidate_ids chưa từng crawl hoặc đã quá TTL; channel mới trước, rồi quá hạn lâu nhất."""
+        now = time.time() if now is None else now
+        scored = []
+        for cid in dict.fromkeys(str(c) for c in candidate_ids if c):
+            state = self.channels.get(cid)
+            if state is None:
+                scored.append((math.inf, cid))
+                continue
+            overdue = (now - state.last_crawled) / self.ttl(state)
+            if overdue >= 1.0:
+                scored.append((overdue, cid))
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return [cid for _, cid in scored]
+
+    def record(self, items: Iterable[Dict[str, Any]], now: Optional[float] = None) -> int:
+        """Cập nhật last_crawled / subscribers từ các item channels.list vừa crawl."""
+        now = time.time() if now is None else now
+        updated = 0
+        for item in items:
+            cid = item.get("id")
+            if not cid:
+                continue
+            subs = (item.get("statistics") or {}).get("subscriberCount")
+            self.channels[cid] = ChannelCrawlState(last_crawled=now, subscribers=int(subs or 0))
+            updated += 1
+        return updated
+
+    def summary(self, now: Optional[float] = None) -> str:
+        now = time.time() if now is None else now
+        due = len(self.due_ids(self.channels, now))
+        stamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M")
+        return f"🗓️ Channel {stamp}: {len(self.channels)} channel đã crawl, {due} quá TTL"
+
+
+def load_channel_index(cfg) -> ChannelIndex:
+    """Tạo ChannelIndex từ EnvConfig (channel_state_file, channel_ttl_hours)."""
+    state_path = Path(cfg.channel_state_file) if cfg.channel_state_file else DEFAULT_CHANNEL_STATE_PATH
+    return ChannelIndex(state_path=state_path, base_ttl=cfg.channel_ttl_hours * HOUR)
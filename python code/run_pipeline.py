@@ -0,0 +1,305 @@
+"""
+Chạy toàn bộ pipeline trong 1 process theo DAG:
+
+    search → details → preprocess_video ─┬→ upsert_video → captions
+                                          └→ channel_crawl → channel_preprocess → upsert_channel
+
+Output giữa các stage truyền trực tiếp trong bộ nhớ (không đọc lại từ GCS); file raw trên GCS
+vẫn được ghi nhưng chạy nền (side output) song song với stage kế tiếp.
+Nhánh captions và nhánh channel chạy song song.
+
+    python "python code/run_pipeline.py"                                  # cả DAG
+    python "python code/run_pipeline.py" --only channel_preprocess upsert_channel
+    python "python code/run_pipeline.py" --skip captions
+
+Stage không chạy trong lần này (--only/--skip) → stage phụ thuộc đọc output đã lưu (file mới nhất
+trên GCS / bảng staging), giống khi chạy từng script riêng lẻ.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent
+sys.path.append(str(ROOT))
+import env_utils
+import gcp_io
+import lang_detect
+import metrics
+
+TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+
+
+def load_stage(relpath: str, name: str):
+    """Import script stage có tên bắt đầu bằng số (không import trực tiếp được)."""
+    spec = importlib.util.spec_from_file_location(name, ROOT / relpath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+search = load_stage("1_crawl_video/1_crawl_from_search.py", "crawl_from_search")
+details = load_stage("1_crawl_video/2_crawl_video_details.py", "crawl_video_details")
+video_prep = load_stage("1_crawl_video/3_preprocessing_video.py", "preprocessing_video")
+video_upsert = load_stage("1_crawl_video/4_upsert_to_table.py", "upsert_video")
+captions = load_stage("1_crawl_video/5_crawl_caption.py", "crawl_caption")
+channel_crawl = load_stage("2_crawl_channel/1_crawl_raw.py", "crawl_channel_raw")
+channel_prep = load_stage("2_crawl_channel/2_preprocessing.py", "preprocessing_channel")
+channel_upsert = load_stage("2_crawl_channel/3_upsert_to_table.py", "upsert_channel")
+
+
+# ----------------------------
+# CONTEXT
+# ----------------------------
+class PipelineContext:
+    """cfg + output trong bộ nhớ của các stage đã chạy + pool upload nền cho side output."""
+
+    def __init__(self, cfg: env_utils.EnvConfig, stages: Dict[str, "Stage"], side_workers: int = 2):
+        self.cfg = cfg
+        self.ts = datetime.now(TZ).strftime("_%Y%m%d_%H%M%S")
+        self.outputs: Dict[str, Any] = {}
+        self._stages = stages
+        self._side_pool = ThreadPoolExecutor(max_workers=side_workers, thread_name_prefix="side-output")
+        self._side_futures: List[Tuple[str, Future]] = []
+
+    def output(self, name: str) -> Any:
+        """Output của stage `name`: trong bộ nhớ nếu đã chạy ở lần này, ngược lại đọc bản đã lưu (hoặc None)."""
+        if name in self.outputs:
+            return self.outputs[name]
+        stage = self._stages[name]
+        return stage.load(self) if stage.load else None
+
+    def side_output(self, label: str, fn: Callable[..., Any], *args: Any) -> None:
+        """Ghi side output (vd file raw lên GCS) ở background; không chặn stage kế tiếp."""
+        # giữ stage hiện tại → bytes GCS của side output tính cho stage sinh ra nó
+        self._side_futures.append((label, self._side_pool.submit(metrics.bind(fn), *args)))
+
+    def drain(self) -> List[str]:
+        """Đợi mọi side output; trả về danh sách lỗi."""
+        errors = []
+        for label, fut in self._side_futures:
+            try:
+                print(f"📤 {label}: {fut.result()}")
+            except Exception as e:
+                errors.append(f"{label}: {e}")
+        self._side_pool.shutdown(wait=True)
+        return errors
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[PipelineContext], Any]
+    deps: Tuple[str, ...] = ()
+    # đọc output đã lưu khi stage không chạy trong lần này
+    load: Optional[Callable[[PipelineContext], Any]] = None
+
+
+def _read_latest(prefix_attr: str) -> Callable[[PipelineContext], pd.DataFrame]:
+    def _load(ctx: PipelineContext) -> pd.DataFrame:
+        cfg = ctx.cfg
+        return gcp_io.read_latest_json_from_gcs(
+            bucket=cfg.bucket_name,
+            prefix=getattr(cfg, prefix_attr),
+            project_id=cfg.project_id,
+        )
+    return _load
+
+
+# ----------------------------
+# STAGES
+# ----------------------------
+def _no_new_rows(ctx: PipelineContext, name: str) -> bool:
+    """Stage `name` đã chạy ở lần này nhưng không ra dòng nào → stage sau không ghi đè staging / MERGE."""
+    if name not in ctx.outputs:
+        return False
+    out = ctx.outputs[name]
+    return out is None or len(out) == 0
+
+
+def run_search(ctx: PipelineContext) -> List[Dict[str, Any]]:
+    results = search.run_search(ctx.cfg)
+    ctx.side_output("search raw", search.upload_search_results, ctx.cfg, results, ctx.ts)
+    return results
+
+
+def run_details(ctx: PipelineContext) -> List[Dict[str, Any]]:
+    df_search = pd.DataFrame(ctx.output("search"))
+    items = list(details.iter_due_video_details(ctx.cfg, df_search))
+    ctx.side_output("video details raw", details.upload_video_details, ctx.cfg, items, ctx.ts)
+    return items
+
+
+def run_preprocess_video(ctx: PipelineContext) -> pd.DataFrame:
+    # detector (SQLite) tạo trong thread của stage
+    lang_detect.set_detector(lang_detect.load_detector(ctx.cfg))
+    df_raw = pd.DataFrame(ctx.output("details"))
+    rows_in = len(df_raw)
+    df_clean = video_prep.preprocess(df_raw)
+    metrics.add_rows(rows_in=rows_in, rows_out=len(df_clean))
+    if df_clean.empty:
+        # không ghi đè staging bằng frame rỗng (mất schema → upsert / get_channel_list lỗi)
+        print("⏭️ preprocess_video: không có video mới, bỏ qua nạp staging")
+        return df_clean
+    video_prep.load_to_staging(ctx.cfg, df_clean)
+    return df_clean
+
+
+def run_upsert_video(ctx: PipelineContext) -> Optional[gcp_io.MergeStats]:
+    if _no_new_rows(ctx, "preprocess_video"):
+        print("⏭️ upsert_video: không có video mới")
+        return None
+    return video_upsert.upsert_videos(ctx.cfg)
+
+
+def run_captions(ctx: PipelineContext) -> int:
+    return captions.run_captions(ctx.cfg)
+
+
+def run_channel_crawl(ctx: PipelineContext) -> List[Dict[str, Any]]:
+    df_videos = ctx.output("preprocess_video")
+    channel_list = None
+    if df_videos is not None:
+        channel_list = df_videos["channelId"].dropna().astype(str).unique().tolist()
+    results = channel_crawl.run_channel_crawl(ctx.cfg, channel_list)
+    if results:
+        ctx.side_output("channel raw", channel_crawl.upload_channel_results, ctx.cfg, results, ctx.ts)
+    else:
+        print(channel_crawl.NO_CHANNEL_DUE)
+    return results
+
+
+def run_channel_preprocess(ctx: PipelineContext) -> pd.DataFrame:
+    df_raw = pd.DataFrame(ctx.output("channel_crawl"))
+    if df_raw.empty:
+        print("⏭️ channel_preprocess: không có channel đến hạn")
+        return channel_prep.clean_channels(df_raw)
+    lang_detect.set_detector(lang_detect.load_detector(ctx.cfg))
+    rows_in = len(df_raw)
+    df = channel_prep.clean_channels(df_raw)
+    metrics.add_rows(rows_in=rows_in, rows_out=len(df))
+    channel_prep.load_to_staging(ctx.cfg, df)
+    return df
+
+
+def run_upsert_channel(ctx: PipelineContext) -> Optional[gcp_io.MergeStats]:
+    if _no_new_rows(ctx, "channel_preprocess"):
+        print("⏭️ upsert_channel: không có channel đến hạn")
+        return None
+    return channel_upsert.upsert_channels(ctx.cfg)
+
+
+STAGES: List[Stage] = [
+    Stage("search", run_search, load=_read_latest("search_result_raw")),
+    Stage("details", run_details, ("search",), load=_read_latest("detailed_video_info")),
+    # không chạy → channel_crawl lấy channelId từ bảng video staging
+    Stage("preprocess_video", run_preprocess_video, ("details",)),
+    Stage("upsert_video", run_upsert_video, ("preprocess_video",)),
+    Stage("captions", run_captions, ("upsert_video",)),
+    Stage("channel_crawl", run_channel_crawl, ("preprocess_video",), load=_read_latest("channel_raw_info")),
+    Stage("channel_preprocess", run_channel_preprocess, ("channel_crawl",)),
+    Stage("upsert_channel", run_upsert_channel, ("channel_preprocess",)),
+]
+
+
+# ----------------------------
+# RUNNER
+# ----------------------------
+def select_stages(stages: Sequence[Stage], only: Optional[Sequence[str]] = None, skip: Sequence[str] = ()) -> List[Stage]:
+    names = [s.name for s in stages]
+    for n in list(only or []) + list(skip):
+        if n not in names:
+            raise ValueError(f"❌ Unknown stage: {n}. Known: {names}")
+    selected = set(only) if only else set(names)
+    return [s for s in stages if s.name in selected and s.name not in skip]
+
+
+def _run_stage(stage: Stage, ctx: PipelineContext) -> Any:
+    with metrics.stage(stage.name):
+        return stage.run(ctx)
+
+
+def run_dag(ctx: PipelineContext, stages: Sequence[Stage], max_workers: int = 4) -> Dict[str, str]:
+    """
+    Chạy các stage theo phụ thuộc; stage nào đủ deps thì chạy ngay (song song tối đa max_workers).
+    Dep không nằm trong danh sách chạy → coi như đã xong (đọc output đã lưu).
+    Stage lỗi → các stage phụ thuộc bị bỏ qua, nhánh khác vẫn chạy.
+    Trả về {stage: 'ok' | 'failed' | 'skipped'}.
+    """
+    pending = {s.name: s for s in stages}
+    status: Dict[str, str] = {}
+    running: Dict[Future, Tuple[str, float]] = {}
+
+    def blocked(stage: Stage) -> bool:
+        return any(d in pending or status.get(d) == "running" for d in stage.deps)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        while pending or running:
+            # bỏ qua stage có dep lỗi
+            for name, stage in list(pending.items()):
+                if any(status.get(d) in ("failed", "skipped") for d in stage.deps):
+                    status[name] = "skipped"
+                    del pending[name]
+                    print(f"⏭️ {name}: bỏ qua (dep lỗi)")
+
+            for name, stage in list(pending.items()):
+                if not blocked(stage):
+                    del pending[name]
+                    status[name] = "running"
+                    print(f"▶️ {name}")
+                    running[pool.submit(_run_stage, stage, ctx)] = (name, time.perf_counter())
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, t0 = running.pop(fut)
+                try:
+                    ctx.outputs[name] = fut.result()
+                    status[name] = "ok"
+                    print(f"✅ {name}: {time.perf_counter() - t0:.1f}s")
+                except Exception as e:
+                    status[name] = "failed"
+                    print(f"❌ {name}: {e}")
+    return status
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chạy pipeline YouTube theo DAG trong 1 process.")
+    parser.add_argument("--only", nargs="+", metavar="STAGE", help="chỉ chạy các stage này")
+    parser.add_argument("--skip", nargs="+", metavar="STAGE", default=[], help="bỏ qua các stage này")
+    parser.add_argument("--workers", type=int, default=4, help="số stage chạy song song tối đa")
+    args = parser.parse_args()
+
+    cfg = env_utils.load_env()
+    gcp_io.configure_backend(cfg.storage_backend, cfg.local_backend_dir)
+    stages = select_stages(STAGES, args.only, args.skip)
+    ctx = PipelineContext(cfg, {s.name: s for s in STAGES})
+
+    t0 = time.perf_counter()
+    status = run_dag(ctx, stages, max_workers=args.workers)
+    errors = ctx.drain()
+
+    print(f"⏱️ Pipeline: {time.perf_counter() - t0:.1f}s")
+    for name, st in status.items():
+        print(f"   {name:<20} {st}")
+    for err in errors:
+        print(f"❌ side output {err}")
+    print(metrics.summary())
+    metrics.save_report(cfg)
+    if errors or any(st != "ok" for st in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
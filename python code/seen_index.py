@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parents[1] / ".cache" / "seen_videos.npy"
+
+
+def _as_bytes(ids: Iterable[str]) -> np.ndarray:
+    return np.asarray([str(i).encode("ascii", "ignore") for i in ids], dtype=bytes)
+
+
+class SeenIndex:
+    """
+    Tập videoId đã thấy qua mọi lần chạy, lưu chính xác dưới dạng mảng bytes đã sort (~11 byte/ID,
+    1 triệu ID ≈ 11 MB), tra cứu bằng binary search (np.searchsorted).
+    ID thêm trong lần chạy nằm ở set riêng, chỉ gộp vào mảng sort khi save().
+    """
+
+    def __init__(self, path: Optional[Path] = DEFAULT_INDEX_PATH):
+        self.path = Path(path) if path else None
+        self._sorted = np.asarray([], dtype=bytes)
+        self._pending: set = set()
+        self._load()
+
+    # ---------- state ----------
+    def _load(self) -> None:
+        if not self.path or not self.path.exists():
+            return
+        try:
+            self._sorted = np.load(self.path, allow_pickle=False)
+        except (OSError, ValueError):
+            return
+
+    def save(self) -> None:
+        if not self.path or not self._pending:
+            return
+        # union1d: sort + bỏ trùng; tự nới độ rộng dtype nếu có ID dài hơn
+        self._sorted = np.union1d(self._sorted, _as_bytes(self._pending))
+        self._pending.clear()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp.npy")
+        np.save(tmp, self._sorted, allow_pickle=False)
+        os.replace(tmp, self.path)
+
+    # ---------- lookup ----------
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._pending)
+
+    def _in_sorted(self, keys: np.ndarray) -> np.ndarray:
+        if not len(self._sorted) or not len(keys):
+            return np.zeros(len(keys), dtype=bool)
+        pos = np.searchsorted(self._sorted, keys)
+        pos[pos == len(self._sorted)] = 0
+        return self._sorted[pos] == keys
+
+    def __contains__(self, video_id: str) -> bool:
+        video_id = str(video_id)
+        return video_id in self._pending or bool(self._in_sorted(_as_bytes([video_id]))[0])
+
+    def filter_new(self, ids: Iterable[str]) -> List[str]:
+        """ID chưa có trong index (giữ thứ tự, bỏ trùng); 1 lần searchsorted cho cả trang."""
+        ids = [i for i in dict.fromkeys(str(i) for i in ids if i) if i not in self._pending]
+        known = self._in_sorted(_as_bytes(ids))
+        return [i for i, k in zip(ids, known) if not k]
+
+    def add(self, ids: Iterable[str]) -> None:
+        self._pending.update(self.filter_new(ids))
+
+    def summary(self) -> str:
+        return f"👁️ Seen index: {len(self._sorted)} video đã biết, +{len(self._pending)} mới"
+
+
+def load_seen_index(cfg) -> SeenIndex:
+    """Tạo SeenIndex từ EnvConfig (seen_index_file)."""
+    path = Path(cfg.seen_index_file) if cfg.seen_index_file else DEFAULT_INDEX_PATH
+    return SeenIndex(path=path)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import pandas as pd
+from google.cloud import bigquery
+
+import env_utils
+import gcp_io
+
+
+# Lịch sử số liệu (id, crawl_date, counters) theo từng lần refresh:
+#   - <history>         : append-only, partition theo crawl_date (DATE), cluster theo id → load job, không MERGE
+#   - <history>_latest  : bản mới nhất mỗi id, cập nhật tăng dần từ các partition history kể từ watermark
+# Truy vấn xu hướng chỉ đọc partition cần, vd:
+#   SELECT crawl_date, viewCount FROM `p.d.video_stats_history`
+#   WHERE crawl_date BETWEEN '2025-10-01' AND '2025-10-31' AND id = 'abc'
+# Bật bằng VIDEO_STATS_HISTORY_TABLE / CHANNEL_STATS_HISTORY_TABLE ("" = tắt).
+LATEST_SUFFIX = "_latest"
+DELTA_SUFFIX = "_delta"      # bảng tạm trong staging dataset cho lần cập nhật latest
+
+
+@dataclass(frozen=True)
+class HistorySpec:
+    counters: Tuple[str, ...]
+    table_attr: str          # field của EnvConfig chứa tên bảng history
+
+
+SPECS = {
+    "video": HistorySpec(("viewCount", "likeCount", "commentCount"), "video_stats_history_table"),
+    "channel": HistorySpec(("viewCount", "subscriberCount", "videoCount"), "channel_stats_history_table"),
+}
+
+
+def history_table(cfg: env_utils.EnvConfig, kind: str) -> str:
+    return getattr(cfg, SPECS[kind].table_attr)
+
+
+def is_enabled(cfg: env_utils.EnvConfig, kind: str) -> bool:
+    return bool(history_table(cfg, kind))
+
+
+def history_schema(spec: HistorySpec) -> list:
+    return [
+        bigquery.SchemaField("id", "STRING"),
+        bigquery.SchemaField("crawl_date", "DATE"),
+        bigquery.SchemaField("recorded_at", "TIMESTAMP"),
+        *[bigquery.SchemaField(c, "INT64") for c in spec.counters],
+    ]
+
+
+def history_frame(df: pd.DataFrame, spec: HistorySpec) -> pd.DataFrame:
+    """df đã tiền xử lý → (id, crawl_date, recorded_at, counters); counter thiếu → NULL."""
+    out = pd.DataFrame({
+        "id": df["id"].astype(str),
+        "crawl_date": pd.to_datetime(df["crawl_date"]).dt.date,
+        "recorded_at": pd.Timestamp.now(tz="UTC"),
+    })
+    for c in spec.counters:
+        out[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64") if c in df.columns else pd.NA
+    return out.reset_index(drop=True)
+
+
+def append_history(cfg: env_utils.EnvConfig, kind: str, df: pd.DataFrame) -> int:
+    """Append 1 dòng / id vào bảng history (load job WRITE_APPEND). Tắt hoặc df rỗng → 0."""
+    if not is_enabled(cfg, kind) or df.empty:
+        return 0
+    spec = SPECS[kind]
+    target = gcp_io.BQTarget(project_id=cfg.project_id, dataset=cfg.clean_dataset, table=history_table(cfg, kind))
+    gcp_io.write_df_to_bq(
+        history_frame(df, spec),
+        target,
+        write_mode="append",
+        schema=history_schema(spec),
+        partition_field="crawl_date",
+        clustering_fields=["id"],
+    )
+    return len(df)
+
+
+def _watermark(cfg: env_utils.EnvConfig, latest: str) -> Optional[str]:
+    """crawl_date lớn nhất đã gộp vào latest ('YYYY-MM-DD'), None nếu latest chưa có."""
+    if not gcp_io.table_columns(cfg.project_id, cfg.clean_dataset, latest):
+        return None
+    rows = gcp_io.execute_sql(
+        project_id=cfg.project_id,
+        query=f"SELECT MAX(crawl_date) AS w FROM `{cfg.project_id}.{cfg.clean_dataset}.{latest}`",
+    )
+    w = next(iter(rows))["w"]
+    return str(w)[:10] if w is not None else None
+
+
+def refresh_latest(cfg: env_utils.EnvConfig, kind: str) -> Optional[gcp_io.MergeStats]:
+    """
+    Cập nhật <history>_latest tăng dần: lấy bản mới nhất mỗi id trong các partition history
+    có crawl_date >= watermark (predicate hằng → chỉ quét các partition đó), ghi ra bảng delta,
+    rồi MERGE vào latest (latest chưa có → dựng từ toàn bộ history).
+    """
+    if not is_enabled(cfg, kind):
+        return None
+    spec = SPECS[kind]
+    history = history_table(cfg, kind)
+    latest = history + LATEST_SUFFIX
+    cols = ["id", "crawl_date", "recorded_at", *spec.counters]
+    cols_sql = ", ".join(cols)
+
+    watermark = _watermark(cfg, latest)
+    where = f"WHERE crawl_date >= '{watermark}'" if watermark else ""
+    query = f"""
+    SELECT {cols_sql} FROM (
+      SELECT {cols_sql},
+             ROW_NUMBER() OVER (PARTITION BY id ORDER BY crawl_date DESC, recorded_at DESC) AS rn
+      FROM `{cfg.project_id}.{cfg.clean_dataset}.{history}`
+      {where}
+    ) WHERE rn = 1
+    """
+    delta = gcp_io.BQTarget(project_id=cfg.project_id, dataset=cfg.staging_dataset, table=history + DELTA_SUFFIX)
+    n = gcp_io.query_to_table(query, delta, write_mode="overwrite")
+    print(f"📚 {kind} history: {n} id mới nhất từ crawl_date >= {watermark or '(toàn bộ)'}")
+
+    return gcp_io.merge_tables(
+        project_id=cfg.project_id,
+        src_dataset=cfg.staging_dataset,
+        target_dataset=cfg.clean_dataset,
+        target_table=latest,
+        staging_table=delta.table,
+        updated_cols=cols[1:],
+        all_cols=cols,
+        cluster_cols=["id"],
+        skip_unchanged=False,   # crawl_date luôn tiến lên → watermark lần sau đúng
+    )
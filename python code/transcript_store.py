@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List
+
+import pandas as pd
+from google.cloud import bigquery
+
+import env_utils
+import gcp_io
+
+
+# Lưu transcript theo 3 bảng (thay cho 1 dòng 'transcript' = cả chuỗi nối, lỗi = 'No Transcript'):
+#   - <captions>           : id, lang, content_hash, segment_count, crawled_at  (1 dòng / video có transcript)
+#   - <captions>_segments  : content_hash, text[], start[], duration[]  (mảng theo cột, 1 dòng / nội dung,
+#                            transcript giống hệt nhau giữa các video chỉ lưu 1 lần; cluster theo content_hash)
+#   - <captions>_status    : id, status, attempted_at  (video không có transcript / bị throttle)
+# BigQuery lưu theo cột + nén, nên mảng text / start / duration nén tốt hơn 1 chuỗi dài và
+# truy vấn theo khoảng thời gian chỉ đọc các phần tử cần, vd:
+#   SELECT c.id, t AS text
+#   FROM `p.d.video_captions` c JOIN `p.d.video_captions_segments` s USING (content_hash),
+#        UNNEST(s.text) t WITH OFFSET i
+#   WHERE s.start[OFFSET(i)] BETWEEN 60 AND 120
+SEGMENTS_SUFFIX = "_segments"
+STATUS_SUFFIX = "_status"
+
+STATUS_NONE = "none"              # video không có / không fetch được transcript → không crawl lại
+STATUS_THROTTLED = "throttled"    # hết lượt retry vì bị chặn → lần chạy sau thử lại
+
+CAPTION_SCHEMA = [
+    bigquery.SchemaField("id", "STRING"),
+    bigquery.SchemaField("lang", "STRING"),
+    bigquery.SchemaField("content_hash", "STRING"),
+    bigquery.SchemaField("segment_count", "INT64"),
+    bigquery.SchemaField("crawled_at", "TIMESTAMP"),
+]
+SEGMENT_SCHEMA = [
+    bigquery.SchemaField("content_hash", "STRING"),
+    bigquery.SchemaField("text", "STRING", mode="REPEATED"),
+    bigquery.SchemaField("start", "FLOAT64", mode="REPEATED"),
+    bigquery.SchemaField("duration", "FLOAT64", mode="REPEATED"),
+]
+# cột của bảng captions cũ (id, transcript, lang): schema load phải khai báo lại (NULLABLE) thì mới append được
+LEGACY_CAPTION_FIELDS = [bigquery.SchemaField("transcript", "STRING", mode="NULLABLE")]
+STATUS_SCHEMA = [
+    bigquery.SchemaField("id", "STRING"),
+    bigquery.SchemaField("status", "STRING"),
+    bigquery.SchemaField("attempted_at", "TIMESTAMP"),
+]
+
+
+@dataclass
+class Segments:
+    text: List[str]
+    start: List[float]
+    duration: List[float]
+
+    @property
+    def content_hash(self) -> str:
+        """Hash nội dung (text + timing) → khoá dedup trong bảng segments."""
+        raw = json.dumps([self.text, self.start, self.duration], ensure_ascii=False, separators=(",", ":"))
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _attr(item: Any, key: str) -> Any:
+    return item[key] if isinstance(item, dict) else getattr(item, key)
+
+
+def to_segments(transcript: Iterable[Any]) -> Segments:
+    """Transcript từ youtube_transcript_api (dict hoặc FetchedTranscriptSnippet) → mảng theo cột."""
+    text, start, duration = [], [], []
+    for item in transcript:
+        text.append(_attr(item, "text"))
+        start.append(float(_attr(item, "start") or 0.0))
+        duration.append(float(_attr(item, "duration") or 0.0))
+    return Segments(text, start, duration)
+
+
+def ok_row(video_id: str, lang: str, segments: Segments) -> Dict[str, Any]:
+    return {"id": video_id, "lang": lang, "text": segments.text, "start": segments.start, "duration": segments.duration}
+
+
+def failed_row(video_id: str, status: str) -> Dict[str, Any]:
+    return {"id": video_id, "status": status}
+
+
+def _from_legacy(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Dòng spill cũ {'id', 'transcript', 'lang'} → định dạng mới."""
+    if row.get("transcript") in (None, "No Transcript"):
+        return failed_row(row["id"], STATUS_NONE)
+    return ok_row(row["id"], row.get("lang"), Segments([row["transcript"]], [0.0], [0.0]))
+
+
+class TranscriptStore:
+    """Ghi các dòng transcript / lỗi vào 3 bảng; segments chỉ ghi content_hash chưa có."""
+
+    def __init__(self, project_id: str, dataset: str, table: str):
+        self.captions = gcp_io.BQTarget(project_id=project_id, dataset=dataset, table=table)
+        self.segments = gcp_io.BQTarget(project_id=project_id, dataset=dataset, table=table + SEGMENTS_SUFFIX)
+        self.status = gcp_io.BQTarget(project_id=project_id, dataset=dataset, table=table + STATUS_SUFFIX)
+        self._known_hashes: set = set()
+        self._columns: Dict[str, List[str]] = {}    # table → cột hiện có ([] = chưa có bảng)
+        self.deduped = 0
+
+    def _append(self, df: pd.DataFrame, target: gcp_io.BQTarget, schema: list, cluster: List[str], **kwargs: Any) -> None:
+        """
+        Append df; clustering chỉ đặt khi load job tạo bảng mới — bảng có sẵn (vd captions cũ không cluster)
+        mà load job khai báo clustering khác thì BigQuery từ chối.
+        Cột cũ của bảng có sẵn mà schema mới không có (LEGACY_CAPTION_FIELDS) được khai báo thêm (NULLABLE).
+        """
+        if target.table not in self._columns:
+            self._columns[target.table] = gcp_io.table_columns(target.project_id, target.dataset, target.table)
+        existing = self._columns[target.table]
+        names = {f.name for f in schema}
+        legacy = [f for f in LEGACY_CAPTION_FIELDS if f.name in existing and f.name not in names]
+        if legacy:
+            # client BigQuery yêu cầu mọi field trong schema có cột trong df
+            df = df.assign(**{f.name: None for f in legacy})
+            schema = schema + legacy
+        gcp_io.write_df_to_bq(df, target, write_mode="append", schema=schema,
+                              clustering_fields=None if existing else cluster, **kwargs)
+        if not existing:
+            self._columns[target.table] = [f.name for f in schema]
+
+    def _existing_hashes(self, hashes: List[str]) -> set:
+        if not hashes or not gcp_io.table_columns(self.segments.project_id, self.segments.dataset, self.segments.table):
+            return set()
+        in_list = ", ".join(f"'{h}'" for h in hashes)   # hex → an toàn khi ghép chuỗi
+        rows = gcp_io.execute_sql(
+            project_id=self.segments.project_id,
+            query=f"SELECT content_hash FROM `{self.segments.fqtn}` WHERE content_hash IN ({in_list})",
+        )
+        return {r["content_hash"] for r in rows}
+
+    def write(self, rows: List[Dict[str, Any]]) -> int:
+        """Ghi 1 micro-batch; trả về số video đã ghi (có transcript + lỗi)."""
+        now = pd.Timestamp.now(tz="UTC")
+        captions, segments, status = [], {}, []
+        for row in rows:
+            if "transcript" in row:
+                row = _from_legacy(row)
+            if "status" in row:
+                status.append({"id": row["id"], "status": row["status"], "attempted_at": now})
+                continue
+            seg = Segments(row["text"], row["start"], row["duration"])
+            h = seg.content_hash
+            captions.append({"id": row["id"], "lang": row["lang"], "content_hash": h,
+                             "segment_count": len(seg.text), "crawled_at": now})
+            segments.setdefault(h, seg)
+
+        new_hashes = [h for h in segments if h not in self._known_hashes]
+        existing = self._existing_hashes(new_hashes)
+        new_hashes = [h for h in new_hashes if h not in existing]
+        self.deduped += len(captions) - len(new_hashes)
+        self._known_hashes.update(segments)
+
+        if new_hashes:
+            df = pd.DataFrame(
+                [{"content_hash": h, "text": segments[h].text, "start": segments[h].start,
+                  "duration": segments[h].duration} for h in new_hashes]
+            )
+            self._append(df, self.segments, SEGMENT_SCHEMA, ["content_hash"])
+        if captions:
+            # bảng captions cũ (id, transcript, lang): giữ transcript (NULL) trong schema + thêm cột mới
+            self._append(pd.DataFrame(captions), self.captions, CAPTION_SCHEMA, ["id"],
+                         schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION])
+        if status:
+            self._append(pd.DataFrame(status), self.status, STATUS_SCHEMA, ["id"])
+        return len(captions) + len(status)
+
+    def summary(self) -> str:
+        return f"🧾 Transcript store: {self.deduped} transcript trùng nội dung không ghi lại segments"
+
+
+def load_store(cfg: env_utils.EnvConfig) -> TranscriptStore:
+    """TranscriptStore cho bảng captions trong DATASET (VIDEO_CAPTIONS_TABLE)."""
+    return TranscriptStore(cfg.project_id, cfg.clean_dataset, cfg.video_captions_table)
+
+
+def done_id_queries(cfg: env_utils.EnvConfig) -> List[str]:
+    """Các SELECT id không cần crawl nữa: đã có transcript, hoặc đã biết là không có transcript."""
+    queries = [f"SELECT DISTINCT id FROM `{cfg.project_id}.{cfg.clean_dataset}.{cfg.video_captions_table}`"]
+    status_table = cfg.video_captions_table + STATUS_SUFFIX
+    if gcp_io.table_columns(cfg.project_id, cfg.clean_dataset, status_table):
+        queries.append(
+            f"SELECT DISTINCT id FROM `{cfg.project_id}.{cfg.clean_dataset}.{status_table}` "
+            f"WHERE status = '{STATUS_NONE}'"
+        )
+    return queries
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import api_cache
+import metrics
+import quota
+
+
+# Client YouTube Data API v3 gọn nhẹ cho mọi crawler: gọi REST trực tiếp bằng requests
+# (không build discovery document của googleapiclient), 1 connection pool, cùng timeout / retry,
+# mọi response được ghi vào metrics (service "youtube").
+API_BASE = "https://www.googleapis.com/youtube/v3"
+MAX_IDS_PER_REQUEST = 50        # videos.list / channels.list nhận tối đa 50 ID
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 8
+# retry lỗi tạm thời (mạng / 5xx); 403 quota không retry
+RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504), allowed_methods=("GET",))
+
+
+@dataclass
+class ApiResponse:
+    status: int                          # 0 = lỗi mạng (không có response)
+    payload: Optional[Dict[str, Any]]    # JSON khi 200
+    text: str                            # body / thông báo lỗi
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    @property
+    def items(self) -> List[Dict[str, Any]]:
+        return (self.payload or {}).get("items", [])
+
+    @property
+    def next_page_token(self) -> Optional[str]:
+        return (self.payload or {}).get("nextPageToken")
+
+
+def chunk_ids(ids: Iterable[str], size: int = MAX_IDS_PER_REQUEST) -> Iterator[List[str]]:
+    """Chia ID thành các batch ≤ size (giới hạn 50 ID/request của API)."""
+    batch: List[str] = []
+    for i in ids:
+        batch.append(i)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def make_pooled_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """requests.Session với connection pool đủ lớn cho pool_size request song song (+ retry, metrics)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=RETRY)
+    session.mount("https://", adapter)
+    return metrics.instrument_session(session, "youtube")
+
+
+class YouTubeClient:
+    """Các endpoint YouTube Data API mà pipeline dùng; an toàn khi gọi từ nhiều thread."""
+
+    def __init__(
+        self,
+        api_key: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        session: Optional[requests.Session] = None,
+    ):
+        if not api_key:
+            raise RuntimeError("Thiếu API key YouTube.")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = session or make_pooled_session(pool_size)
+
+    def __enter__(self) -> "YouTubeClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    # ---------- low level ----------
+    def get(self, resource: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> ApiResponse:
+        """GET {API_BASE}/{resource}; lỗi mạng → ApiResponse(status=0) thay vì raise."""
+        t0 = time.perf_counter()
+        try:
+            resp = self.session.get(
+                f"{API_BASE}/{resource}",
+                params={**params, "key": self.api_key},
+                headers=headers,
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            metrics.record_http("youtube", time.perf_counter() - t0, ok=False)
+            return ApiResponse(0, None, str(e))
+        return ApiResponse(resp.status_code, resp.json() if resp.status_code == 200 else None, resp.text)
+
+    # ---------- endpoints ----------
+    def search(self, q: str, page_size: int = 50, page_token: Optional[str] = None, **extra: Any) -> ApiResponse:
+        params = {"part": "snippet", "q": q, "type": "video", "order": "relevance", "maxResults": page_size, **extra}
+        if page_token:
+            params["pageToken"] = page_token
+        return self.get("search", params)
+
+    def videos(self, ids: List[str], part: str, headers: Optional[Dict[str, str]] = None) -> ApiResponse:
+        return self.get("videos", {"part": part, "id": ",".join(ids)}, headers)
+
+    def channels(self, ids: List[str], part: str, headers: Optional[Dict[str, str]] = None) -> ApiResponse:
+        return self.get("channels", {"part": part, "id": ",".join(ids)}, headers)
+
+    def playlist_items(
+        self,
+        playlist_id: str,
+        page_token: Optional[str] = None,
+        page_size: int = 50,
+        part: str = "snippet,contentDetails",
+    ) -> ApiResponse:
+        params = {"part": part, "playlistId": playlist_id, "maxResults": page_size}
+        if page_token:
+            params["pageToken"] = page_token
+        return self.get("playlistItems", params)
+
+    # ---------- batched ----------
+    def list_by_ids(
+        self,
+        resource: str,
+        ids: Iterable[str],
+        part: str,
+        budget: Optional[quota.QuotaBudget] = None,
+        quota_stage: Optional[str] = None,
+        cache: Optional[api_cache.ResponseCache] = None,
+        request_pause: float = 0.1,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        videos.list / channels.list cho nhiều ID: batch 50 ID, trừ quota mỗi request (dừng khi stage hết),
+        If-None-Match theo etag nếu có cache (304 → item từ cache). Yield từng item ngay khi batch về.
+        ids theo thứ tự ưu tiên: thiếu quota thì bỏ phần đuôi (ưu tiên thấp nhất).
+        Batch lỗi bị bỏ qua; lỗi quota → đánh dấu hết quota và dừng.
+        """
+        ids = [str(i) for i in ids if i]
+        op = f"{resource}.list"
+        if budget is not None:
+            # chỉ giữ phần đầu (theo ưu tiên) mà quota còn lại của stage trả được
+            affordable = budget.remaining(quota_stage) // quota.endpoint_cost(op) * MAX_IDS_PER_REQUEST
+            if len(ids) > affordable:
+                print(f"⚠️ Quota stage {quota_stage} chỉ đủ {affordable}/{len(ids)} ID, bỏ phần ưu tiên thấp.")
+                ids = ids[:affordable]
+        if cache is not None:
+            # sort sau khi cắt theo quota → các batch 50 ID ổn định giữa các lần chạy (trúng cache)
+            # mà không đổi tập ID được crawl
+            ids = sorted(ids)
+
+        for n, batch in enumerate(chunk_ids(ids)):
+            start = n * MAX_IDS_PER_REQUEST
+            if budget is not None:
+                if not budget.can_afford(quota_stage, op):
+                    print(f"⚠️ Hết quota stage {quota_stage}, dừng ở {start}/{len(ids)}.")
+                    break
+                budget.charge(quota_stage, op)
+
+            def send(headers: Dict[str, str]):
+                resp = self.get(resource, {"part": part, "id": ",".join(batch)}, headers)
+                return resp.status, resp.payload, resp.text
+
+            status, items, err = api_cache.cached_fetch(cache, op, part, batch, send)
+            if items is not None:
+                print(f"✅ {op} {start} → {start + len(batch) - 1}" + (" (304, cache)" if status == 304 else ""))
+                yield from items
+            else:
+                print(f"❌ Lỗi batch {op} {start}-{start + len(batch) - 1}: {status}")
+                print(err[:500])
+                if budget is not None and quota.is_quota_error(status, err):
+                    budget.mark_exhausted()
+                    break
+            time.sleep(request_pause)
+
+
+def load_client(cfg, pool_size: int = DEFAULT_POOL_SIZE) -> YouTubeClient:
+    """Tạo YouTubeClient từ EnvConfig (api)."""
+    return YouTubeClient(cfg.api, pool_size=pool_size)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+CODE_DIR = Path(__file__).resolve().parents[1] / "python code"
+sys.path.insert(0, str(CODE_DIR))
+
+import env_utils  # noqa: E402
+import gcp_io  # noqa: E402
+import metrics  # noqa: E402
+
+
+def load_stage(relpath: str, name: str):
+    """Import script stage có tên bắt đầu bằng số (giống run_pipeline.load_stage)."""
+    spec = importlib.util.spec_from_file_location(name, CODE_DIR / relpath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def local_root(tmp_path):
+    """gcp_io chạy trên backend local (filesystem + SQLite) trong tmp_path."""
+    root = tmp_path / "local_backend"
+    gcp_io.configure_backend("local", str(root))
+    yield root
+    gcp_io.reset_clients()
+    gcp_io._backend, gcp_io._local_root = None, None
+
+
+@pytest.fixture
+def cfg(tmp_path, local_root) -> env_utils.EnvConfig:
+    """EnvConfig tối thiểu cho backend local; mọi file state nằm trong tmp_path."""
+    return env_utils.EnvConfig(
+        api="test-key",
+        project_id="local",
+        bucket_name="bucket",
+        search_result_raw="raw/search/",
+        detailed_video_info="raw/video_info/",
+        channel_raw_info="raw/channel_info/",
+        video_captions="raw/captions/",
+        clean_dataset="clean",
+        video_info_table="video_info",
+        channel_info_table="channel_info",
+        video_captions_table="video_captions",
+        staging_dataset="staging",
+        video_staging_table="video_staging",
+        channel_staging_table="channel_staging",
+        credentials="",
+        quota_state_file=str(tmp_path / "quota_state.json"),
+        api_cache_dir=str(tmp_path / "api_responses"),
+        seen_index_file=str(tmp_path / "seen_videos.npy"),
+        refresh_state_file=str(tmp_path / "refresh_state.json"),
+        channel_state_file=str(tmp_path / "channel_state.json"),
+        lang_cache_file=str(tmp_path / "lang_cache.sqlite"),
+        storage_backend="local",
+        local_backend_dir=str(local_root),
+        metrics_dir=str(tmp_path / "metrics"),
+    )
+
+
+@pytest.fixture(autouse=True)
+def _reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import api_cache
+
+
+ITEMS = [{"id": "v1", "statistics": {"viewCount": "10"}}]
+
+
+def _sender(responses, calls):
+    """send(headers) giả: trả lần lượt các response, ghi lại headers đã gửi."""
+    it = iter(responses)
+
+    def send(headers):
+        calls.append(dict(headers))
+        return next(it)
+    return send
+
+
+def test_make_key_ignores_id_and_part_order():
+    k1 = api_cache.ResponseCache.make_key("videos.list", "snippet,statistics", ["b", "a"])
+    k2 = api_cache.ResponseCache.make_key("videos.list", "statistics, snippet", ["a", "b"])
+    assert k1 == k2
+    assert k1 != api_cache.ResponseCache.make_key("channels.list", "snippet,statistics", ["a", "b"])
+
+
+def test_cached_fetch_304_reuses_items(tmp_path):
+    cache = api_cache.ResponseCache(tmp_path)
+    calls = []
+    send = _sender([(200, {"etag": "E1", "items": ITEMS}, ""), (304, None, "")], calls)
+
+    assert api_cache.cached_fetch(cache, "videos.list", "statistics", ["v1"], send) == (200, ITEMS, "")
+    assert api_cache.cached_fetch(cache, "videos.list", "statistics", ["v1"], send) == (304, ITEMS, "")
+    assert calls == [{}, {"If-None-Match": "E1"}]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cached_fetch_error_and_no_cache(tmp_path):
+    cache = api_cache.ResponseCache(tmp_path)
+    calls = []
+    send = _sender([(403, None, "quotaExceeded"), (200, {"items": ITEMS}, "")], calls)
+    assert api_cache.cached_fetch(cache, "videos.list", "statistics", ["v1"], send) == (403, None, "quotaExceeded")
+    # không cache → không gửi If-None-Match
+    assert api_cache.cached_fetch(None, "videos.list", "statistics", ["v1"], send) == (200, ITEMS, "")
+    assert calls == [{}, {}]
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    item_bytes = len(b'[{"id":"x"}]')
+    cache = api_cache.ResponseCache(tmp_path, max_bytes=2 * item_bytes)
+    cache.put("a", "Ea", [{"id": "x"}])
+    cache.put("b", "Eb", [{"id": "x"}])
+    assert cache.get("a") is not None          # a mới dùng → b là LRU
+    cache.put("c", "Ec", [{"id": "x"}])
+
+    assert cache.get("b") is None
+    assert cache.get("a").etag == "Ea"
+    assert cache.get("c").etag == "Ec"
+    assert not (tmp_path / "b.json").exists()
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_put_without_etag_or_too_large_is_skipped(tmp_path):
+    cache = api_cache.ResponseCache(tmp_path, max_bytes=10)
+    cache.put("a", None, [])
+    cache.put("b", "Eb", [{"id": "x" * 100}])
+    assert cache.get("a") is None and cache.get("b") is None
+
+
+def test_index_survives_reload(tmp_path):
+    with api_cache.ResponseCache(tmp_path) as cache:
+        cache.put("a", "Ea", ITEMS)
+    reloaded = api_cache.ResponseCache(tmp_path)
+    assert reloaded.get("a").items == ITEMS
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import pandas as pd
+
+import chunked
+import gcp_io
+
+
+def _collect():
+    loads = []
+
+    def load(df, write_mode, part, schema_update_options):
+        loads.append((write_mode, part, schema_update_options, df.copy()))
+    return loads, load
+
+
+def test_first_batch_overwrites_then_appends_deduped():
+    batches = [
+        pd.DataFrame({"id": ["a", "b", "a"], "x": [1, 2, 3]}),
+        pd.DataFrame({"id": ["b", "c"], "x": [4, 5]}),
+        pd.DataFrame({"id": ["a"], "x": [6]}),
+    ]
+    loads, load = _collect()
+    assert chunked.run_chunked(iter(batches), lambda df: df, load) == (6, 3, 2)
+
+    assert [(m, p, o) for m, p, o, _ in loads] == [("overwrite", 0, None), ("append", 1, chunked.APPEND_OPTIONS)]
+    assert pd.concat([df for *_, df in loads])["id"].tolist() == ["a", "b", "c"]
+    # giữ bản đầu tiên của id (giống drop_duplicates(keep='first') trên cả file)
+    assert loads[0][3].set_index("id")["x"].to_dict() == {"a": 1, "b": 2}
+
+
+def test_all_null_columns_dropped_per_batch():
+    loads, load = _collect()
+    chunked.run_chunked([pd.DataFrame({"id": ["a"], "tags": [None]})], lambda df: df, load)
+    assert loads[0][3].columns.tolist() == ["id"]
+
+
+def test_empty_batches_skip_and_call_on_empty():
+    loads, load = _collect()
+    emptied = []
+    batches = [pd.DataFrame({"id": ["a", "b"]}), pd.DataFrame({"id": ["c"]})]
+    result = chunked.run_chunked(batches, lambda df: df.iloc[0:0], load, on_empty=lambda: emptied.append(True))
+    assert result == (3, 0, 0)
+    assert loads == [] and emptied == [True]
+
+
+def test_no_batches_at_all_calls_on_empty():
+    emptied = []
+    assert chunked.run_chunked([], lambda df: df, _collect()[1], on_empty=lambda: emptied.append(True)) == (0, 0, 0)
+    assert emptied == [True]
+
+
+def test_on_empty_not_called_when_something_loaded():
+    emptied = []
+    chunked.run_chunked([pd.DataFrame({"id": ["a"]})], lambda df: df, _collect()[1], on_empty=lambda: emptied.append(1))
+    assert emptied == []
+
+
+def test_all_empty_run_truncates_staging(local_root):
+    # lần chạy trước để lại dữ liệu trong staging; lần này không có dòng nào → staging phải rỗng trước MERGE
+    target = gcp_io.BQTarget(project_id="p", dataset="staging", table="video_staging")
+    gcp_io.write_df_to_bq(pd.DataFrame({"id": ["old"]}), target, write_mode="overwrite")
+
+    chunked.run_chunked([pd.DataFrame()], lambda df: df, _collect()[1], on_empty=lambda: gcp_io.truncate_table(target))
+    assert gcp_io.get_bq_client("p").num_rows(target.fqtn) == 0
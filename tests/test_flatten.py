@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+import math
+
+import pandas as pd
+import pytest
+
+import flatten
+from flatten import field
+
+FIELDS = [
+    field("id", "id"),
+    field("snippet.title"),
+    field("snippet.thumbnails.default.url", "thumbnail"),
+    field("statistics.viewCount", kind="number"),
+    field("contentDetails.regionRestriction.blocked"),
+]
+
+
+@pytest.mark.parametrize(
+    "cell, expected",
+    [
+        ('{"a": 1, "b": [1, 2]}', {"a": 1, "b": [1, 2]}),
+        (b'{"a": 1}', {"a": 1}),
+        ("{'a': 1, 'b': None}", {"a": 1, "b": None}),   # repr Python từ CSV cũ
+        ({"a": 1}, {"a": 1}),
+        ([1, 2], [1, 2]),
+        ("not json", None),
+        ("__import__('os').system('true')", None),      # không eval
+        (None, None),
+        (float("nan"), None),
+        (3, None),
+    ],
+)
+def test_parse_json_cell(cell, expected):
+    assert flatten.parse_json_cell(cell) == expected
+
+
+def test_field_column_names():
+    assert field("statistics.viewCount").column == "viewCount"
+    assert field("contentDetails.regionRestriction.blocked").column == "regionRestriction.blocked"
+    assert field("id").column == "id"
+    with pytest.raises(ValueError):
+        field("x.y", kind="date")
+
+
+def test_flatten_frame_projects_only_requested_paths():
+    df = pd.DataFrame({
+        "id": ["v1", "v2"],
+        "snippet": [
+            {"title": "A", "thumbnails": {"default": {"url": "u1"}}, "tags": ["x"]},
+            json.dumps({"title": "B"}),
+        ],
+        "statistics": [{"viewCount": "10"}, "{'viewCount': 'n/a'}"],
+    })
+    out = flatten.flatten_frame(df, FIELDS)
+
+    # regionRestriction không có ở record nào → không có cột (giống json_normalize)
+    assert out.columns.tolist() == ["id", "title", "thumbnail", "viewCount"]
+    assert out["title"].tolist() == ["A", "B"]
+    assert out["thumbnail"].iloc[0] == "u1" and math.isnan(out["thumbnail"].iloc[1])
+    assert out["viewCount"].iloc[0] == 10 and math.isnan(out["viewCount"].iloc[1])
+
+
+def test_flatten_records_matches_flatten_frame():
+    records = [
+        {"id": "v1", "snippet": {"title": "A"}, "statistics": {"viewCount": "5"}},
+        json.dumps({"id": "v2", "snippet": {"title": "B"}}),
+    ]
+    by_records = flatten.flatten_records(records, FIELDS)
+    by_frame = flatten.flatten_frame(pd.DataFrame([json.loads(r) if isinstance(r, str) else r for r in records]), FIELDS)
+    pd.testing.assert_frame_equal(by_records, by_frame)
+
+
+@pytest.mark.parametrize("flat", [
+    lambda: flatten.flatten_frame(pd.DataFrame([]), FIELDS),
+    lambda: flatten.flatten_records([], FIELDS),
+])
+def test_empty_input_keeps_every_column(flat):
+    out = flat()
+    assert out.empty
+    assert out.columns.tolist() == [f.column for f in FIELDS]
+    assert out["viewCount"].dtype == "float64"
+    assert out["title"].dtype == object
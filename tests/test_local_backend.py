@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import pandas as pd
+
+import gcp_io
+import local_backend
+from local_backend import translate_sql
+
+
+def test_translate_sql_table_names_and_set_ops():
+    sql = translate_sql(
+        "(SELECT id FROM `p.staging.v`) EXCEPT DISTINCT (SELECT id FROM `p.clean.v`) "
+        "UNION DISTINCT SELECT id FROM `clean.w`"
+    )
+    assert '"staging.v"' in sql and '"clean.v"' in sql and '"clean.w"' in sql
+    assert "DISTINCT" not in sql
+    assert "(" not in sql and "`" not in sql
+
+
+def test_translate_sql_truncate():
+    assert translate_sql("TRUNCATE TABLE `p.staging.v`").strip() == 'DELETE FROM "staging.v"'
+
+
+def test_translate_sql_keeps_subquery_parens():
+    sql = translate_sql("SELECT COUNT(*) FROM (SELECT id FROM `p.d.t`)")
+    assert sql == 'SELECT COUNT(*) FROM (SELECT id FROM "d.t")'
+
+
+def test_information_schema_columns(local_root):
+    target = gcp_io.BQTarget(project_id="p", dataset="d", table="t")
+    gcp_io.write_df_to_bq(pd.DataFrame({"id": ["a"], "views": [1]}), target, write_mode="overwrite")
+    rows = gcp_io.execute_sql(
+        "p",
+        "SELECT column_name FROM `p.d.INFORMATION_SCHEMA.COLUMNS` WHERE table_name = 't' ORDER BY ordinal_position",
+    )
+    assert [r["column_name"] for r in rows] == ["id", "views"]
+
+
+def test_truncate_table_keeps_schema(local_root):
+    target = gcp_io.BQTarget(project_id="p", dataset="d", table="t")
+    assert gcp_io.truncate_table(target) is False
+    gcp_io.write_df_to_bq(pd.DataFrame({"id": ["a", "b"]}), target, write_mode="overwrite")
+    assert gcp_io.truncate_table(target) is True
+
+    client = gcp_io.get_bq_client("p")
+    assert isinstance(client, local_backend.LocalBigQueryClient)
+    assert client.num_rows(target.fqtn) == 0
+    assert gcp_io.table_columns("p", "d", "t") == ["id"]
+
+
+def test_ndjson_roundtrip_through_manifest(local_root):
+    records = [{"id": str(i), "n": i} for i in range(5)]
+    gcp_io.upload_ndjson_to_gcs("bucket", "raw/x/part.ndjson.gz", records, manifest_prefix="raw/x/")
+    df = gcp_io.read_latest_json_from_gcs("bucket", "raw/x/")
+    assert df.to_dict("records") == records
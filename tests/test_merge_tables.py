@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from datetime import date
+from types import SimpleNamespace
+
+import pandas as pd
+from google.cloud import bigquery
+
+import gcp_io
+
+COLS = ["id", "title", "viewCount", "crawl_date"]
+UPDATE = ["title", "viewCount", "crawl_date"]
+
+
+def _stage(df: pd.DataFrame) -> None:
+    gcp_io.write_df_to_bq(df, gcp_io.BQTarget(project_id="p", dataset="staging", table="v"), write_mode="overwrite")
+
+
+def _merge(**kwargs) -> gcp_io.MergeStats:
+    return gcp_io.merge_tables("p", "staging", "clean", "v", "v", UPDATE, COLS, **kwargs)
+
+
+def test_local_merge_inserts_then_updates_only_changed_rows(local_root):
+    _stage(pd.DataFrame({"id": ["a", "b"], "title": ["A", "B"], "viewCount": [1, 2], "crawl_date": ["d1", "d1"]}))
+    first = _merge()
+    assert (first.staging_rows, first.inserted, first.updated) == (2, 2, 0)
+
+    # a: đổi viewCount; b: chỉ đổi crawl_date (hash_exclude) → không update; c: mới
+    _stage(pd.DataFrame({"id": ["a", "b", "c"], "title": ["A", "B", "C"], "viewCount": [5, 2, 3],
+                         "crawl_date": ["d2", "d2", "d2"]}))
+    second = _merge()
+    assert (second.inserted, second.updated, second.unchanged) == (1, 1, 1)
+
+    target = gcp_io.get_bq_client("p").read_table("p.clean.v").set_index("id")
+    assert target["viewCount"].to_dict() == {"a": 5, "b": 2, "c": 3}
+    assert target["crawl_date"].to_dict() == {"a": "d2", "b": "d1", "c": "d2"}
+
+
+def test_local_merge_without_skip_unchanged_updates_every_match(local_root):
+    _stage(pd.DataFrame({"id": ["a"], "title": ["A"], "viewCount": [1], "crawl_date": ["d1"]}))
+    _merge()
+    assert _merge(skip_unchanged=False).updated == 1
+
+
+class _FakeBQ:
+    """Ghi lại câu query; staging có cột publishedAt (TIMESTAMP) với 3 ngày."""
+
+    def __init__(self):
+        self.queries = []
+
+    def get_table(self, fq):
+        schema = [bigquery.SchemaField("id", "STRING"), bigquery.SchemaField("publishedAt", "TIMESTAMP")]
+        return SimpleNamespace(schema=schema, num_rows=3, time_partitioning=object())
+
+    def query(self, sql, job_config=None):
+        self.queries.append(sql)
+        rows = []
+        if sql.startswith("SELECT DISTINCT CAST"):
+            rows = [{"d": date(2024, 1, 1)}, {"d": date(2024, 1, 2)}, {"d": date(2024, 3, 5)}]
+        stats = SimpleNamespace(inserted_row_count=1, updated_row_count=2)
+        return SimpleNamespace(result=lambda: rows, dml_stats=stats, total_bytes_processed=1024)
+
+
+def test_bigquery_merge_sql(monkeypatch):
+    fake = _FakeBQ()
+    monkeypatch.setattr(gcp_io, "get_bq_client", lambda *a, **k: fake)
+
+    stats = gcp_io.merge_tables("p", "staging", "clean", "v", "v", ["id"] + UPDATE, COLS, partition_col="publishedAt")
+    assert (stats.inserted, stats.updated, stats.unchanged, stats.bytes_processed) == (1, 2, 0, 1024)
+
+    sql = " ".join(fake.queries[-1].split())
+    assert sql.startswith("MERGE `p.clean.v` T USING `p.staging.v` S ON T.id = S.id AND (")
+    # predicate prune: ngày liên tiếp gộp thành 1 khoảng
+    assert "T.publishedAt >= TIMESTAMP '2024-01-01' AND T.publishedAt < TIMESTAMP '2024-01-03'" in sql
+    assert "T.publishedAt >= TIMESTAMP '2024-03-05' AND T.publishedAt < TIMESTAMP '2024-03-06'" in sql
+    # chỉ update khi hash cột đổi; crawl_date không tính vào hash, id không bị SET
+    assert ("WHEN MATCHED AND FARM_FINGERPRINT(TO_JSON_STRING(STRUCT(T.title AS title, T.viewCount AS viewCount)))"
+            " != FARM_FINGERPRINT(TO_JSON_STRING(STRUCT(S.title AS title, S.viewCount AS viewCount)))") in sql
+    assert "UPDATE SET T.title = S.title, T.viewCount = S.viewCount, T.crawl_date = S.crawl_date" in sql
+    assert "T.id = S.id," not in sql
+    assert "WHEN NOT MATCHED THEN INSERT (id,title,viewCount,crawl_date) VALUES (S.id,S.title,S.viewCount,S.crawl_date)" in sql
+
+
+def test_bigquery_merge_sql_insert_only(monkeypatch):
+    fake = _FakeBQ()
+    monkeypatch.setattr(gcp_io, "get_bq_client", lambda *a, **k: fake)
+    gcp_io.merge_tables("p", "staging", "clean", "v", "v", ["id"], COLS)
+
+    sql = " ".join(fake.queries[-1].split())
+    assert "WHEN MATCHED" not in sql and "UPDATE" not in sql
+    assert "ON T.id = S.id WHEN NOT MATCHED" in sql
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+def _stages():
+    return {s["stage"]: s for s in metrics.snapshot()["stages"]}
+
+
+def test_bind_attributes_worker_threads_to_stage():
+    with metrics.stage("captions"):
+        work = metrics.bind(lambda: metrics.add_rows(rows_in=1, rows_out=2))
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for f in [pool.submit(work) for _ in range(100)]:
+                f.result()
+    # không bind → thread pool chạy ngoài stage
+    with metrics.stage("other"):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            pool.submit(metrics.add_rows, 5).result()
+
+    stages = _stages()
+    assert (stages["captions"]["rows_in"], stages["captions"]["rows_out"]) == (100, 200)
+    assert stages[metrics.UNSCOPED]["rows_in"] == 5
+
+
+def test_bound_wrapper_is_reentrant_across_threads():
+    # cùng 1 wrapper gọi song song, fn tự mở stage con (set contextvar) → mỗi lần gọi dùng context riêng
+    def fn(i):
+        with metrics.stage(f"inner{i % 2}"):
+            metrics.add_quota(1)
+        return metrics.current_stage()
+
+    with metrics.stage("outer"):
+        work = metrics.bind(fn)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(work, range(50)))
+
+    assert set(results) == {"outer"}
+    stages = _stages()
+    assert stages["inner0"]["quota_units"] + stages["inner1"]["quota_units"] == 50
+
+
+def test_stage_marks_failure_and_restores_context():
+    try:
+        with metrics.stage("boom"):
+            raise ValueError("x")
+    except ValueError:
+        pass
+    assert _stages()["boom"]["status"] == "failed"
+    assert metrics.current_stage() == metrics.UNSCOPED
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+import gcp_io
+import lang_detect
+from conftest import load_stage
+
+synthetic = load_stage("benchmarks/synthetic.py", "synthetic")
+video = load_stage("1_crawl_video/3_preprocessing_video.py", "preprocessing_video")
+channel = load_stage("2_crawl_channel/2_preprocessing.py", "preprocessing_channel")
+
+
+@pytest.fixture(autouse=True)
+def _detector():
+    # không cache SQLite, detect ngay trong process
+    lang_detect.set_detector(lang_detect.LanguageDetector(cache_path=None, workers=1))
+
+
+def _assert_superset_schema(empty: pd.DataFrame, full: pd.DataFrame) -> None:
+    # frame rỗng có mọi cột khai báo; frame có dữ liệu bỏ path tuỳ chọn không record nào có
+    assert empty.empty and not full.empty
+    assert [c for c in empty.columns if c in full.columns] == full.columns.tolist()
+
+
+def test_video_preprocess_empty_has_full_schema():
+    empty = video.preprocess(pd.DataFrame([]))
+    _assert_superset_schema(empty, video.preprocess(synthetic.make_video_items(20, seed=1)))
+    assert {"regionRestriction.blocked", "duration_minutes", "categoryName", "crawl_date"} <= set(empty.columns)
+
+
+def test_clean_channels_empty_has_full_schema():
+    empty = channel.clean_channels(pd.DataFrame([]))
+    _assert_superset_schema(empty, channel.clean_channels(synthetic.make_channel_items(20, seed=1)))
+    assert "crawl_date" in empty.columns
+
+
+@pytest.mark.parametrize("module, prefix_attr", [(video, "detailed_video_info"), (channel, "channel_raw_info")])
+def test_chunked_run_without_rows_empties_staging(cfg, module, prefix_attr):
+    # staging còn dữ liệu của lần chạy trước; file raw mới nhất không có dòng nào
+    target = module.staging_target(cfg)
+    gcp_io.write_df_to_bq(pd.DataFrame({"id": ["old"]}), target, write_mode="overwrite")
+    prefix = getattr(cfg, prefix_attr)
+    gcp_io.upload_ndjson_to_gcs(cfg.bucket_name, f"{prefix}empty.ndjson.gz", [], manifest_prefix=prefix)
+
+    assert module.preprocess_chunked(cfg, batch_size=10) == (0, 0)
+    assert gcp_io.get_bq_client(cfg.project_id).num_rows(target.fqtn) == 0
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import pytest
+
+import quota
+
+
+def test_split_units_even_and_step():
+    assert quota.split_units(1000, ["a", "b"], step=100) == {"a": 500, "b": 500}
+    # 7 trang search (700 units) chia 3 keyword: phần dư theo largest remainder
+    assert quota.split_units(700, ["a", "b", "c"], step=100) == {"a": 300, "b": 200, "c": 200}
+
+
+def test_split_units_weights_and_remainder():
+    alloc = quota.split_units(10, ["a", "b"], weights={"a": 3, "b": 1})
+    assert alloc == {"a": 8, "b": 2}
+    assert sum(quota.split_units(999, ["a", "b", "c"], step=100).values()) == 900
+
+
+@pytest.mark.parametrize("total", [0, -5])
+def test_split_units_nothing_to_split(total):
+    assert quota.split_units(total, ["a", "b"]) == {"a": 0, "b": 0}
+    assert quota.split_units(100, []) == {}
+
+
+def test_split_units_zero_weights_fall_back_to_even():
+    assert quota.split_units(4, ["a", "b"], weights={"a": 0, "b": 0}) == {"a": 2, "b": 2}
+
+
+def test_budget_stage_allowance_and_charge():
+    budget = quota.QuotaBudget(daily_units=1000, state_path=None)
+    assert budget.remaining("search") == 800
+    assert budget.split_pages("search", "search.list", ["k1", "k2"]) == {"k1": 4, "k2": 4}
+    budget.charge("search", "search.list", calls=8)
+    assert not budget.can_afford("search", "search.list")
+    assert budget.can_afford("channels", "channels.list")
+
+
+def test_budget_save_merges_concurrent_processes(tmp_path):
+    path = tmp_path / "quota_state.json"
+    a = quota.QuotaBudget(state_path=path)
+    b = quota.QuotaBudget(state_path=path)
+    a.charge("search", "search.list", calls=2)
+    b.charge("channels", "channels.list", calls=5)
+    a.save()
+    b.save()
+    a.charge("search", "search.list")
+    a.save()
+
+    reloaded = quota.QuotaBudget(state_path=path)
+    assert reloaded.spent == {"search": 300, "channels": 5}
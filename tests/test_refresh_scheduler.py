@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import refresh_scheduler as rs
+from refresh_scheduler import DAY, HOUR, VideoRefreshState
+
+NOW = 1_700_000_000.0
+
+
+def _scheduler(**videos: VideoRefreshState) -> rs.RefreshScheduler:
+    sched = rs.RefreshScheduler(state_path=None)
+    sched.videos.update(videos)
+    return sched
+
+
+def test_new_candidates_first_then_most_overdue():
+    sched = _scheduler(
+        # 2 ngày tuổi → refresh mỗi 6h; quá hạn 2x
+        young=VideoRefreshState(published_at=NOW - 2 * DAY, last_refresh=NOW - 12 * HOUR, last_views=100),
+        # 100 ngày tuổi → 7 ngày; quá hạn ~1.4x
+        old=VideoRefreshState(published_at=NOW - 100 * DAY, last_refresh=NOW - 10 * DAY, last_views=100),
+        # vừa refresh → chưa đến hạn
+        fresh=VideoRefreshState(published_at=NOW - 2 * DAY, last_refresh=NOW - HOUR, last_views=100),
+    )
+    assert sched.due_ids(["new", "young"], now=NOW) == ["new", "young", "old"]
+
+
+def test_due_ids_respects_max_calls():
+    sched = _scheduler()
+    ids = [f"v{i}" for i in range(120)]
+    assert sched.due_ids(ids, max_calls=2, batch_size=50, now=NOW) == ids[:100]
+    assert sched.due_ids(ids, max_calls=0, now=NOW) == []
+
+
+def test_high_velocity_shortens_interval():
+    slow = VideoRefreshState(published_at=NOW - 100 * DAY, last_refresh=NOW, last_views=0, velocity=0.0)
+    fast = VideoRefreshState(published_at=NOW - 100 * DAY, last_refresh=NOW, last_views=0, velocity=10_000.0)
+    assert rs.RefreshScheduler.refresh_interval(fast, NOW) < rs.RefreshScheduler.refresh_interval(slow, NOW)
+    assert rs.RefreshScheduler.refresh_interval(fast, NOW) >= rs.MIN_INTERVAL
+
+
+def test_record_then_not_due_and_state_roundtrip(tmp_path):
+    path = tmp_path / "refresh_state.json"
+    sched = rs.RefreshScheduler(state_path=path)
+    item = {"id": "v1", "statistics": {"viewCount": "500"}, "snippet": {"publishedAt": "2023-11-14T00:00:00Z"}}
+    assert sched.record([item, {"statistics": {}}], now=NOW) == 1
+    assert sched.due_ids(now=NOW) == []
+    sched.save()
+
+    reloaded = rs.RefreshScheduler(state_path=path)
+    assert reloaded.videos["v1"].last_views == 500
+    assert reloaded.due_ids(now=NOW + 400 * DAY) == ["v1"]
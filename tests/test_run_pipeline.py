@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import threading
+
+import pandas as pd
+import pytest
+
+import run_pipeline as rp
+from run_pipeline import PipelineContext, Stage
+
+
+def _recorder(order, lock, name, result=None, fail=False):
+    def run(ctx):
+        with lock:
+            order.append(name)
+        if fail:
+            raise RuntimeError(f"{name} failed")
+        return result if result is not None else name
+    return run
+
+
+def _run(cfg, stages):
+    ctx = PipelineContext(cfg, {s.name: s for s in stages})
+    status = rp.run_dag(ctx, stages)
+    assert ctx.drain() == []
+    return ctx, status
+
+
+def test_dag_runs_stages_after_their_deps(cfg):
+    order, lock = [], threading.Lock()
+    stages = [
+        Stage(s.name, _recorder(order, lock, s.name), s.deps)
+        for s in rp.STAGES
+    ]
+    ctx, status = _run(cfg, stages)
+
+    assert set(status.values()) == {"ok"}
+    assert sorted(order) == sorted(s.name for s in rp.STAGES)
+    for s in rp.STAGES:
+        for dep in s.deps:
+            assert order.index(dep) < order.index(s.name), (dep, s.name)
+    assert ctx.outputs["upsert_channel"] == "upsert_channel"
+
+
+def test_failed_stage_skips_dependents_only(cfg):
+    order, lock = [], threading.Lock()
+    stages = [
+        Stage("a", _recorder(order, lock, "a")),
+        Stage("b", _recorder(order, lock, "b", fail=True), ("a",)),
+        Stage("c", _recorder(order, lock, "c"), ("b",)),
+        Stage("d", _recorder(order, lock, "d"), ("c",)),
+        Stage("e", _recorder(order, lock, "e"), ("a",)),
+    ]
+    _, status = _run(cfg, stages)
+    assert status == {"a": "ok", "b": "failed", "c": "skipped", "d": "skipped", "e": "ok"}
+    assert "c" not in order and "d" not in order
+
+
+def test_deps_outside_selection_are_loaded(cfg):
+    loaded = Stage("details", _recorder([], threading.Lock(), "details"), load=lambda ctx: "from storage")
+    consumer = Stage("consumer", lambda ctx: ctx.output("details"), ("details",))
+    ctx = PipelineContext(cfg, {"details": loaded, "consumer": consumer})
+    assert rp.run_dag(ctx, [consumer]) == {"consumer": "ok"}
+    assert ctx.outputs["consumer"] == "from storage"
+    ctx.drain()
+
+
+def test_select_stages():
+    names = [s.name for s in rp.select_stages(rp.STAGES, only=["captions", "search"])]
+    assert names == ["search", "captions"]
+    assert "captions" not in [s.name for s in rp.select_stages(rp.STAGES, skip=["captions"])]
+    with pytest.raises(ValueError):
+        rp.select_stages(rp.STAGES, only=["nope"])
+
+
+def test_empty_upstream_skips_staging_and_merge(cfg, monkeypatch):
+    calls = []
+    monkeypatch.setattr(rp.video_prep, "load_to_staging", lambda *a, **k: calls.append("video staging"))
+    monkeypatch.setattr(rp.video_upsert, "upsert_videos", lambda *a, **k: calls.append("video merge"))
+    monkeypatch.setattr(rp.channel_crawl, "run_channel_crawl", lambda *a, **k: [])
+    monkeypatch.setattr(rp.channel_prep, "load_to_staging", lambda *a, **k: calls.append("channel staging"))
+    monkeypatch.setattr(rp.channel_upsert, "upsert_channels", lambda *a, **k: calls.append("channel merge"))
+
+    stages = [
+        Stage("details", lambda ctx: []),
+        Stage("preprocess_video", rp.run_preprocess_video, ("details",)),
+        Stage("upsert_video", rp.run_upsert_video, ("preprocess_video",)),
+        Stage("channel_crawl", rp.run_channel_crawl, ("preprocess_video",)),
+        Stage("channel_preprocess", rp.run_channel_preprocess, ("channel_crawl",)),
+        Stage("upsert_channel", rp.run_upsert_channel, ("channel_preprocess",)),
+    ]
+    ctx, status = _run(cfg, stages)
+
+    assert set(status.values()) == {"ok"}
+    assert calls == []
+    assert ctx.outputs["upsert_video"] is None and ctx.outputs["upsert_channel"] is None
+    assert isinstance(ctx.outputs["preprocess_video"], pd.DataFrame) and ctx.outputs["preprocess_video"].empty
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import seen_index
+from seen_index import SeenIndex
+
+
+def test_filter_new_keeps_order_and_drops_duplicates(tmp_path):
+    idx = SeenIndex(tmp_path / "seen.npy")
+    idx.add(["b", "a"])
+    assert idx.filter_new(["c", "a", "c", "", None, "d", "b"]) == ["c", "d"]
+    assert "a" in idx and "z" not in idx
+    assert len(idx) == 2
+
+
+def test_save_merges_pending_into_sorted_index(tmp_path):
+    path = tmp_path / "seen.npy"
+    idx = SeenIndex(path)
+    idx.add(["vid_b", "vid_a"])
+    idx.save()
+    idx.add(["vid_c", "vid_a", "a_much_longer_video_id"])   # ID dài hơn → dtype tự nới
+    idx.save()
+
+    reloaded = SeenIndex(path)
+    assert len(reloaded) == 4
+    assert reloaded.filter_new(["vid_a", "vid_c", "a_much_longer_video_id", "vid_d"]) == ["vid_d"]
+    assert list(reloaded._sorted) == sorted(reloaded._sorted)
+
+
+def test_empty_and_missing_index(tmp_path):
+    idx = SeenIndex(tmp_path / "missing" / "seen.npy")
+    assert idx.filter_new([]) == []
+    assert idx.filter_new(["x"]) == ["x"]
+    idx.save()                                   # không có gì mới → không ghi file
+    assert not (tmp_path / "missing" / "seen.npy").exists()
+    assert SeenIndex(path=None).filter_new(["x"]) == ["x"]
+
+
+def test_corrupt_file_starts_empty(tmp_path):
+    path = tmp_path / "seen.npy"
+    path.write_bytes(b"not numpy")
+    assert len(SeenIndex(path)) == 0
+
+
+def test_load_seen_index_uses_cfg_path(cfg):
+    assert str(seen_index.load_seen_index(cfg).path) == cfg.seen_index_file